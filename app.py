@@ -1,12 +1,15 @@
-import io
 from flask import Flask, request, render_template
 
 from diracdec import *
 from diracdec import parse, dirac_bigop_delta_trs as trs, juxt, wolU
+from diracdec.theory.trs import RewriteTrace, Budget
 import signal
 
 app = Flask(__name__)
 
+# the wall-clock time limit (in seconds) of normalizing each term
+normalize_timeout = 60.
+
 default_subst = '''{
         ket0 : KET('0');
         bra0 : BRA('0');
@@ -89,34 +92,31 @@ def calculate():
 
     assert termA_code is not None and termB_code is not None
 
-    # normalize term A
-    proofA_stream = io.StringIO()
+    def normalize_term(term_code):
+        # each term is normalized by its own fork of the TRS, which records its own trace
+        proof_trace = RewriteTrace()
+        term_trs = trs.fork()
 
-    termA = None
-    try:
-        termA = parse(termA_code).subst(sub_idempotent)
-        norm_termA = wolU(trs.normalize(juxt(trs.normalize(termA, verbose=True, stream=proofA_stream))))
-        norm_termA_text = str(norm_termA)
+        term = None
+        try:
+            term = parse(term_code).subst(sub_idempotent)
+            budget = Budget(timeout=normalize_timeout)
+            norm_term = wolU(term_trs.normalize(juxt(term_trs.normalize(term, trace=proof_trace, budget=budget)), budget=budget))
+            norm_term_text = str(norm_term)
+            if budget.exhausted:
+                norm_term = None
+                norm_term_text = f"Aborted ({budget.reason}): " + norm_term_text
 
-    except Exception as e:
-        norm_termA = None
-        norm_termA_text = "Error: " + str(e)
+        except Exception as e:
+            norm_term = None
+            norm_term_text = "Error: " + str(e)
 
+        return term, norm_term, norm_term_text, proof_trace
 
-    # normalize term B
-    proofB_stream = io.StringIO()
+    # normalize term A and term B (concurrently with the kernel pool)
+    (termA, norm_termA, norm_termA_text, proofA_trace), (termB, norm_termB, norm_termB_text, proofB_trace) = \
+        wolfram_backend.concurrent_map(normalize_term, (termA_code, termB_code))
 
-    termB = None
-    try:
-        termB = parse(termB_code).subst(sub_idempotent)
-        norm_termB = wolU(trs.normalize(juxt(trs.normalize(termB, verbose=True, stream=proofB_stream))))
-        norm_termB_text = str(norm_termB)
-    
-    except Exception as e:
-        norm_termB = None
-        norm_termB_text = "Error: " + str(e)
-
-    
     if norm_termA is not None and norm_termB is not None:
         if norm_termA == norm_termB:
             compare_result = "CHECKED"
@@ -125,9 +125,6 @@ def calculate():
     else:
         compare_result = "TO BE CHECKED"
 
-    proofA_stream.seek(0)
-    proofB_stream.seek(0)    
-
     # Return the result to the template
     return render_template('index.html',
                            subst = subst_code,
@@ -138,9 +135,16 @@ def calculate():
                            termBstr = "Error" if termB is None else str(termB),
                            normA=norm_termA_text,
                            normB=norm_termB_text,
-                           proofA = proofA_stream.read(),
-                           proofB = proofB_stream.read(),
+                           proofA = proofA_trace.render(),
+                           proofB = proofB_trace.render(),
                            eqres = compare_result)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    from diracdec.factory import backend
+
+    if backend == "wolfram":
+        # the requests are evaluated concurrently on a pool of kernels
+        with wolfram_backend.kernel_pool():
+            app.run(debug=True, use_reloader=False)
+    else:
+        app.run(debug=True)
\ No newline at end of file
@@ -31,6 +31,7 @@ try:
 
     # out-of-box interface
     from .factory import normalize, eq_check
+    from .persistent_cache import PersistentCache
 
     # ast
     import ast
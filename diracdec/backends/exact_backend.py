@@ -0,0 +1,414 @@
+'''
+Exact arithmetic in pure Python for the numeric literals.
+
+The numbers are the elements of the field Q(i, √2, √3, ...), i.e. the Gaussian rationals extended with the square roots
+of the integers. They cover the literals `0`, `1`, `-1`, `I`, `Sqrt[1/2]` and their sums and products, so that most
+of the scalar arithmetic does not need the Wolfram Engine.
+'''
+
+from __future__ import annotations
+
+from fractions import Fraction
+from math import gcd, isqrt
+import re
+
+# the radicands above this bound are not factorized, and such literals are left to the symbolic backend
+MAX_RADICAND = 10 ** 12
+
+# the powers whose results can exceed this number of bits are not expanded, and such literals are left to the symbolic backend
+MAX_POWER_BITS = 2 ** 16
+
+
+def squarefree_split(n: int) -> tuple[int, int] | None:
+    '''
+    Write the positive integer n as k^2 * r with r squarefree, and return (k, r).
+    Return None if n exceeds MAX_RADICAND.
+    '''
+    if n > MAX_RADICAND:
+        return None
+    k, r = 1, 1
+    p = 2
+    while p * p <= n:
+        while n % (p * p) == 0:
+            n //= p * p
+            k *= p
+        if n % p == 0:
+            n //= p
+            r *= p
+        p += 1
+    return k, r * n
+
+
+def prime_factors(n: int) -> list[int]:
+    '''
+    The prime factors of the squarefree positive integer n.
+    '''
+    res = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            res.append(p)
+            n //= p
+        p += 1
+    if n > 1:
+        res.append(n)
+    return res
+
+
+class ExactNumber:
+    '''
+    The exact number Σ (a_r + b_r i) √r, with r ranging over distinct squarefree positive integers and a_r, b_r rational.
+
+    The representation is canonical: the terms are sorted by r and the zero coefficients are dropped, so that equal
+    numbers have equal representations.
+    '''
+
+    __slots__ = ('terms', '_hash')
+
+    def __init__(self, value: int | Fraction | ExactNumber | tuple = 0):
+        '''
+        value can be a rational number, or the (already canonical) tuple of terms (r, re, im).
+        '''
+        if isinstance(value, ExactNumber):
+            self.terms = value.terms
+        elif isinstance(value, tuple):
+            self.terms = value
+        elif value == 0:
+            self.terms = ()
+        else:
+            self.terms = ((1, Fraction(value), Fraction(0)),)
+        self._hash = None
+
+    @staticmethod
+    def from_terms(terms: dict[int, tuple[Fraction, Fraction]]) -> ExactNumber:
+        return ExactNumber(tuple((r, re, im) for r, (re, im) in sorted(terms.items()) if re != 0 or im != 0))
+
+    @staticmethod
+    def complex(re: int | Fraction, im: int | Fraction) -> ExactNumber:
+        return ExactNumber.from_terms({1: (Fraction(re), Fraction(im))})
+
+    @staticmethod
+    def sqrt(q: int | Fraction) -> ExactNumber | None:
+        '''
+        The principal square root of the rational number q. Return None if the radicand is too large.
+        '''
+        q = Fraction(q)
+        if q == 0:
+            return ExactNumber()
+        # √(a/b) = √(ab) / b
+        split = squarefree_split(abs(q.numerator * q.denominator))
+        if split is None:
+            return None
+        k, r = split
+        coef = Fraction(k, q.denominator)
+        if q > 0:
+            return ExactNumber.from_terms({r: (coef, Fraction(0))})
+        else:
+            return ExactNumber.from_terms({r: (Fraction(0), coef)})
+
+    I : ExactNumber
+
+    ################################
+    # queries
+
+    def is_zero(self) -> bool:
+        return len(self.terms) == 0
+
+    def rational(self) -> Fraction | None:
+        '''
+        Return the value as a rational number, or None if it is not rational.
+        '''
+        if len(self.terms) == 0:
+            return Fraction(0)
+        if len(self.terms) == 1:
+            r, re, im = self.terms[0]
+            if r == 1 and im == 0:
+                return re
+        return None
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (int, Fraction)):
+            other = ExactNumber(other)
+        return isinstance(other, ExactNumber) and self.terms == other.terms
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(('ExactNumber', self.terms))
+        return self._hash
+
+    def __getstate__(self) -> tuple:
+        return self.terms
+
+    def __setstate__(self, state: tuple) -> None:
+        self.terms = state
+        self._hash = None
+
+    ################################
+    # arithmetic
+
+    def __add__(self, other: ExactNumber) -> ExactNumber:
+        terms = {r: (re, im) for r, re, im in self.terms}
+        for r, re, im in other.terms:
+            re0, im0 = terms.get(r, (0, 0))
+            terms[r] = (re0 + re, im0 + im)
+        return ExactNumber.from_terms(terms)
+
+    def __neg__(self) -> ExactNumber:
+        return ExactNumber(tuple((r, -re, -im) for r, re, im in self.terms))
+
+    def __sub__(self, other: ExactNumber) -> ExactNumber:
+        return self + (-other)
+
+    def __mul__(self, other: ExactNumber) -> ExactNumber:
+        terms : dict[int, tuple[Fraction, Fraction]] = {}
+        for r1, re1, im1 in self.terms:
+            for r2, re2, im2 in other.terms:
+                # √r1 √r2 = g √(r1 r2 / g^2) for squarefree r1 and r2
+                g = gcd(r1, r2)
+                r = (r1 // g) * (r2 // g)
+                re = (re1 * re2 - im1 * im2) * g
+                im = (re1 * im2 + im1 * re2) * g
+                re0, im0 = terms.get(r, (0, 0))
+                terms[r] = (re0 + re, im0 + im)
+        return ExactNumber.from_terms(terms)
+
+    def conjugate(self) -> ExactNumber:
+        '''
+        The complex conjugate. The square roots are real, so only the coefficients are conjugated.
+        '''
+        return ExactNumber(tuple((r, re, -im) for r, re, im in self.terms))
+
+    def _negate_prime(self, p: int) -> ExactNumber:
+        '''
+        The field automorphism √p -> -√p.
+        '''
+        return ExactNumber(tuple((r, -re, -im) if r % p == 0 else (r, re, im) for r, re, im in self.terms))
+
+    def inverse(self) -> ExactNumber:
+        '''
+        The multiplicative inverse. Raise ZeroDivisionError for zero.
+
+        Multiplying x by its image under √p -> -√p eliminates the prime p from the radicands. After all the primes
+        are eliminated, a Gaussian rational remains, which is inverted directly.
+        '''
+        if self.is_zero():
+            raise ZeroDivisionError("inverse of the exact number zero")
+
+        primes = sorted({p for r, _, _ in self.terms for p in prime_factors(r)})
+        num = ExactNumber.complex(1, 0)
+        den = self
+        for p in primes:
+            factor = den._negate_prime(p)
+            num = num * factor
+            den = den * factor
+
+        _, re, im = den.terms[0]
+        norm = re * re + im * im
+        return num * ExactNumber.complex(re / norm, -im / norm)
+
+    def __truediv__(self, other: ExactNumber) -> ExactNumber:
+        return self * other.inverse()
+
+    def __pow__(self, n: int) -> ExactNumber:
+        if n < 0:
+            return self.inverse() ** (-n)
+        res = ExactNumber.complex(1, 0)
+        base = self
+        while n > 0:
+            if n & 1:
+                res = res * base
+            base = base * base
+            n >>= 1
+        return res
+
+    ################################
+    # printing and parsing
+
+    def __str__(self) -> str:
+        '''
+        The Wolfram Language input form, which can be parsed back by `ExactNumber.parse`.
+        '''
+        if len(self.terms) == 0:
+            return "0"
+        items = []
+        for r, re, im in self.terms:
+            if im == 0:
+                coef = str(re)
+            elif re == 0:
+                coef = "I" if im == 1 else "-I" if im == -1 else f"{im}*I"
+            else:
+                coef = f"({re} + {im}*I)"
+            if r == 1:
+                items.append(coef)
+            elif coef == "1":
+                items.append(f"Sqrt[{r}]")
+            elif coef == "-1":
+                items.append(f"-Sqrt[{r}]")
+            else:
+                items.append(f"{coef}*Sqrt[{r}]")
+        return " + ".join(items).replace("+ -", "- ")
+
+    def __repr__(self) -> str:
+        return f'ExactNumber({self})'
+
+    def tex(self) -> str:
+        def tex_rational(q: Fraction) -> str:
+            sign = "-" if q < 0 else ""
+            q = abs(q)
+            return f"{sign}{q.numerator}" if q.denominator == 1 else rf"{sign}\frac{{{q.numerator}}}{{{q.denominator}}}"
+
+        if len(self.terms) == 0:
+            return "0"
+        items = []
+        for r, re, im in self.terms:
+            if im == 0:
+                coef = tex_rational(re)
+            elif re == 0:
+                coef = "i" if im == 1 else "-i" if im == -1 else f"{tex_rational(im)} i"
+            else:
+                coef = rf"\left({tex_rational(re)} + {tex_rational(im)} i\right)"
+            if r == 1:
+                items.append(coef)
+            elif coef in ("1", "-1"):
+                items.append(coef[:-1] + rf"\sqrt{{{r}}}")
+            else:
+                items.append(rf"{coef} \sqrt{{{r}}}")
+        return " + ".join(items).replace("+ -", "- ")
+
+    def power(self, exponent: Fraction) -> ExactNumber | None:
+        '''
+        The power with the rational exponent. Return None if it is not in the field, if it is indeterminate (`0^0`) or
+        infinite, or if the result can exceed MAX_POWER_BITS.
+        '''
+        size = max((c.numerator.bit_length() + c.denominator.bit_length() for _, re, im in self.terms for c in (re, im)), default = 0)
+        if size * abs(exponent.numerator) > MAX_POWER_BITS:
+            return None
+        if self.is_zero() and exponent <= 0:
+            return None
+
+        if exponent.denominator == 1:
+            return self ** exponent.numerator
+        q = self.rational()
+        if exponent.denominator == 2 and q is not None:
+            root = ExactNumber.sqrt(q)
+            return None if root is None else root ** exponent.numerator
+        return None
+
+    @staticmethod
+    def parse(code: str) -> ExactNumber | None:
+        '''
+        Parse the Wolfram Language literal consisting of integers, `I`, `Sqrt[...]`, parentheses and the operators
+        `+ - * / ^`. Return None if the code contains anything else (symbols, floating point numbers, other functions),
+        or if the value is not in the field.
+        '''
+        try:
+            parser = _LiteralParser(code)
+            res = parser.expr()
+            if parser.peek() is not None:
+                return None
+            return res
+        except (_NotExact, ZeroDivisionError):
+            return None
+
+
+ExactNumber.I = ExactNumber.complex(0, 1)
+
+
+class _NotExact(Exception):
+    pass
+
+
+_TOKEN = re.compile(r'\s*(?:(\d+\.\d*|\.\d+)|(\d+)|([A-Za-z$][A-Za-z0-9$]*)|(.))')
+
+class _LiteralParser:
+    '''
+    The recursive descent parser for `ExactNumber.parse`.
+    '''
+    def __init__(self, code: str):
+        self.tokens : list[str] = []
+        for m in _TOKEN.finditer(code.strip()):
+            real, integer, name, op = m.groups()
+            if real is not None:
+                raise _NotExact()
+            self.tokens.append(integer or name or op)
+        self.pos = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, token: str | None = None) -> str:
+        tk = self.peek()
+        if tk is None or (token is not None and tk != token):
+            raise _NotExact()
+        self.pos += 1
+        return tk
+
+    def expr(self) -> ExactNumber:
+        res = self.term()
+        while self.peek() in ('+', '-'):
+            if self.take() == '+':
+                res = res + self.term()
+            else:
+                res = res - self.term()
+        return res
+
+    def term(self) -> ExactNumber:
+        res = self.unary()
+        while True:
+            tk = self.peek()
+            if tk == '*':
+                self.take()
+                res = res * self.unary()
+            elif tk == '/':
+                self.take()
+                res = res / self.unary()
+            # implicit multiplication
+            elif tk is not None and (tk == '(' or tk[0].isalnum()):
+                res = res * self.power()
+            else:
+                return res
+
+    def unary(self) -> ExactNumber:
+        tk = self.peek()
+        if tk == '-':
+            self.take()
+            return -self.unary()
+        if tk == '+':
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self) -> ExactNumber:
+        base = self.atom()
+        if self.peek() != '^':
+            return base
+        self.take()
+        exponent = self.unary().rational()
+        if exponent is None:
+            raise _NotExact()
+        res = base.power(exponent)
+        if res is None:
+            raise _NotExact()
+        return res
+
+    def atom(self) -> ExactNumber:
+        tk = self.take()
+        if tk.isdigit():
+            return ExactNumber(int(tk))
+        if tk == 'I':
+            return ExactNumber.I
+        if tk == '(':
+            res = self.expr()
+            self.take(')')
+            return res
+        if tk == 'Sqrt':
+            self.take('[')
+            q = self.expr().rational()
+            self.take(']')
+            if q is None:
+                raise _NotExact()
+            root = ExactNumber.sqrt(q)
+            if root is None:
+                raise _NotExact()
+            return root
+        raise _NotExact()
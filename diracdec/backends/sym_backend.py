@@ -0,0 +1,1047 @@
+'''
+Symbolic expressions in pure Python: the rational functions over the exact numbers of `exact_backend`.
+
+The expressions are kept in a normal form. A polynomial is a sum of monomials with nonzero coefficients, and an
+expression is a fraction num / den of the polynomials without common factors (see `poly_cancel`), where den has no
+monomial content and its leading coefficient is 1. The atoms of the monomials are the symbols and the applications
+of the uninterpreted functions (`Conjugate[x]`, `Sum[...]`, `Power[x, 1/2]`). The trigonometric functions are written
+by the exponentials, so that Cos[x]^2 + Sin[x]^2 == 1, and the powers of the radicals Power[x, 1/d] are reduced below d.
+The greatest common divisors treat the exponentials and the radicals as independent variables, so the normal form
+does not decide all the identities between them.
+
+The syntax of the expressions follows the Wolfram Language, so that the same inputs work for both backends.
+'''
+
+from __future__ import annotations
+
+from typing import Callable
+from fractions import Fraction
+import math
+import re
+
+from .exact_backend import ExactNumber, MAX_POWER_BITS
+
+
+# the symbols of the real constants, which are not variables
+CONSTANTS = frozenset(('Pi', 'E', 'Infinity'))
+
+# the maximal number of terms in the expansion of a power, above which the power is kept unevaluated
+MAX_POWER_TERMS = 64
+
+# the functions commuting with the complex conjugation
+CONJ_FUNCTIONS = frozenset(('Exp',))
+
+# the functions binding the iterators of their lists, e.g. Sum[f, {i, 1, n}]
+BINDERS = frozenset(('Sum', 'Product'))
+
+# cos(π/12) + i sin(π/12), whose powers give the trigonometric values at the multiples of π/12
+ZETA24 = ExactNumber.parse("(Sqrt[6] + Sqrt[2])/4 + I (Sqrt[6] - Sqrt[2])/4")
+
+
+class Atom:
+    '''
+    A symbol (args is None), or the application of an uninterpreted function.
+    The arguments are expressions, or tuples of arguments for the lists.
+    root is d for the radicals Power[x, 1/d], otherwise None.
+    '''
+
+    __slots__ = ('head', 'args', 'key', 'root', '_hash')
+
+    def __init__(self, head: str, args: tuple | None = None):
+        self.head = head
+        self.args = args
+        self.key = head if args is None else f"{head}[{', '.join(map(arg_str, args))}]"
+        self.root = None
+        if head == 'Power' and args is not None and len(args) == 2 and isinstance(args[1], Expr):
+            q = args[1].constant_value()
+            q = None if q is None else q.rational()
+            if q is not None and q.numerator == 1 and q.denominator > 1:
+                self.root = q.denominator
+        self._hash = hash(self.key)
+
+    def is_symbol(self) -> bool:
+        return self.args is None
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Atom) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __str__(self) -> str:
+        return self.key
+
+    def __repr__(self) -> str:
+        return f'Atom({self.key})'
+
+    def __getstate__(self) -> tuple:
+        return (self.head, self.args)
+
+    def __setstate__(self, state: tuple) -> None:
+        self.__init__(*state)
+
+    def tex(self) -> str:
+        if self.args is None:
+            if self.head == 'Pi':
+                return r"\pi"
+            if self.head == 'E':
+                return "e"
+            if self.head == 'Infinity':
+                return r"\infty"
+            return self.head if len(self.head) == 1 else rf"\text{{{self.head}}}"
+
+        if self.head == 'Exp':
+            return rf"e^{{{self.args[0].tex()}}}"
+        if self.head == 'Conjugate':
+            return rf"\left ({self.args[0].tex()} \right )^*"
+        if self.head == 'HoldForm':
+            return self.args[0].tex()
+        if self.head == 'Power' and self.args[1] == Expr.number(Fraction(1, 2)):
+            return rf"\sqrt{{{self.args[0].tex()}}}"
+        if self.head == 'Power':
+            return rf"\left ({self.args[0].tex()} \right )^{{{self.args[1].tex()}}}"
+        name = rf"\{self.head.lower()}" if self.head in ('Cos', 'Sin') else rf"\text{{{self.head}}}"
+        return name + r" \left (" + ", ".join(map(arg_tex, self.args)) + r" \right )"
+
+
+def arg_str(arg: Expr | tuple) -> str:
+    if isinstance(arg, tuple):
+        return "{" + ", ".join(map(arg_str, arg)) + "}"
+    return str(arg)
+
+def arg_tex(arg: Expr | tuple) -> str:
+    if isinstance(arg, tuple):
+        return r"\{" + ", ".join(map(arg_tex, arg)) + r"\}"
+    return arg.tex()
+
+def arg_variables(arg: Expr | tuple, held: bool = False) -> frozenset[str]:
+    if isinstance(arg, tuple):
+        return frozenset().union(*(arg_variables(a, held) for a in arg))
+    return arg.variables(held)
+
+def atom_variables(atom: Atom, held: bool = False) -> frozenset[str]:
+    '''
+    The free symbols of the atom. The iterators of the binders are bound, except in the held expressions, where the
+    symbols are collected syntactically (as Wolfram does for the unevaluated `HoldForm[Sum[...]]`).
+    '''
+    if atom.args is None:
+        return frozenset() if atom.head in CONSTANTS else frozenset((atom.head,))
+    held = held or atom.head == 'HoldForm'
+    spec = binder_spec(atom)
+    if spec is None or held:
+        return arg_variables(atom.args, held)
+    it, lo, hi = spec
+    return (atom.args[0].variables() - {it}) | lo.variables() | hi.variables()
+
+def arg_map(arg: Expr | tuple, f: Callable[[Expr], Expr]) -> Expr | tuple:
+    if isinstance(arg, tuple):
+        return tuple(arg_map(a, f) for a in arg)
+    return f(arg)
+
+
+################################################################
+# monomials: the tuples of (atom, exponent) sorted by the atoms
+
+Monomial = tuple
+
+def mono_canonical(exps: dict[Atom, int]) -> tuple[ExactNumber, Monomial]:
+    '''
+    Build the monomial from the exponents. The exponentials are merged, Exp[a]^k Exp[b] -> Exp[k a + b],
+    which can produce a numeric factor (see `exp_split`).
+    '''
+    coef = ExactNumber(1)
+    exps = {atom: e for atom, e in exps.items() if e != 0}
+    exp_atoms = [atom for atom in exps if atom.head == 'Exp' and atom.args is not None]
+    if len(exp_atoms) > 1 or (len(exp_atoms) == 1 and exps[exp_atoms[0]] != 1):
+        arg = Expr.number(0)
+        for atom in exp_atoms:
+            arg = arg + atom.args[0] * Expr.number(exps.pop(atom))
+        coef, atom = exp_split(arg)
+        if atom is not None:
+            exps[atom] = 1
+    return coef, tuple(sorted(exps.items(), key = lambda item: item[0].key))
+
+def mono_mul(m1: Monomial, m2: Monomial) -> tuple[ExactNumber, Monomial]:
+    exps = dict(m1)
+    for atom, e in m2:
+        exps[atom] = exps.get(atom, 0) + e
+    return mono_canonical(exps)
+
+def mono_pow(m: Monomial, n: int) -> tuple[ExactNumber, Monomial]:
+    return mono_canonical({atom: e * n for atom, e in m})
+
+def mono_str(m: Monomial) -> str:
+    return "*".join(str(atom) if e == 1 else f"{atom}^{e}" if e > 0 else f"{atom}^({e})" for atom, e in m)
+
+def mono_tex(m: Monomial) -> str:
+    return " ".join(atom.tex() if e == 1 else rf"{{{atom.tex()}}}^{{{e}}}" for atom, e in m)
+
+
+def exact_tex(x: ExactNumber) -> str:
+    items = []
+    for r, re_part, im_part in x.terms:
+        parts = []
+        if re_part != 0:
+            parts.append(fraction_tex(re_part))
+        if im_part != 0:
+            parts.append("i" if im_part == 1 else "-i" if im_part == -1 else fraction_tex(im_part) + " i")
+        coef = " + ".join(parts)
+        if r == 1:
+            items.append(coef)
+        elif len(parts) > 1:
+            items.append(rf"\left ({coef} \right ) \sqrt{{{r}}}")
+        else:
+            items.append(("" if coef == "1" else "-" if coef == "-1" else coef + " ") + rf"\sqrt{{{r}}}")
+    return " + ".join(items).replace("+ -", "- ") if items else "0"
+
+def fraction_tex(q: Fraction) -> str:
+    if q.denominator == 1:
+        return str(q.numerator)
+    sign = "-" if q < 0 else ""
+    return rf"{sign}\frac{{{abs(q.numerator)}}}{{{q.denominator}}}"
+
+
+class Poly:
+    '''
+    The polynomial (with integer exponents) as the tuple of (monomial, coefficient), sorted by the monomials.
+    '''
+
+    __slots__ = ('terms', 'key', '_hash')
+
+    def __init__(self, terms: dict[Monomial, ExactNumber]):
+        self.terms : tuple[tuple[Monomial, ExactNumber], ...] = tuple(sorted(
+            ((m, c) for m, c in terms.items() if not c.is_zero()),
+            key = lambda item: tuple((atom.key, e) for atom, e in item[0])))
+        self.key = self._str()
+        self._hash = hash(self.key)
+
+    @staticmethod
+    def constant(c: ExactNumber) -> Poly:
+        return Poly({(): c})
+
+    @staticmethod
+    def monomial(c: ExactNumber, m: Monomial) -> Poly:
+        return Poly({m: c})
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Poly) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __getstate__(self) -> tuple:
+        return self.terms
+
+    def __setstate__(self, state: tuple) -> None:
+        self.__init__(dict(state))
+
+    def is_zero(self) -> bool:
+        return len(self.terms) == 0
+
+    def constant_value(self) -> ExactNumber | None:
+        if len(self.terms) == 0:
+            return ExactNumber()
+        if len(self.terms) == 1 and self.terms[0][0] == ():
+            return self.terms[0][1]
+        return None
+
+    def __add__(self, other: Poly) -> Poly:
+        terms = dict(self.terms)
+        for m, c in other.terms:
+            terms[m] = terms[m] + c if m in terms else c
+        return Poly(terms)
+
+    def __neg__(self) -> Poly:
+        return Poly({m: -c for m, c in self.terms})
+
+    def __mul__(self, other: Poly) -> Poly:
+        terms : dict[Monomial, ExactNumber] = {}
+        for m1, c1 in self.terms:
+            for m2, c2 in other.terms:
+                coef, m = mono_mul(m1, m2)
+                c = c1 * c2 * coef
+                terms[m] = terms[m] + c if m in terms else c
+        return Poly(terms)
+
+    def __pow__(self, n: int) -> Poly:
+        res = Poly.constant(ExactNumber(1))
+        for _ in range(n):
+            res = res * self
+        return res
+
+    def atoms(self) -> set[Atom]:
+        return {atom for m, _ in self.terms for atom, _ in m}
+
+    def _str(self) -> str:
+        if len(self.terms) == 0:
+            return "0"
+        items = []
+        for m, c in self.terms:
+            if m == ():
+                items.append(str(c))
+                continue
+            coef = str(c)
+            if len(c.terms) > 1:
+                coef = f"({coef})"
+            if coef == "1":
+                items.append(mono_str(m))
+            elif coef == "-1":
+                items.append("-" + mono_str(m))
+            else:
+                items.append(coef + "*" + mono_str(m))
+        return " + ".join(items).replace("+ -", "- ")
+
+    def __str__(self) -> str:
+        return self.key
+
+    def tex(self) -> str:
+        if len(self.terms) == 0:
+            return "0"
+        items = []
+        for m, c in self.terms:
+            coef = exact_tex(c)
+            if m == ():
+                items.append(coef)
+            elif coef == "1":
+                items.append(mono_tex(m))
+            elif coef == "-1":
+                items.append("-" + mono_tex(m))
+            elif len(c.terms) > 1:
+                items.append(rf"\left ({coef} \right ) {mono_tex(m)}")
+            else:
+                items.append(f"{coef} {mono_tex(m)}")
+        return " + ".join(items).replace("+ -", "- ")
+
+
+def split_factor(p: Poly) -> tuple[ExactNumber, Monomial, Poly]:
+    '''
+    Write the nonzero polynomial p as c * m * f, where m is the monomial content of p and the leading coefficient of f is 1.
+    '''
+    atoms = p.atoms()
+    content = {}
+    for atom in atoms:
+        e = min(dict(m).get(atom, 0) for m, _ in p.terms)
+        if e != 0:
+            content[atom] = e
+    _, m = mono_canonical(content)
+    coef, inv_m = mono_pow(m, -1)
+    f = p * Poly.monomial(coef, inv_m)
+    c = f.terms[0][1]
+    f = f * Poly.constant(c.inverse())
+    return c, m, f
+
+################################################################
+# the greatest common divisors, on the sparse polynomials: the dicts from the exponent vectors to the coefficients
+
+Sparse = dict
+
+def to_sparse(p: Poly, atoms: list[Atom], shift: dict[Atom, int]) -> Sparse:
+    res = {}
+    for m, c in p.terms:
+        exps = dict(m)
+        res[tuple(exps.get(atom, 0) + shift.get(atom, 0) for atom in atoms)] = c
+    return res
+
+def from_sparse(p: Sparse, atoms: list[Atom], shift: dict[Atom, int]) -> Poly:
+    terms : dict[Monomial, ExactNumber] = {}
+    for vec, c in p.items():
+        coef, m = mono_canonical({atom: e - shift.get(atom, 0) for atom, e in zip(atoms, vec)})
+        terms[m] = terms[m] + c * coef if m in terms else c * coef
+    return Poly(terms)
+
+def sp_mul(p: Sparse, q: Sparse) -> Sparse:
+    res = {}
+    for v1, c1 in p.items():
+        for v2, c2 in q.items():
+            v = tuple(a + b for a, b in zip(v1, v2))
+            res[v] = res[v] + c1 * c2 if v in res else c1 * c2
+    return {v: c for v, c in res.items() if not c.is_zero()}
+
+def sp_sub(p: Sparse, q: Sparse) -> Sparse:
+    res = dict(p)
+    for v, c in q.items():
+        res[v] = res[v] - c if v in res else -c
+    return {v: c for v, c in res.items() if not c.is_zero()}
+
+def sp_monic(p: Sparse) -> Sparse:
+    '''
+    Scale p so that the leading coefficient (in the lexicographic order) is 1.
+    '''
+    inv = p[max(p)].inverse()
+    return {v: c * inv for v, c in p.items()}
+
+def sp_is_constant(p: Sparse) -> bool:
+    return len(p) == 1 and not any(next(iter(p)))
+
+def sp_degree(p: Sparse, k: int) -> int:
+    return max(v[k] for v in p)
+
+def sp_coeffs(p: Sparse, k: int) -> dict[int, Sparse]:
+    '''
+    The coefficients of p as a polynomial in the variable k.
+    '''
+    res : dict[int, Sparse] = {}
+    for v, c in p.items():
+        res.setdefault(v[k], {})[v[:k] + (0,) + v[k + 1:]] = c
+    return res
+
+def sp_divide(p: Sparse, d: Sparse) -> Sparse | None:
+    '''
+    Return q with p == q * d, or None if d does not divide p. The division runs in the lexicographic order.
+    '''
+    d_lead = max(d)
+    d_coef = d[d_lead]
+    rem = dict(p)
+    quot = {}
+    while rem:
+        lead = max(rem)
+        diff = tuple(a - b for a, b in zip(lead, d_lead))
+        if any(e < 0 for e in diff):
+            return None
+        c = rem[lead] / d_coef
+        quot[diff] = c
+        for vec, dc in d.items():
+            key = tuple(a + b for a, b in zip(vec, diff))
+            v = rem.get(key, ExactNumber()) - c * dc
+            if v.is_zero():
+                rem.pop(key, None)
+            else:
+                rem[key] = v
+    return quot
+
+def sp_prem(p: Sparse, q: Sparse, k: int) -> Sparse:
+    '''
+    The pseudo-remainder of p by q as the polynomials in the variable k.
+    '''
+    dq = sp_degree(q, k)
+    lq = sp_coeffs(q, k)[dq]
+    while p and sp_degree(p, k) >= dq:
+        dp = sp_degree(p, k)
+        lp = {v[:k] + (dp - dq,) + v[k + 1:]: c for v, c in sp_coeffs(p, k)[dp].items()}
+        p = sp_sub(sp_mul(lq, p), sp_mul(lp, q))
+    return p
+
+def sp_content(p: Sparse, k: int) -> Sparse:
+    '''
+    The gcd of the coefficients of p as a polynomial in the variable k.
+    '''
+    res = None
+    for c in sp_coeffs(p, k).values():
+        res = sp_monic(c) if res is None else sp_gcd(res, c, k + 1)
+        if sp_is_constant(res):
+            break
+    return res
+
+def sp_primitive(p: Sparse, k: int) -> Sparse:
+    return sp_monic(sp_divide(p, sp_content(p, k)))
+
+def sp_gcd(p: Sparse, q: Sparse, k: int = 0) -> Sparse:
+    '''
+    The monic gcd of p and q, in the variables from k on, by the primitive polynomial remainder sequences.
+    '''
+    if not p:
+        return sp_monic(q)
+    if not q:
+        return sp_monic(p)
+    n = len(next(iter(p)))
+    if k == n:
+        return {(0,) * n: ExactNumber(1)}
+    if sp_degree(p, k) == 0 and sp_degree(q, k) == 0:
+        return sp_gcd(p, q, k + 1)
+
+    cp, cq = sp_content(p, k), sp_content(q, k)
+    p, q = sp_divide(p, cp), sp_divide(q, cq)
+    if sp_degree(p, k) < sp_degree(q, k):
+        p, q = q, p
+    while q:
+        r = sp_prem(p, q, k)
+        p, q = q, (sp_primitive(r, k) if r else r)
+    return sp_monic(sp_mul(sp_gcd(cp, cq, k + 1), sp_primitive(p, k)))
+
+def poly_cancel(num: Poly, den: Poly) -> tuple[Poly, Poly]:
+    '''
+    Divide num and den by their gcd. den is a normalized factor: its exponents are non-negative.
+    '''
+    atoms = sorted(num.atoms() | den.atoms(), key = lambda atom: atom.key)
+    shift = {atom: -min(0, min(dict(m).get(atom, 0) for m, _ in num.terms)) for atom in atoms}
+    p, q = to_sparse(num, atoms, shift), to_sparse(den, atoms, {})
+    g = sp_gcd(p, q)
+    if sp_is_constant(g):
+        return num, den
+    return from_sparse(sp_divide(p, g), atoms, shift), from_sparse(sp_divide(q, g), atoms, {})
+
+def has_unreduced_roots(p: Poly) -> bool:
+    return any(atom.root is not None and not 0 <= e < atom.root for m, _ in p.terms for atom, e in m)
+
+def reduce_roots(p: Poly) -> Expr:
+    '''
+    Evaluate p with the powers of the radicals reduced, Power[x, 1/d]^e -> x^(e // d) Power[x, 1/d]^(e % d).
+    '''
+    res = Expr.number(0)
+    for m, c in p.terms:
+        exps = {}
+        term = Expr.number(1)
+        for atom, e in m:
+            if atom.root is None:
+                exps[atom] = e
+            else:
+                exps[atom] = e % atom.root
+                term = term * (atom.args[0] ** (e // atom.root))
+        coef, m = mono_canonical(exps)
+        res = res + term * Expr(Poly.monomial(c * coef, m))
+    return res
+
+
+################################################################
+# expressions
+
+ONE = Poly.constant(ExactNumber(1))
+
+class Expr:
+    '''
+    The rational function num / den in the normal form (see the module).
+    '''
+
+    __slots__ = ('num', 'den', 'key', '_hash')
+
+    def __init__(self, num: Poly, den: Poly = ONE):
+        self.num = num
+        self.den = den
+        self.key = self._str()
+        self._hash = hash(self.key)
+
+    @staticmethod
+    def make(num: Poly, den: Poly = ONE) -> Expr:
+        '''
+        Normalize the fraction num / den.
+        '''
+        if den.is_zero():
+            raise ZeroDivisionError("division of the expression by zero")
+        if num.is_zero():
+            return Expr(num)
+
+        d = den.constant_value()
+        if d is None:
+            c, m, den = split_factor(den)
+            coef, m = mono_pow(m, -1)
+            num = num * Poly.monomial(c.inverse() * coef, m)
+        elif d != ExactNumber(1):
+            num = num * Poly.constant(d.inverse())
+            den = ONE
+
+        if has_unreduced_roots(num) or has_unreduced_roots(den):
+            return reduce_roots(num) / reduce_roots(den)
+        if den.constant_value() is not None:
+            return Expr(num)
+
+        num, den = poly_cancel(num, den)
+        c, m, den = split_factor(den)
+        coef, m = mono_pow(m, -1)
+        return Expr(num * Poly.monomial(c.inverse() * coef, m), den)
+
+    @staticmethod
+    def number(c: int | Fraction | complex | ExactNumber) -> Expr:
+        if isinstance(c, complex):
+            c = ExactNumber.complex(Fraction(repr(c.real)), Fraction(repr(c.imag)))
+        elif isinstance(c, float):
+            c = ExactNumber(Fraction(repr(c)))
+        elif not isinstance(c, ExactNumber):
+            c = ExactNumber(c)
+        return Expr(Poly.constant(c))
+
+    @staticmethod
+    def atom(atom: Atom) -> Expr:
+        return Expr(Poly.monomial(ExactNumber(1), ((atom, 1),)))
+
+    @staticmethod
+    def symbol(name: str) -> Expr:
+        return Expr.atom(Atom(name))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Expr) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __getstate__(self) -> tuple:
+        return (self.num, self.den)
+
+    def __setstate__(self, state: tuple) -> None:
+        self.__init__(*state)
+
+    ################################
+    # queries
+
+    def is_zero(self) -> bool:
+        return self.num.is_zero()
+
+    def is_polynomial(self) -> bool:
+        return self.den.constant_value() is not None
+
+    def constant_value(self) -> ExactNumber | None:
+        '''
+        The value if the expression is a number, otherwise None.
+        '''
+        return self.num.constant_value() if self.is_polynomial() else None
+
+    def single_atom(self) -> Atom | None:
+        '''
+        The atom if the expression is exactly one atom, otherwise None.
+        '''
+        if self.is_polynomial() and len(self.num.terms) == 1:
+            m, c = self.num.terms[0]
+            if c == ExactNumber(1) and len(m) == 1 and m[0][1] == 1:
+                return m[0][0]
+        return None
+
+    def atoms(self) -> set[Atom]:
+        return self.num.atoms() | self.den.atoms()
+
+    def variables(self, held: bool = False) -> frozenset[str]:
+        '''
+        The names of the free symbols, including the ones in the function arguments (see `atom_variables`).
+        '''
+        return frozenset().union(*(atom_variables(atom, held) for atom in self.atoms()))
+
+    ################################
+    # arithmetic
+
+    def __add__(self, other: Expr) -> Expr:
+        if self.is_polynomial() and other.is_polynomial():
+            return Expr(self.num + other.num)
+        if self.den == other.den:
+            return Expr.make(self.num + other.num, self.den)
+        return Expr.make(self.num * other.den + other.num * self.den, self.den * other.den)
+
+    def __neg__(self) -> Expr:
+        return Expr(-self.num, self.den)
+
+    def __sub__(self, other: Expr) -> Expr:
+        return self + (-other)
+
+    def __mul__(self, other: Expr) -> Expr:
+        if self.is_polynomial() and other.is_polynomial():
+            num = self.num * other.num
+            return Expr.make(num) if has_unreduced_roots(num) else Expr(num)
+        return Expr.make(self.num * other.num, self.den * other.den)
+
+    def inverse(self) -> Expr:
+        if self.is_zero():
+            raise ZeroDivisionError("division of the expression by zero")
+        return Expr.make(self.den, self.num)
+
+    def __truediv__(self, other: Expr) -> Expr:
+        return self * other.inverse()
+
+    def __pow__(self, n: int) -> Expr:
+        if n < 0:
+            return self.inverse() ** (-n)
+        res = Expr.number(1)
+        base = self
+        while n > 0:
+            if n & 1:
+                res = res * base
+            base = base * base
+            n >>= 1
+        return res
+
+    def map_atoms(self, f: Callable[[Atom], Expr], conj: bool = False) -> Expr:
+        '''
+        Replace the atoms by f(atom) and evaluate. If conj is True, the coefficients are conjugated.
+        '''
+        def eval_poly(p: Poly) -> Expr:
+            res = Expr.number(0)
+            for m, c in p.terms:
+                term = Expr.number(c.conjugate() if conj else c)
+                for atom, e in m:
+                    term = term * (f(atom) ** e)
+                res = res + term
+            return res
+
+        res = eval_poly(self.num)
+        return res if self.is_polynomial() else res / eval_poly(self.den)
+
+    def release(self) -> Expr:
+        '''
+        Evaluate the held binders (see `apply_function`).
+        '''
+        def release_atom(atom: Atom) -> Expr:
+            if atom.args is None:
+                return Expr.atom(atom)
+            return apply_function(atom.head, arg_map(atom.args, Expr.release))
+
+        return self.map_atoms(release_atom)
+
+    def conjugate(self) -> Expr:
+        return self.map_atoms(conj_atom, conj = True)
+
+    def subst(self, sigma: dict[str, Expr], held: bool = False) -> Expr:
+        '''
+        Substitute the free symbols simultaneously (also in the function arguments). The held expressions are
+        substituted syntactically.
+        '''
+        def subst_atom(atom: Atom) -> Expr:
+            if atom.args is None:
+                return sigma.get(atom.head, Expr.atom(atom))
+            spec = binder_spec(atom)
+            if spec is not None and not held:
+                it, lo, hi = spec
+                inner = {k: v for k, v in sigma.items() if k != it}
+                return apply_function(atom.head, (atom.args[0].subst(inner), (Expr.symbol(it), lo.subst(sigma), hi.subst(sigma))))
+            inner_held = held or atom.head == 'HoldForm'
+            return apply_function(atom.head, arg_map(atom.args, lambda a: a.subst(sigma, inner_held)), inner_held)
+
+        if sigma.keys().isdisjoint(self.variables(held)):
+            return self
+        return self.map_atoms(subst_atom)
+
+    ################################
+    # printing
+
+    def _str(self) -> str:
+        if self.is_polynomial():
+            return str(self.num)
+        num = str(self.num)
+        if len(self.num.terms) > 1:
+            num = f"({num})"
+        return f"{num}/({self.den})"
+
+    def __str__(self) -> str:
+        return self.key
+
+    def __repr__(self) -> str:
+        return f'Expr({self.key})'
+
+    def tex(self) -> str:
+        if self.is_polynomial():
+            return self.num.tex()
+        return rf"\frac{{{self.num.tex()}}}{{{self.den.tex()}}}"
+
+
+################################################################
+# the functions
+
+def exp_split(arg: Expr) -> tuple[ExactNumber, Atom | None]:
+    '''
+    Exp[arg] as c * Exp[rest], where the multiples of I Pi / 12 in arg are evaluated to the root of unity c.
+    rest is None if it is zero.
+    '''
+    coef = ExactNumber(1)
+    rest = arg
+    pi_mono = ((Atom('Pi'), 1),)
+    if arg.is_polynomial():
+        for m, c in arg.num.terms:
+            if m == pi_mono:
+                q = (c * ExactNumber.complex(0, -1)).rational()
+                if q is not None and (12 * q).denominator == 1:
+                    coef = ZETA24 ** int(12 * q % 24)
+                    rest = arg - Expr(Poly.monomial(c, pi_mono))
+    if rest.is_zero():
+        return coef, None
+    return coef, Atom('Exp', (rest,))
+
+def integer_power(base: Expr, n: int) -> Expr | None:
+    '''
+    base^n, or None if it is left unevaluated: 0^n for n <= 0, the coefficients exceeding MAX_POWER_BITS (as in
+    `ExactNumber.power`), and the expansions with more than MAX_POWER_TERMS terms.
+    '''
+    b = base.constant_value()
+    if b is not None:
+        res = b.power(Fraction(n))
+        return None if res is None else Expr.number(res)
+
+    polys = (base.num, base.den)
+    size = max(c.numerator.bit_length() + c.denominator.bit_length()
+        for p in polys for _, x in p.terms for _, re, im in x.terms for c in (re, im))
+    terms = max(len(p.terms) for p in polys)
+    if size * abs(n) > MAX_POWER_BITS or math.comb(abs(n) + terms - 1, terms - 1) > MAX_POWER_TERMS:
+        return None
+    return base ** n
+
+def power(base: Expr, exponent: Expr) -> Expr:
+    unevaluated = Expr.atom(Atom('Power', (base, exponent)))
+    q = exponent.constant_value()
+    q = None if q is None else q.rational()
+    if q is not None and q.denominator == 1:
+        res = integer_power(base, q.numerator)
+        return unevaluated if res is None else res
+
+    if base.single_atom() == Atom('E'):
+        return apply_function('Exp', (exponent,))
+
+    b = base.constant_value()
+    if q is not None and q.denominator == 2 and b is not None and b.rational() is not None:
+        root = ExactNumber.sqrt(b.rational())
+        if root is not None:
+            res = integer_power(Expr.number(root), q.numerator)
+            return unevaluated if res is None else res
+
+    # the radicals: x^(n/d) -> x^(n // d) Power[x, 1/d]^(n % d)
+    if q is not None:
+        res = integer_power(base, q.numerator // q.denominator)
+        if res is None:
+            return unevaluated
+        radical = Expr.atom(Atom('Power', (base, Expr.number(Fraction(1, q.denominator)))))
+        return res * radical ** (q.numerator % q.denominator)
+
+    # the integer part of the symbolic exponents of the numbers: b^(n + k) -> b^k b^n
+    if b is not None and not b.is_zero() and exponent.is_polynomial():
+        shift = exponent.num.terms[0][1].rational() if exponent.num.terms[0][0] == () else None
+        if shift is not None and shift.numerator // shift.denominator != 0:
+            k = shift.numerator // shift.denominator
+            res = integer_power(base, k)
+            if res is not None:
+                return res * power(base, exponent - Expr.number(k))
+
+    return unevaluated
+
+def conj_atom(atom: Atom) -> Expr:
+    if atom.args is None and atom.head in CONSTANTS:
+        return Expr.atom(atom)
+    if atom.head == 'Conjugate' and atom.args is not None:
+        return atom.args[0]
+    if atom.head in CONJ_FUNCTIONS and atom.args is not None:
+        return apply_function(atom.head, (atom.args[0].conjugate(),))
+    return Expr.atom(Atom('Conjugate', (Expr.atom(atom),)))
+
+
+def binder_spec(atom: Atom) -> tuple[str, Expr, Expr] | None:
+    '''
+    The iterator and the bounds (it, lo, hi) of the binder Sum[body, {it, lo, hi}], otherwise None.
+    '''
+    if atom.head not in BINDERS or atom.args is None or len(atom.args) != 2 or not isinstance(atom.args[0], Expr):
+        return None
+    spec = atom.args[1]
+    if not isinstance(spec, tuple) or len(spec) != 3 or not all(isinstance(arg, Expr) for arg in spec):
+        return None
+    it = spec[0].single_atom()
+    if it is None or not it.is_symbol() or it.head in CONSTANTS:
+        return None
+    return it.head, spec[1], spec[2]
+
+def binder_height(arg: Expr | tuple) -> int:
+    '''
+    The maximal index of the binders in arg, whose iterators are named `$1`, `$2`, ... from the inside out.
+    '''
+    if isinstance(arg, tuple):
+        return max((binder_height(a) for a in arg), default = 0)
+    res = 0
+    for atom in arg.atoms():
+        if atom.args is None:
+            continue
+        spec = binder_spec(atom)
+        if spec is not None and spec[0].startswith('$') and spec[0][1:].isdigit():
+            res = max(res, int(spec[0][1:]), binder_height(spec[1:]))
+        else:
+            res = max(res, binder_height(atom.args))
+    return res
+
+def apply_binder(head: str, body: Expr, specs: tuple) -> Expr:
+    '''
+    The binder head[body, spec1, spec2, ...], nested as head[head[body, spec2, ...], spec1].
+    The iterators are renamed by `binder_height`, so that the alpha-equivalent binders are equal.
+    The geometric sums are evaluated.
+    '''
+    if len(specs) > 1:
+        body = apply_binder(head, body, specs[1:])
+    spec = specs[0]
+    if isinstance(spec, tuple) and len(spec) == 2:
+        spec = (spec[0], Expr.number(1), spec[1])
+    atom = Atom(head, (body, spec))
+    if binder_spec(atom) is None:
+        return Expr.atom(atom)
+
+    it, lo, hi = binder_spec(atom)
+    name = f"${binder_height(body) + 1}"
+    if it != name:
+        body = body.subst({it: Expr.symbol(name)})
+
+    if head == 'Sum':
+        res = geometric_sum(body, name, lo, hi)
+        if res is not None:
+            return res
+    return Expr.atom(Atom(head, (body, (Expr.symbol(name), lo, hi))))
+
+def geometric_sum(body: Expr, it: str, lo: Expr, hi: Expr) -> Expr | None:
+    '''
+    Evaluate Sum[k r^it, {it, lo, hi}] for the number r, where k is free of it.
+    '''
+    if Atom('Infinity') in lo.atoms():
+        return None
+
+    # find the power r^it in the monomial
+    r = ExactNumber(1)
+    k = body
+    if it in body.variables():
+        if it in Expr(body.den).variables() or len(body.num.terms) != 1:
+            return None
+        m, _ = body.num.terms[0]
+        dependent = [(atom, e) for atom, e in m if it in atom_variables(atom)]
+        if len(dependent) != 1:
+            return None
+        atom, e = dependent[0]
+        r = None if atom.head != 'Power' or atom.args[1] != Expr.symbol(it) else atom.args[0].constant_value()
+        if r is None:
+            return None
+        r = r ** e
+        k = body / Expr.atom(atom) ** e
+
+    if hi.single_atom() == Atom('Infinity'):
+        q = r.rational()
+        if q is None or abs(q) >= 1:
+            return None
+        return k * power(Expr.number(r), lo) / Expr.number(ExactNumber(1) - r)
+    if Atom('Infinity') in hi.atoms():
+        return None
+    if r == ExactNumber(1):
+        return k * (hi - lo + Expr.number(1))
+    return k * (power(Expr.number(r), lo) - power(Expr.number(r), hi + Expr.number(1))) / Expr.number(ExactNumber(1) - r)
+
+
+def apply_function(head: str, args: tuple, held: bool = False) -> Expr:
+    '''
+    Evaluate the function application. The unknown functions are kept as atoms, and the held binders (in `HoldForm`)
+    are kept as they are.
+    '''
+    if len(args) == 1 and isinstance(args[0], Expr):
+        arg = args[0]
+        if head == 'Sqrt':
+            return power(arg, Expr.number(Fraction(1, 2)))
+        if head == 'Exp':
+            coef, atom = exp_split(arg)
+            return Expr.number(coef) if atom is None else Expr.number(coef) * Expr.atom(atom)
+        if head == 'Cos':
+            i_arg = arg * Expr.number(ExactNumber.I)
+            return (apply_function('Exp', (i_arg,)) + apply_function('Exp', (-i_arg,))) * Expr.number(Fraction(1, 2))
+        if head == 'Sin':
+            i_arg = arg * Expr.number(ExactNumber.I)
+            return (apply_function('Exp', (i_arg,)) - apply_function('Exp', (-i_arg,))) * Expr.number(ExactNumber.complex(0, Fraction(-1, 2)))
+        if head == 'Conjugate':
+            return arg.conjugate()
+    if head == 'Power' and len(args) == 2 and all(isinstance(arg, Expr) for arg in args):
+        return power(*args)
+    if head in BINDERS and not held and len(args) > 1 and isinstance(args[0], Expr):
+        return apply_binder(head, args[0], args[1:])
+    return Expr.atom(Atom(head, args))
+
+
+################################################################
+# parsing
+
+_TOKEN = re.compile(r'\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z$][A-Za-z0-9$_]*)|(.))')
+
+def parse_expr(code: str) -> Expr:
+    '''
+    Parse the expression in the Wolfram Language syntax: numbers, symbols, `f[...]`, lists `{...}` as arguments,
+    parentheses and the operators `+ - * / ^` (with the implicit multiplication).
+    The decimal numbers are read exactly, i.e. `0.5` is `1/2`.
+    '''
+    try:
+        parser = _ExprParser(code)
+        res = parser.expr()
+        if parser.peek() is not None:
+            raise ValueError()
+        return res
+    except (ValueError, ZeroDivisionError) as e:
+        raise ValueError(f"Cannot parse the expression '{code}'.") from e
+
+
+class _ExprParser:
+    def __init__(self, code: str):
+        self.tokens : list[tuple[str, str]] = []
+        for m in _TOKEN.finditer(code.strip()):
+            number, name, op = m.groups()
+            if number is not None:
+                self.tokens.append(('num', number))
+            elif name is not None:
+                self.tokens.append(('name', name))
+            elif not op.isspace():
+                self.tokens.append(('op', op))
+        self.pos = 0
+        self.held = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def take(self, token: str | None = None) -> tuple[str, str]:
+        if self.pos >= len(self.tokens) or (token is not None and self.tokens[self.pos] != ('op', token)):
+            raise ValueError()
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def starts_atom(self) -> bool:
+        return self.pos < len(self.tokens) and (self.tokens[self.pos][0] != 'op' or self.tokens[self.pos][1] == '(')
+
+    def expr(self) -> Expr:
+        res = self.term()
+        while self.peek() in ('+', '-'):
+            if self.take()[1] == '+':
+                res = res + self.term()
+            else:
+                res = res - self.term()
+        return res
+
+    def term(self) -> Expr:
+        res = self.unary()
+        while True:
+            if self.peek() == '*':
+                self.take()
+                res = res * self.unary()
+            elif self.peek() == '/':
+                self.take()
+                res = res / self.unary()
+            # implicit multiplication
+            elif self.starts_atom():
+                res = res * self.power()
+            else:
+                return res
+
+    def unary(self) -> Expr:
+        if self.peek() == '-':
+            self.take()
+            return -self.unary()
+        if self.peek() == '+':
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self) -> Expr:
+        base = self.atom()
+        if self.peek() != '^':
+            return base
+        self.take()
+        return power(base, self.unary())
+
+    def atom(self) -> Expr:
+        kind, tk = self.take()
+        if kind == 'num':
+            return Expr.number(Fraction(tk))
+        if kind == 'name':
+            if self.peek() == '[':
+                self.take('[')
+                # the binders in HoldForm are not evaluated
+                self.held += tk == 'HoldForm'
+                args = self.args(']')
+                self.held -= tk == 'HoldForm'
+                return apply_function(tk, args, self.held > 0)
+            if tk == 'I':
+                return Expr.number(ExactNumber.I)
+            return Expr.symbol(tk)
+        if tk == '(':
+            res = self.expr()
+            self.take(')')
+            return res
+        raise ValueError()
+
+    def args(self, close: str) -> tuple:
+        res = []
+        while self.peek() != close:
+            if self.peek() == '{':
+                self.take('{')
+                res.append(self.args('}'))
+            else:
+                res.append(self.expr())
+            if self.peek() != close:
+                self.take(',')
+        self.take(close)
+        return tuple(res)
@@ -4,30 +4,539 @@ A lightweight wrapping of Wolfram Engine.
 providing the unique 'session'.
 '''
 
-from typing import Sequence
+from typing import Any, Callable, Dict, List, Sequence
 
-from wolframclient.evaluation import WolframLanguageSession
+from wolframclient.evaluation import WolframLanguageSession, WolframEvaluatorPool
+from wolframclient.exception import WolframKernelException
 from wolframclient.language import wl, wlexpr
-from wolframclient.language.expression import WLFunction, WLSymbol
+from wolframclient.language.expression import WLFunction, WLSymbol, WLInputExpression
+from wolframclient.serializers import export
+from wolframclient.deserializers import binary_deserialize
+from collections import OrderedDict
+from fractions import Fraction
+import asyncio
 import contextlib
+import concurrent.futures
+import sqlite3
+import threading
 
-# the only session
-session = WolframLanguageSession()
+from .exact_backend import ExactNumber
+
+# the only session (None if no Wolfram Engine is installed, and then only the Python backend is available)
+try:
+    session = WolframLanguageSession()
+except WolframKernelException:
+    session = None
 
 def session_start():
-    session.start()
+    if session is not None:
+        session.start()
 
 def session_terminate():
-    session.terminate()
+    if session is not None:
+        session.terminate()
+
+# the kernel pool in the context of kernel_pool, which evaluates the expressions instead of the session
+active_pool : 'KernelPool | None' = None
+
+def evaluate(expr: Any) -> Any:
+    '''
+    evaluate the expression on the active kernel pool (see kernel_pool), or in the session.
+    With the pool, it can be called from several threads, and the evaluations run concurrently.
+    '''
+    if active_pool is not None:
+        return active_pool.call(active_pool.evaluate(expr))
+    if session is None:
+        raise RuntimeError("Wolfram Engine not available: install it, or use the Python backend (DIRACDEC_BACKEND=python).")
+    return session.evaluate(expr)
+
+def concurrent_map(f: Callable[[Any], Any], items: Sequence[Any]) -> List[Any]:
+    '''
+    apply f on the items, in separate threads if the kernel pool is active (so that their evaluations run concurrently), otherwise in sequence.
+    '''
+    if active_pool is None or len(items) <= 1:
+        return [f(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(len(items)) as executor:
+        return list(executor.map(f, items))
 
 def wolfram_parser(code : str):
-    return session.evaluate(code)
+    return evaluate(code)
+
+
+# the sentinel for the missing entries in the caches
+MISSING = object()
+
+class ExprCache:
+    '''
+    The bounded LRU cache of evaluation results, keyed by the canonical form (InputForm) of the input expressions.
+    If a database file is attached, the results are also stored there (in WXF), so that they survive process restarts.
+    The expressions that cannot be serialized are not cached.
+    The cache can be shared by several threads.
+    '''
+    def __init__(self, maxsize: int = 4096, path: str | None = None):
+        self.maxsize = maxsize
+        self.data : OrderedDict[bytes, Any] = OrderedDict()
+        self.conn : sqlite3.Connection | None = None
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None:
+            self.attach(path)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __str__(self) -> str:
+        return f"ExprCache(size={len(self.data)}/{self.maxsize}, hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.
+
+    def attach(self, path: str) -> None:
+        '''
+        attach the database file as the on-disk tier.
+        '''
+        self.detach()
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                key BLOB PRIMARY KEY,
+                value BLOB NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def detach(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def key(expr: Any) -> bytes | None:
+        '''
+        return the canonical key of the expression, or None if it cannot be serialized.
+        '''
+        try:
+            return export(expr)
+        except Exception:
+            return None
+
+    def get(self, key: bytes) -> Any:
+        '''
+        return the cached result, or MISSING.
+        '''
+        with self.lock:
+            res = self.data.get(key, MISSING)
+            if res is MISSING and self.conn is not None:
+                row = self.conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    res = binary_deserialize(row[0])
+                    self.put(key, res, persist = False)
+
+            if res is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.data.move_to_end(key)
+            return res
+
+    def put(self, key: bytes, value: Any, persist: bool = True) -> None:
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+            if persist and self.conn is not None:
+                try:
+                    blob = export(value, target_format='wxf')
+                except Exception:
+                    return
+                self.conn.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)', (key, blob))
+                self.conn.commit()
+
+    def clear(self) -> None:
+        '''
+        remove all the entries in memory (and in the database file), and reset the statistics.
+        '''
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.conn is not None:
+            self.conn.execute('DELETE FROM results')
+            self.conn.commit()
+
+
+# the cache of the simplifications (FullSimplify), and the cache of the string and TeX forms
+simplify_cache = ExprCache()
+format_cache = ExprCache()
+
+def evaluate_cached(expr: Any, cache: ExprCache) -> Any:
+    '''
+    evaluate the expression (see evaluate), using the cache.
+    '''
+    key = cache.key(expr)
+    if key is not None:
+        res = cache.get(key)
+        if res is not MISSING:
+            return res
+
+    res = evaluate(expr)
+    if key is not None:
+        cache.put(key, res)
+    return res
+
+def to_string(expr: Any) -> str:
+    return str(evaluate_cached(wl.ToString(expr), format_cache))
+
+def to_tex(expr: Any) -> str:
+    return evaluate_cached(wl.ToString(expr, wl.TeXForm), format_cache)
+
+
+def _wolfram_rational(q: Fraction) -> Any:
+    return q.numerator if q.denominator == 1 else wl.Rational(q.numerator, q.denominator)
+
+def exact_to_wolfram(x: ExactNumber) -> Any:
+    '''
+    The canonical Wolfram expression of the exact number: equal numbers give equal expressions.
+    '''
+    items = []
+    for r, re, im in x.terms:
+        coef = _wolfram_rational(re) if im == 0 else wl.Complex(_wolfram_rational(re), _wolfram_rational(im))
+        if r == 1:
+            items.append(coef)
+        elif coef == 1:
+            items.append(wl.Power(r, wl.Rational(1, 2)))
+        else:
+            items.append(wl.Times(coef, wl.Power(r, wl.Rational(1, 2))))
+
+    if len(items) == 0:
+        return 0
+    if len(items) == 1:
+        return items[0]
+    return wl.Plus(*items)
+
+def exact_from_wolfram(expr: Any) -> ExactNumber | None:
+    '''
+    Convert the Wolfram expression (e.g. the result of FullSimplify) to the exact number.
+    Return None if the expression is not an exact literal in the field.
+    '''
+    if isinstance(expr, bool):
+        return None
+    if isinstance(expr, (int, Fraction)):
+        return ExactNumber(expr)
+    if isinstance(expr, WLInputExpression):
+        return ExactNumber.parse(expr.input)
+    if isinstance(expr, WLSymbol):
+        return ExactNumber.I if expr.name.split('`')[-1] == 'I' else None
+    if not isinstance(expr, WLFunction) or not isinstance(expr.head, WLSymbol):
+        return None
+
+    head = expr.head.name.split('`')[-1]
+    args = [exact_from_wolfram(arg) for arg in expr.args]
+    if any(arg is None for arg in args):
+        return None
+
+    try:
+        if head == 'Plus':
+            return sum(args[1:], args[0]) if args else ExactNumber()
+        if head == 'Times':
+            res = ExactNumber(1)
+            for arg in args:
+                res = res * arg
+            return res
+        if head == 'Rational' and len(args) == 2:
+            return args[0] / args[1]
+        if head == 'Complex' and len(args) == 2:
+            return args[0] + args[1] * ExactNumber.I
+        if head == 'Sqrt' and len(args) == 1:
+            q = args[0].rational()
+            return None if q is None else ExactNumber.sqrt(q)
+        if head == 'Power' and len(args) == 2:
+            exponent = args[1].rational()
+            return None if exponent is None else args[0].power(exponent)
+    except ZeroDivisionError:
+        return None
+    return None
+
+
+class PendingResult:
+    '''
+    The result of an evaluation submitted to the batch, which is available after the batch is flushed.
+    If the evaluation failed, the exception is raised when the result is requested.
+    '''
+    __slots__ = ('batch', 'expr', 'key', 'value', 'error', 'ready')
+
+    def __init__(self, batch: 'EvaluationBatch', expr: Any, key: bytes | None = None):
+        self.batch = batch
+        self.expr = expr
+        self.key = key
+        self.value = None
+        self.error : BaseException | None = None
+        self.ready = False
+
+    def get(self) -> Any:
+        '''
+        return the result, and flush the batch if it is not evaluated yet.
+        '''
+        if not self.ready:
+            self.batch.wait(self)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class EvaluationBatch:
+    '''
+    The queue of pending evaluations, which are sent to the kernel as a single `List[...]` evaluation when any of the results is needed (or the queue is full).
+
+    evaluator: the function to evaluate a Wolfram expression. None means the module function evaluate, and it can be replaced by a stand-in (e.g. to test without a kernel).
+    max_pending: the maximum number of pending evaluations.
+    cache: the cache of the results. The cached expressions are not submitted, and the same expressions pending in the batch share the result.
+    round_trips: the number of evaluations sent to the evaluator.
+
+    The batch can be shared by several threads: a thread waiting for a result evaluated by another one is blocked until that flush finishes.
+    '''
+    def __init__(self, evaluator: Callable[[Any], Any] | None = None, max_pending: int = 256, cache: ExprCache | None = None):
+        self.evaluator = evaluator
+        self.max_pending = max_pending
+        self.cache = cache
+        self.pending : List[PendingResult] = []
+        self.pending_keys : Dict[bytes, PendingResult] = {}
+        self.round_trips = 0
+        self.lock = threading.Condition(threading.RLock())
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def evaluate(self, expr: Any) -> Any:
+        self.round_trips += 1
+        if self.evaluator is None:
+            return evaluate(expr)
+        return self.evaluator(expr)
+
+    def submit(self, expr: Any) -> PendingResult:
+        '''
+        submit the expression to evaluate, and return the pending result.
+        '''
+        with self.lock:
+            key = None
+            if self.cache is not None:
+                key = self.cache.key(expr)
+                if key is not None:
+                    res = self.pending_keys.get(key)
+                    if res is not None:
+                        return res
+
+                    value = self.cache.get(key)
+                    if value is not MISSING:
+                        res = PendingResult(self, expr, key)
+                        res.value = value
+                        res.ready = True
+                        return res
+
+            if len(self.pending) < self.max_pending:
+                res = PendingResult(self, expr, key)
+                self.pending.append(res)
+                if key is not None:
+                    self.pending_keys[key] = res
+                return res
+
+        # the queue is full
+        self.flush()
+        return self.submit(expr)
+
+    def flush(self) -> None:
+        '''
+        evaluate all the pending expressions in one round-trip.
+        '''
+        with self.lock:
+            if len(self.pending) == 0:
+                return
+
+            batch, self.pending = self.pending, []
+            self.pending_keys = {}
+
+        # the evaluation is out of the lock, so that other threads can submit and flush meanwhile
+        try:
+            if len(batch) > 1:
+                try:
+                    values = self.evaluate(wl.List(*(res.expr for res in batch)))
+                    for res, value in zip(batch, values):
+                        self.resolve(res, value)
+                    return
+                except Exception:
+                    # evaluate one by one, so that the failure only affects its own result
+                    pass
+
+            for res in batch:
+                try:
+                    value = self.evaluate(res.expr)
+                except Exception as e:
+                    res.error = e
+                    res.ready = True
+                    continue
+                self.resolve(res, value)
+
+        finally:
+            with self.lock:
+                for res in batch:
+                    if not res.ready:
+                        res.error = RuntimeError("The evaluation was interrupted.")
+                        res.ready = True
+                self.lock.notify_all()
+
+    def wait(self, res: PendingResult) -> None:
+        '''
+        flush the batch, and wait until the result is ready (it can be evaluated by the flush of another thread).
+        '''
+        self.flush()
+        with self.lock:
+            while not res.ready:
+                self.lock.wait()
+
+    def resolve(self, res: PendingResult, value: Any) -> None:
+        res.value = value
+        res.ready = True
+        if self.cache is not None and res.key is not None:
+            self.cache.put(res.key, value)
+
+
+# the batch of the FullSimplify evaluations for the scalars and bases
+simplify_batch = EvaluationBatch(cache = simplify_cache)
+
+def simplify_lazy(expr: Any) -> PendingResult:
+    '''
+    submit `FullSimplify[expr]` to the batch.
+    '''
+    return simplify_batch.submit(wl.FullSimplify(expr))
+
+
+class KernelPool:
+    '''
+    A pool of Wolfram kernels with an asyncio API, built on WolframEvaluatorPool, so that independent evaluations run concurrently on different kernels.
+
+    size: the number of kernels.
+    kernel: the path of the kernel. None means the default location.
+    session_class: the class of the asynchronous sessions. It can be replaced by a fake kernel (providing the coroutines start, stop and evaluate) to test without a Wolfram licence.
+
+    The pool can also run in a background thread with its own event loop (see run_in_background), and serve the synchronous code through batch_evaluator.
+    '''
+    def __init__(self, size: int = 4, kernel: str | None = None, session_class: Any = None):
+        self.size = size
+        self.kernel = kernel
+        self.session_class = session_class
+
+        self.pool : WolframEvaluatorPool | None = None
+
+        # the event loop and thread in the background mode
+        self.loop : asyncio.AbstractEventLoop | None = None
+        self.thread : threading.Thread | None = None
+
+    async def start(self) -> None:
+        if self.pool is None:
+            if self.session_class is None:
+                self.pool = WolframEvaluatorPool(self.kernel, poolsize = self.size)
+            else:
+                self.pool = WolframEvaluatorPool(self.kernel, poolsize = self.size, async_language_session_class = self.session_class)
+        await self.pool.start()
+
+    async def terminate(self) -> None:
+        if self.pool is not None:
+            await self.pool.terminate()
+            self.pool = None
+
+    async def __aenter__(self) -> 'KernelPool':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.terminate()
+
+    async def evaluate(self, expr: Any) -> Any:
+        if self.pool is None:
+            await self.start()
+        return await self.pool.evaluate(expr) # type: ignore
+
+    async def evaluate_many(self, exprs: Sequence[Any]) -> List[Any]:
+        '''
+        evaluate the expressions concurrently, and return the results in order.
+        '''
+        if self.pool is None:
+            await self.start()
+        return list(await self.pool.evaluate_all(exprs)) # type: ignore
+
+    def run_in_background(self) -> None:
+        '''
+        start the pool in a background thread with its own event loop.
+        '''
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target = self.loop.run_forever, daemon = True)
+        self.thread.start()
+        self.call(self.start())
+
+    def stop_background(self) -> None:
+        if self.loop is None or self.thread is None:
+            return
+        try:
+            self.call(self.terminate())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop, self.thread = None, None
+
+    def call(self, coro: Any) -> Any:
+        '''
+        run the coroutine in the background event loop, and wait for the result.
+        '''
+        if self.loop is None:
+            raise RuntimeError("The kernel pool is not running in the background.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def batch_evaluator(self, expr: Any) -> Any:
+        '''
+        the evaluator for EvaluationBatch, which distributes the expressions of a `List[...]` batch to the kernels in the background.
+        '''
+        if isinstance(expr, WLFunction) and expr.head == wl.List:
+            return tuple(self.call(self.evaluate_many(expr.args)))
+        return self.call(self.evaluate(expr))
+
+
+@contextlib.contextmanager
+def kernel_pool(size: int = 4, kernel: str | None = None, session_class: Any = None):
+    '''
+    Run the evaluations (see evaluate) on a pool of kernels in the context. The simplifications in a batch are distributed to the kernels.
+    '''
+    global active_pool
+    pool = KernelPool(size, kernel, session_class)
+    old_pool, old_evaluator = active_pool, simplify_batch.evaluator
+    try:
+        pool.run_in_background()
+        active_pool = pool
+        simplify_batch.evaluator = pool.batch_evaluator
+        yield pool
+        simplify_batch.flush()
+    finally:
+        active_pool = old_pool
+        simplify_batch.evaluator = old_evaluator
+        pool.stop_background()
 
 
 @contextlib.contextmanager
 def wolfram_session():
     try:
-        session.start()
+        session_start()
         yield session
+
+        # the pending simplifications need the session
+        simplify_batch.flush()
     finally:
-        session.terminate()
\ No newline at end of file
+        session_terminate()
\ No newline at end of file
@@ -2,8 +2,8 @@
 The different implementations for the component theories.
 '''
 
-# from . import py_cscalar
-# from . import str_abase
+from . import py_cscalar
+from . import str_abase
 from . import wolfram_simple
 from . import wolfram_unique
 
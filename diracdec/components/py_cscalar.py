@@ -1,45 +1,97 @@
 '''
-The implementation for complex scalar system by python floating point numbers
+The implementation for complex scalar system by symbolic expressions in Python (see `backends.sym_backend`).
+
+It needs no Wolfram Engine: the scalars are kept in the normal form of the rational functions over the exact numbers.
 '''
 
 from __future__ import annotations
 
 from ..theory.complex_scalar import ComplexScalar
+from ..theory.trs import Term, Var, Subst
+
+from ..backends.sym_backend import Expr, parse_expr
+
+
+def expr_substitution(sigma: Subst | dict[Var, Term]) -> dict[str, Expr]:
+    '''
+    The substitution of the symbols, from the variables mapped to variables and Python scalars or bases.
+    '''
+    from .str_abase import StrABase
+
+    if not isinstance(sigma, Subst):
+        sigma = Subst(sigma)
+
+    res = {}
+    for k, v in sigma.data.items():
+        if isinstance(v, Var):
+            res[k.name] = Expr.symbol(v.name)
+        elif isinstance(v, PyCScalar) or isinstance(v, StrABase):
+            res[k.name] = v.expr
+    return res
+
 
 class PyCScalar(ComplexScalar):
-    def __init__(self, c : complex | str):
-        if isinstance(c, str):
-            c = complex(c)
-        self.c = c
+    def __init__(self, expr : str | complex | Expr):
+        if isinstance(expr, str):
+            expr = parse_expr(expr)
+        elif not isinstance(expr, Expr):
+            expr = Expr.number(expr)
+        self.expr = expr
 
     @staticmethod
     def zero() -> PyCScalar:
         return PyCScalar(0)
-    
+
     @staticmethod
     def one() -> PyCScalar:
         return PyCScalar(1)
-    
+
     @staticmethod
     def conj(c : PyCScalar) -> PyCScalar:
-        return PyCScalar(c.c.conjugate())
-    
+        return PyCScalar(c.expr.conjugate())
+
     @staticmethod
     def add(c1 : PyCScalar, c2 : PyCScalar) -> PyCScalar:
-        return PyCScalar(c1.c + c2.c)
-    
+        return PyCScalar(c1.expr + c2.expr)
+
     @staticmethod
     def mlt(c1 : PyCScalar, c2 : PyCScalar) -> PyCScalar:
-        return PyCScalar(c1.c * c2.c)
-    
+        return PyCScalar(c1.expr * c2.expr)
+
     def __str__(self) -> str:
-        return f'{str(self.c)}'
-    
+        return str(self.expr)
+
     def __repr__(self) -> str:
-        return f'PyCScalar({self.c})'
-    
+        return f'PyCScalar({self.expr})'
+
+    def tex(self) -> str:
+        return r"\left (" + self.expr.tex() + r"\right )"
+
     def __eq__(self, other: PyCScalar) -> bool:
-        return isinstance(other, PyCScalar) and self.c == other.c
-    
+        return isinstance(other, PyCScalar) and self.expr == other.expr
+
     def __hash__(self) -> int:
-        return hash(self.c)
\ No newline at end of file
+        return hash(('PyCScalar', self.expr))
+
+    def size(self) -> int:
+        return 1
+
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = frozenset(Var(v) for v in self.expr.variables())
+        return self._variables
+
+    def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
+        sub = expr_substitution(sigma)
+        if len(sub) == 0:
+            return self
+
+        res = self.expr.subst(sub)
+        return self if res is self.expr else PyCScalar(res)
+
+    def reduce(self) -> PyCScalar | None:
+        atom = self.expr.single_atom()
+        if atom is not None and atom.head == 'HoldForm' and atom.args is not None:
+            return PyCScalar(atom.args[0].release())
+        else:
+            return None
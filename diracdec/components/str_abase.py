@@ -1,24 +1,70 @@
 '''
-The implementation for complex scalar system by python floating point numbers
+The implementation for atomic bases by symbolic expressions in Python (see `backends.sym_backend`).
 '''
 
 from __future__ import annotations
 
 from ..theory.atomic_base import AtomicBase
+from ..theory.trs import Term, Var, Subst
+
+from ..backends.sym_backend import Expr, parse_expr
+
+from .py_cscalar import expr_substitution
 
 
 class StrABase(AtomicBase):
-    def __init__(self, s : str):
-        self.s = s
+    def __init__(self, expr : str | Expr):
+        if isinstance(expr, str):
+            expr = parse_expr(expr)
+        self.expr = expr
 
     def __str__(self) -> str:
-        return self.s
-    
+        return str(self.expr)
+
     def __repr__(self) -> str:
-        return f'StrABase({self.s})"'
-    
+        return f'StrABase({self.expr})'
+
+    def tex(self) -> str:
+        return self.expr.tex()
+
     def __eq__(self, other: StrABase) -> bool:
-        return isinstance(other, StrABase) and self.s == other.s
-    
+        return isinstance(other, StrABase) and self.expr == other.expr
+
     def __hash__(self) -> int:
-        return hash(self.s)
\ No newline at end of file
+        return hash(('StrABase', self.expr))
+
+    def size(self) -> int:
+        return 1
+
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = frozenset(Var(v) for v in self.expr.variables())
+        return self._variables
+
+    def eq_satisfiable(self, other) -> bool:
+        '''
+        check whether e1 == e2 is satisfiable with the variables.
+
+        The difference is normalized: a nonzero number is unsatisfiable. Otherwise the equation is conservatively
+        considered satisfiable.
+        '''
+        if not isinstance(other, StrABase):
+            return True
+
+        diff = (self.expr - other.expr).constant_value()
+        return diff is None or diff.is_zero()
+
+    def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
+        sub = expr_substitution(sigma)
+        if len(sub) == 0:
+            return self
+
+        res = self.expr.subst(sub)
+        return self if res is self.expr else StrABase(res)
+
+    def reduce(self) -> StrABase | None:
+        atom = self.expr.single_atom()
+        if atom is not None and atom.head == 'HoldForm' and atom.args is not None:
+            return StrABase(atom.args[0].release())
+        else:
+            return None
@@ -16,23 +16,74 @@ from ..backends.wolfram_backend import *
 
 import hashlib
 
+def pending_order_key(term: WolframABase | WolframCScalar) -> tuple:
+    '''
+    The order key of the term built from its input expression, while the simplification is pending.
+    It is not cached, and it is inexact: equal terms can have different inputs (see `AC.equal_pair`).
+    '''
+    term._order_exact = False
+    return (2, type(term).__qualname__, f'{type(term).__name__}({term._input})')
+
+
+def contains_hold(expr: Any) -> bool:
+    '''
+    Whether HoldForm occurs in the (unevaluated) expression.
+    '''
+    if isinstance(expr, WLInputExpression):
+        return 'HoldForm' in expr.input
+    if isinstance(expr, WLFunction):
+        return expr.head == wl.HoldForm or contains_hold(expr.head) or any(contains_hold(arg) for arg in expr.args)
+    return False
+
+
 class WolframABase(AtomicBase):
+
+    # the equality falls back to FullSimplify, so equal bases can have different repr
+    syntactic_eq = False
+
     def __init__(self, expr : str | Any):
 
         if isinstance(expr, str):
             expr = wlexpr(expr)
 
-        self.simp_expr = session.evaluate(wl.FullSimplify(expr))
+        # the simplification is evaluated lazily in batches
+        self._input = expr
+        self._simp_expr : Any = simplify_lazy(expr)
+
+    @property
+    def ready(self) -> bool:
+        '''
+        Whether the simplified expression is available without evaluating the batch.
+        '''
+        return not isinstance(self._simp_expr, PendingResult) or self._simp_expr.ready
+
+    @property
+    def simp_expr(self) -> Any:
+        if isinstance(self._simp_expr, PendingResult):
+            self._simp_expr = self._simp_expr.get()
+            self._input = None
+        return self._simp_expr
+
+    def order_key(self) -> tuple:
+        # a pending simplification is ordered by its input, so that sorting does not evaluate the batch
+        if self._order_key is None and not self.ready:
+            return pending_order_key(self)
+        return super().order_key()
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        state['_simp_expr'] = self.simp_expr
+        return state
         
 
     def __str__(self) -> str:
-        return str(session.evaluate(wl.ToString(self.simp_expr)))
+        return to_string(self.simp_expr)
     
     def __repr__(self) -> str:
         return f'WolframABase({self.simp_expr})'
     
     def tex(self) -> str:
-        return session.evaluate(wl.ToString(self.simp_expr, wl.TeXForm))    
+        return to_tex(self.simp_expr)    
     
     def __eq__(self, other: WolframABase) -> bool:
         # 1. if not the same type, return False
@@ -44,7 +95,7 @@ class WolframABase(AtomicBase):
             return True
         
         # 3. for different syntax, compare the semantics by invoking Wolfram Engine
-        return session.evaluate(wl.FullSimplify(wl.Equal(self.simp_expr, other.simp_expr))) == True
+        return evaluate_cached(wl.FullSimplify(wl.Equal(self.simp_expr, other.simp_expr)), simplify_cache) == True
 
     
     def __hash__(self) -> int:
@@ -55,16 +106,18 @@ class WolframABase(AtomicBase):
         return 1
     
 
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Special symbols like "Inifinity" will also match _Symbol, and we rule them out.
 
         Notice: the "Global`" prefix is removed
         '''
-        return set(Var(v.name.replace("Global`", ""))
-                   for v in session.evaluate(wl.Cases(wl.List(self.simp_expr), wl.Blank(wl.Symbol), wl.Infinity)) 
-                   if isinstance(v, WLSymbol)
-                   )
+        if self._variables is None:
+            self._variables = frozenset(Var(v.name.replace("Global`", ""))
+                    for v in evaluate(wl.Cases(wl.List(self.simp_expr), wl.Blank(wl.Symbol), wl.Infinity)) 
+                    if isinstance(v, WLSymbol)
+                    )
+        return self._variables
 
     def eq_satisfiable(self, other) -> bool:
         '''
@@ -78,7 +131,7 @@ class WolframABase(AtomicBase):
         
         else:
             vars = wl.List(*[wl.Symbol(v.name) for v in common_vars])
-            res = session.evaluate(wl.FindInstance(wl.Equal(self.simp_expr, other.simp_expr), vars))
+            res = evaluate(wl.FindInstance(wl.Equal(self.simp_expr, other.simp_expr), vars))
             return res != ()
         
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
@@ -100,6 +153,9 @@ class WolframABase(AtomicBase):
         return WolframABase(wl.ReplaceAll(self.simp_expr, tuple(wolfram_sub)))
     
     def reduce(self) -> WolframABase | None:
+        # only the held inputs can simplify to a held expression
+        if not self.ready and not contains_hold(self._input):
+            return None
         if isinstance(self.simp_expr, WLFunction) and self.simp_expr.head == wl.HoldForm:
             return WolframABase(self.simp_expr[0])
         else:
@@ -108,12 +164,84 @@ class WolframABase(AtomicBase):
 
 
 class WolframCScalar(ComplexScalar):
-    def __init__(self, expr : str | Any):
+
+    _exact : ExactNumber | None = None
+
+    # the input expression, while the simplification is pending
+    _input : Any = None
+
+    def __init__(self, expr : str | ExactNumber | Any):
+
+        # the numeric literals are computed exactly in Python, without the Wolfram Engine
+        if isinstance(expr, ExactNumber):
+            exact = expr
+        elif isinstance(expr, str):
+            exact = ExactNumber.parse(expr)
+        else:
+            exact = exact_from_wolfram(expr)
+
+        if exact is not None:
+            self._exact = exact
+            self._simp_expr : Any = exact_to_wolfram(exact)
+            return
 
         if isinstance(expr, str):
             expr = wlexpr(expr)
 
-        self.simp_expr = session.evaluate(wl.FullSimplify(expr))
+        # the simplification is evaluated lazily in batches
+        self._input = expr
+        self._simp_expr = simplify_lazy(expr)
+
+    @property
+    def ready(self) -> bool:
+        '''
+        Whether the simplified expression is available without evaluating the batch.
+        '''
+        return not isinstance(self._simp_expr, PendingResult) or self._simp_expr.ready
+
+    @property
+    def expr(self) -> Any:
+        '''
+        The expression of the scalar, which is the input expression if the simplification is still pending.
+        It is used to build other expressions without evaluating the batch.
+        '''
+        return self.simp_expr if self.ready else self._input
+
+    @property
+    def simp_expr(self) -> Any:
+        if isinstance(self._simp_expr, PendingResult):
+            self._simp_expr = self._simp_expr.get()
+            self._input = None
+
+            # the simplified result can be a literal, which is then kept in the canonical form
+            self._exact = exact_from_wolfram(self._simp_expr)
+            if self._exact is not None:
+                self._simp_expr = exact_to_wolfram(self._exact)
+        return self._simp_expr
+
+    @property
+    def exact(self) -> ExactNumber | None:
+        '''
+        The exact value if the scalar is a numeric literal, otherwise None.
+        '''
+        self.simp_expr
+        return self._exact
+
+    def __getstate__(self) -> dict:
+        self.simp_expr
+        return super().__getstate__()
+
+    def order_key(self) -> tuple:
+        # a pending simplification is ordered by its input, so that sorting does not evaluate the batch
+        if self._order_key is None and not self.ready:
+            return pending_order_key(self)
+        return super().order_key()
+
+    def known_exact(self) -> ExactNumber | None:
+        '''
+        The exact value if it is known without evaluating the batch.
+        '''
+        return self.exact if self.ready else None
 
     @staticmethod
     def zero() -> WolframCScalar:
@@ -125,27 +253,45 @@ class WolframCScalar(ComplexScalar):
     
     @staticmethod
     def conj(c : WolframCScalar) -> WolframCScalar:
-        return WolframCScalar(wl.Conjugate(c.simp_expr))
+        exact = c.known_exact()
+        if exact is not None:
+            return WolframCScalar(exact.conjugate())
+        return WolframCScalar(wl.Conjugate(c.expr))
     
     @staticmethod
     def add(c1 : WolframCScalar, c2 : WolframCScalar) -> WolframCScalar:
-        return WolframCScalar(wl.Plus(c1.simp_expr, c2.simp_expr))
+        exact1, exact2 = c1.known_exact(), c2.known_exact()
+        if exact1 is not None and exact2 is not None:
+            return WolframCScalar(exact1 + exact2)
+        return WolframCScalar(wl.Plus(c1.expr, c2.expr))
     
     @staticmethod
     def mlt(c1 : WolframCScalar, c2 : WolframCScalar) -> WolframCScalar:
-        return WolframCScalar(wl.Times(c1.simp_expr, c2.simp_expr))
+        exact1, exact2 = c1.known_exact(), c2.known_exact()
+        if exact1 is not None and exact2 is not None:
+            return WolframCScalar(exact1 * exact2)
+        return WolframCScalar(wl.Times(c1.expr, c2.expr))
     
     def __str__(self) -> str:
-        return str(session.evaluate(wl.ToString(self.simp_expr)))
+        # the literals are printed without the Wolfram Engine
+        if self.exact is not None:
+            return str(self.exact)
+        return to_string(self.simp_expr)
     
     def __repr__(self) -> str:
         return f'WolframCScalar({self.simp_expr})'
     
     def tex(self) -> str:
-        return r"\left (" + session.evaluate(wl.ToString(self.simp_expr, wl.TeXForm)) + r"\right )"
+        if self.exact is not None:
+            return r"\left (" + self.exact.tex() + r"\right )"
+        return r"\left (" + to_tex(self.simp_expr) + r"\right )"
     
     def __eq__(self, other: WolframCScalar) -> bool:
-        return isinstance(other, WolframCScalar) and self.simp_expr == other.simp_expr
+        if not isinstance(other, WolframCScalar):
+            return False
+        if self.exact is not None and other.exact is not None:
+            return self.exact == other.exact
+        return self.simp_expr == other.simp_expr
     
     def __hash__(self) -> int:
         h = hashlib.md5(str(self.simp_expr).encode())
@@ -154,17 +300,25 @@ class WolframCScalar(ComplexScalar):
     def size(self) -> int:
         return 1
     
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Special symbols like "Inifinity" will also match _Symbol, and we rule them out.
         '''
-        return set(Var(v.name.replace("Global`", ""))
-                   for v in session.evaluate(wl.Cases(wl.List(self.simp_expr), wl.Blank(wl.Symbol), wl.Infinity)) 
-                   if isinstance(v, WLSymbol)
-                   )
+        if self.exact is not None:
+            return frozenset()
+        if self._variables is None:
+            self._variables = frozenset(Var(v.name.replace("Global`", ""))
+                    for v in evaluate(wl.Cases(wl.List(self.simp_expr), wl.Blank(wl.Symbol), wl.Infinity)) 
+                    if isinstance(v, WLSymbol)
+                    )
+        return self._variables
 
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
 
+        # the literals have no variables
+        if self.exact is not None:
+            return self
+
         if not isinstance(sigma, Subst):
             sigma = Subst(sigma)
 
@@ -182,6 +336,9 @@ class WolframCScalar(ComplexScalar):
         return WolframCScalar(wl.ReplaceAll(self.simp_expr, tuple(wolfram_sub)))
     
     def reduce(self) -> WolframCScalar | None:
+        # only the held inputs can simplify to a held expression
+        if not self.ready and not contains_hold(self._input):
+            return None
         if isinstance(self.simp_expr, WLFunction) and self.simp_expr.head == wl.HoldForm:
             return WolframCScalar(self.simp_expr[0])
         else:
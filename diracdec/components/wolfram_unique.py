@@ -7,7 +7,7 @@ Semantical equivalence is checked by testing `FullSimplify[A == B]`
 '''
 
 from __future__ import annotations
-from typing import Any, List
+from typing import Any, List, Tuple
 
 from diracdec.theory.trs import Subst, Term, StdTerm, BindVarTerm
 
@@ -22,12 +22,16 @@ from ..backends.wolfram_backend import *
 from .wolfram_simple import WolframABase, WolframCScalar
 
 import hashlib
+import threading
 
 class WolABaseUnique(AtomicBase):
 
     # this list of all complex scalars constructed
     table : set[WolABaseUnique] = set()
 
+    # the search and the insertion are atomic, so that the normalizations in several threads agree on the instances
+    table_lock = threading.RLock()
+
     def __new__(cls, expr : str | Any):
         '''
         return the unique instance equivalent to expr
@@ -36,30 +40,34 @@ class WolABaseUnique(AtomicBase):
         if isinstance(expr, str):
             expr = wlexpr(expr)
 
-        # search for the existing expressions
-        for instance in WolABaseUnique.table:
-            if session.evaluate(wl.FullSimplify(wl.Equal(instance.expr, expr))) == True:
-                return instance
-            
-        # simplify, append the new instance in the table
-        expr = session.evaluate(wl.FullSimplify(expr))
-        obj = object.__new__(cls)
-        obj.expr = expr
-        WolABaseUnique.table.add(obj)
-        return obj
+        with WolABaseUnique.table_lock:
+            # search for the existing expressions
+            for instance in WolABaseUnique.table:
+                if evaluate_cached(wl.FullSimplify(wl.Equal(instance.expr, expr)), simplify_cache) == True:
+                    return instance
+                
+            # simplify, append the new instance in the table
+            expr = evaluate_cached(wl.FullSimplify(expr), simplify_cache)
+            obj = object.__new__(cls)
+            obj.expr = expr
+            WolABaseUnique.table.add(obj)
+            return obj
+    
+    def __getnewargs__(self) -> Tuple:
+        return (self.expr,)
         
     def __init__(self, expr : str | Any):
         self.expr : Any
 
 
     def __str__(self) -> str:
-        return str(session.evaluate(wl.ToString(self.expr)))
+        return to_string(self.expr)
     
     def __repr__(self) -> str:
         return f'WolABaseUnique({self.expr})'
     
     def tex(self) -> str:
-        return session.evaluate(wl.ToString(self.expr, wl.TeXForm))    
+        return to_tex(self.expr)    
     
     def __eq__(self, other: WolABaseUnique) -> bool:
         return self is other
@@ -72,16 +80,18 @@ class WolABaseUnique(AtomicBase):
         return 1
     
 
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Special symbols like "Inifinity" will also match _Symbol, and we rule them out.
 
         Notice: the "Global`" prefix is removed
         '''
-        return set(Var(v.name.replace("Global`", ""))
-                   for v in session.evaluate(wl.Cases(wl.List(self.expr), wl.Blank(wl.Symbol), wl.Infinity)) 
-                   if isinstance(v, WLSymbol)
-                   )
+        if self._variables is None:
+            self._variables = frozenset(Var(v.name.replace("Global`", ""))
+                    for v in evaluate(wl.Cases(wl.List(self.expr), wl.Blank(wl.Symbol), wl.Infinity)) 
+                    if isinstance(v, WLSymbol)
+                    )
+        return self._variables
 
     def eq_satisfiable(self, other) -> bool:
         '''
@@ -95,7 +105,7 @@ class WolABaseUnique(AtomicBase):
         
         else:
             vars = wl.List(*[wl.Symbol(v.name) for v in common_vars])
-            res = session.evaluate(wl.FindInstance(wl.Equal(self.expr, other.expr), vars))
+            res = evaluate(wl.FindInstance(wl.Equal(self.expr, other.expr), vars))
             return res != ()
         
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
@@ -129,6 +139,9 @@ class WolCScalarUnique(ComplexScalar):
     # this list of all complex scalars constructed
     table : set[WolCScalarUnique] = set()
 
+    # the search and the insertion are atomic, so that the normalizations in several threads agree on the instances
+    table_lock = threading.RLock()
+
     def __new__(cls, expr : str | Any):
         '''
         return the unique instance equivalent to expr
@@ -137,17 +150,21 @@ class WolCScalarUnique(ComplexScalar):
         if isinstance(expr, str):
             expr = wlexpr(expr)
 
-        # search for the existing expressions
-        for instance in WolCScalarUnique.table:
-            if session.evaluate(wl.FullSimplify(wl.Equal(instance.expr, expr))) == True:
-                return instance
-            
-        # simplify, append the new instance in the table
-        expr = session.evaluate(wl.FullSimplify(expr))
-        obj = object.__new__(cls)
-        obj.expr = expr
-        WolCScalarUnique.table.add(obj)
-        return obj
+        with WolCScalarUnique.table_lock:
+            # search for the existing expressions
+            for instance in WolCScalarUnique.table:
+                if evaluate_cached(wl.FullSimplify(wl.Equal(instance.expr, expr)), simplify_cache) == True:
+                    return instance
+                
+            # simplify, append the new instance in the table
+            expr = evaluate_cached(wl.FullSimplify(expr), simplify_cache)
+            obj = object.__new__(cls)
+            obj.expr = expr
+            WolCScalarUnique.table.add(obj)
+            return obj
+    
+    def __getnewargs__(self) -> Tuple:
+        return (self.expr,)
         
     def __init__(self, expr : str | Any):
         self.expr : Any
@@ -174,13 +191,13 @@ class WolCScalarUnique(ComplexScalar):
         return WolCScalarUnique(wl.Times(c1.expr, c2.expr))
     
     def __str__(self) -> str:
-        return str(session.evaluate(wl.ToString(self.expr)))
+        return to_string(self.expr)
     
     def __repr__(self) -> str:
         return f'WolCScalarUnique({self.expr})'
     
     def tex(self) -> str:
-        return r"\left (" + session.evaluate(wl.ToString(self.expr, wl.TeXForm)) + r"\right )"
+        return r"\left (" + to_tex(self.expr) + r"\right )"
     
     def __eq__(self, other: WolCScalarUnique) -> bool:
         return self is other
@@ -192,14 +209,16 @@ class WolCScalarUnique(ComplexScalar):
     def size(self) -> int:
         return 1
     
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Special symbols like "Inifinity" will also match _Symbol, and we rule them out.
         '''
-        return set(Var(v.name.replace("Global`", ""))
-                   for v in session.evaluate(wl.Cases(wl.List(self.expr), wl.Blank(wl.Symbol), wl.Infinity)) 
-                   if isinstance(v, WLSymbol)
-                   )
+        if self._variables is None:
+            self._variables = frozenset(Var(v.name.replace("Global`", ""))
+                    for v in evaluate(wl.Cases(wl.List(self.expr), wl.Blank(wl.Symbol), wl.Infinity)) 
+                    if isinstance(v, WLSymbol)
+                    )
+        return self._variables
 
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
 
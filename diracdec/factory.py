@@ -7,26 +7,39 @@ The script to construct rewriting systems and corresponding parsers with differe
 
 
 from typing import Any
-from .theory.trs import Term, Var, Subst
+import os
+from .theory.trs import Term, Var, Subst, TRS, Stage, StagedTRS
 from .components import wolU
 
+#########################
+# choose the components
+
+from .backends import wolfram_backend
+from .components import wolfram_simple, py_cscalar, str_abase
+
+# "wolfram" or "python". The default is Wolfram, if a kernel is installed. The Python backend needs no Wolfram Engine,
+# but its normal form decides fewer identities between the scalars than FullSimplify (see `backends.sym_backend`).
+backend = os.environ.get("DIRACDEC_BACKEND", "python" if wolfram_backend.session is None else "wolfram")
+
+if backend == "wolfram":
+    CScalar, ABase = wolfram_simple.WolframCScalar, wolfram_simple.WolframABase
+elif backend == "python":
+    CScalar, ABase = py_cscalar.PyCScalar, str_abase.StrABase
+else:
+    raise ValueError(f"Unknown backend '{backend}' in DIRACDEC_BACKEND. It should be 'wolfram' or 'python'.")
+
 #########################
 # build some parser
 
 from .theory import dirac, delta_ext
-from .components import wolfram_simple
 from .parser import construct_parser
 
-parse = construct_parser(
-    wolfram_simple.WolframCScalar,
-    wolfram_simple.WolframABase)
-
-### ALL WOLFRAM BACKEND
+parse = construct_parser(CScalar, ABase)
 
 
 dirac_trs = dirac.construct_trs(
-    wolfram_simple.WolframCScalar,
-    wolfram_simple.WolframABase, 
+    CScalar,
+    ABase, 
     parse
     )
 
@@ -37,18 +50,17 @@ def dirac_cime2_file(path: str):
 
 dirac_delta_trs = delta_ext.modify_trs(
     dirac_trs, 
-    wolfram_simple.WolframCScalar,
-    wolfram_simple.WolframABase
+    CScalar,
+    ABase
     )
 
 ############# with big-op
 
 from .theory import dirac_bigop, delta_ext
-from .components import wolfram_simple
 
 dirac_bigop_trs, juxt = dirac_bigop.construct_trs(
-    wolfram_simple.WolframCScalar, 
-    wolfram_simple.WolframABase, 
+    CScalar,
+    ABase, 
     parse
     )
     
@@ -56,13 +68,13 @@ dirac_bigop_trs, juxt = dirac_bigop.construct_trs(
 
 dirac_bigop_delta_trs = delta_ext.modify_trs(
     dirac_bigop_trs, 
-    wolfram_simple.WolframCScalar, 
-    wolfram_simple.WolframABase
+    CScalar,
+    ABase
     )
 
 entry_trs = dirac_bigop.construct_entry_trs(
-    wolfram_simple.WolframCScalar, 
-    wolfram_simple.WolframABase, 
+    CScalar,
+    ABase, 
     parse
 )
 
@@ -71,35 +83,58 @@ entry_trs = dirac_bigop.construct_entry_trs(
 
 from .theory import dirac_labelled
 label_trs = dirac_labelled.construct_trs(
-    wolfram_simple.WolframCScalar, 
-    wolfram_simple.WolframABase, 
+    CScalar,
+    ABase, 
     parse
 )
 
 ###############################################
 # out-of-box interface
 
-def normalize(s : str) -> dict:
+from .persistent_cache import PersistentCache
+
+# the scalar backend of the TRS above, which is a part of the keys in the persistent cache
+scalar_backend = CScalar.__module__
+
+def cached_normalize(trs: TRS, t: Term, cache: PersistentCache | None) -> Term:
+    if cache is None:
+        return trs.normalize(t)
+    return cache.normalize(trs, t, scalar_backend)
+
+def normalize(s : str, cache: PersistentCache | None = None) -> dict:
     '''
     The most powerful interface to normalize a term.
+
+    cache: the persistent cache of normal forms to use.
     '''
     t = parse(s)
-    norm_t = dirac_bigop_delta_trs.normalize(t)
+    norm_t = cached_normalize(dirac_bigop_delta_trs, t, cache)
     res = {}
     res['norm-term'] = str(norm_t)
     return res
 
-def eq_check(s1: str, s2: str) -> bool:
+def eq_check_pipeline(cache: PersistentCache | None = None) -> StagedTRS:
+    '''
+    The pipeline of eq_check: normalize, apply the juxtapose rule once, and unify the Wolfram scalars.
+
+    cache: the persistent cache of normal forms to use.
+    '''
+    return StagedTRS([
+        Stage("normalize", lambda t: cached_normalize(dirac_bigop_delta_trs.fork(), t, cache)),
+        Stage("juxtapose", juxt),
+        Stage("unique", wolU),
+    ])
+
+def eq_check(s1: str, s2: str, cache: PersistentCache | None = None) -> bool:
     '''
     The most powerful interface to check the equality of two terms.
+
+    cache: the persistent cache of normal forms to use.
     '''
 
     t1 = parse(s1)
     t2 = parse(s2)
-    norm_t1 = dirac_bigop_delta_trs.normalize(t1)
-    norm_t2 = dirac_bigop_delta_trs.normalize(t2)
-
-    post_proc_t1 = wolU(juxt(norm_t1))
-    post_proc_t2 = wolU(juxt(norm_t2))
 
-    return post_proc_t1 == post_proc_t2
\ No newline at end of file
+    # the two sides are normalized concurrently with a kernel pool (see wolfram_backend.kernel_pool)
+    norm_t1, norm_t2 = wolfram_backend.concurrent_map(lambda t: eq_check_pipeline(cache).normalize(t), (t1, t2))
+    return norm_t1 == norm_t2
\ No newline at end of file
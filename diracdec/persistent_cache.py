@@ -0,0 +1,148 @@
+'''
+The persistent cache of normal forms, stored in a sqlite database file. It is intended for the repeated verification runs on the same terms.
+'''
+
+from __future__ import annotations
+
+import pickle
+import sqlite3
+import threading
+
+from .theory.trs import TRS, Term, Var, StdTerm, BindVarTerm, MultiBindTerm, InternTable, new_var, new_var_ls
+
+
+def alpha_key(term: Term) -> str:
+    '''
+    The key of the term in the cache, which is invariant under the renaming of bind variables.
+
+    The bind variables are renamed by their binding depth to the names b0, b1, ... that avoid the free variables.
+    (The permutations of the bind variables of MultiBindTerm are not canonicalized, and such terms only miss the cache.)
+    '''
+    free = term.variables()
+    names : list[Var] = []
+
+    def name(level: int) -> Var:
+        while len(names) <= level:
+            names.append(new_var(free | set(names), prefix = "b"))
+        return names[level]
+    
+    def rename(term: Term, level: int) -> Term:
+        if isinstance(term, BindVarTerm):
+            v = name(level)
+            if term.bind_var != v:
+                term = term.rename_bind(v)
+            body = rename(term.body, level + 1)
+            return term if body is term.body else type(term)(term.bind_var, body)
+
+        elif isinstance(term, MultiBindTerm):
+            bind_vars = tuple(v[0] if isinstance(v, tuple) else v for v in term.bind_vars)
+            new_vars = tuple(name(level + i) for i in range(len(bind_vars)))
+            if bind_vars != new_vars:
+                # rename through fresh variables if the names overlap
+                if set(bind_vars) & set(new_vars):
+                    term = term.rename_bind(new_var_ls(term.variables() | set(bind_vars) | set(new_vars), len(bind_vars)))
+                term = term.rename_bind(new_vars)
+            body = rename(term.body, level + len(bind_vars))
+            return term if body is term.body else type(term)(term.bind_vars, body)
+
+        elif isinstance(term, StdTerm):
+            args = tuple(rename(arg, level) for arg in term.args)
+            if all(new is old for new, old in zip(args, term.args)):
+                return term
+            return type(term)(*args)
+
+        else:
+            return term
+
+    return repr(rename(term, 0))
+
+
+class PersistentCache:
+    '''
+    The cache from (term, TRS, scalar backend) to the normal form, stored in a sqlite database file.
+
+    The terms are identified by their repr up to the renaming of bind variables (see alpha_key), and the TRS by its fingerprint.
+    The fingerprint does not cover the implementation of the rewriting methods, so the cache should be cleared when it changes.
+
+    The normal forms are pickled, and loading a pickle can execute arbitrary code. So the database file must be trusted:
+    only open the files created by yourself, and never the ones from other sources.
+    The loaded normal forms are interned if hash-consing is on.
+    The cache can be shared by the normalizations in several threads.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread = False)
+        self.lock = threading.Lock()
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS normal_forms (
+                term TEXT NOT NULL,
+                trs TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                normal_form BLOB NOT NULL,
+                PRIMARY KEY (term, trs, backend)
+            )
+        ''')
+        self.conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> PersistentCache:
+        return self
+    
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM normal_forms').fetchone()[0]
+
+    def get(self, trs_fingerprint: str, backend: str, term: Term) -> Term | None:
+        key = alpha_key(term)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT normal_form FROM normal_forms WHERE term = ? AND trs = ? AND backend = ?',
+                (key, trs_fingerprint, backend)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self.hits += 1
+        normal_form = pickle.loads(row[0])
+
+        # the unpickled terms are new objects, which are not in the active intern table
+        if InternTable.active is not None:
+            normal_form = InternTable.active.intern(normal_form)
+        return normal_form
+    
+    def put(self, trs_fingerprint: str, backend: str, term: Term, normal_form: Term) -> None:
+        key, blob = alpha_key(term), pickle.dumps(normal_form)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO normal_forms VALUES (?, ?, ?, ?)',
+                (key, trs_fingerprint, backend, blob)
+            )
+            self.conn.commit()
+
+    def normalize(self, trs: TRS, term: Term, backend: str = '') -> Term:
+        '''
+        Normalize the term with the TRS, using the cached normal form if it exists.
+
+        backend: the name of the scalar backend of the TRS.
+        '''
+        trs_fingerprint = trs.fingerprint()
+        normal_form = self.get(trs_fingerprint, backend, term)
+        if normal_form is None:
+            normal_form = trs.normalize(term)
+            self.put(trs_fingerprint, backend, term, normal_form)
+        return normal_form
+
+    def clear(self) -> None:
+        self.conn.execute('DELETE FROM normal_forms')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self.conn.close()
@@ -12,8 +12,6 @@ from ..dirac import *
 from ..atomic_base import AtomicBase
 from ..complex_scalar import ComplexScalar
 
-from ...backends import wolfram_backend
-
 def modify_trs(
         trs: TRS, 
         CScalar: Type[ComplexScalar], 
@@ -39,6 +37,7 @@ def modify_trs(
         "DELTA_AST_1",
         lhs = "DELTA(s, s)",
         rhs = "C(1)",
+        heads=(ScalarDelta,),
         rewrite_method=delta_ast_1_rewrite
     )
     rules.append(DELTA_AST_1)
@@ -56,6 +55,7 @@ def modify_trs(
         "DELTA_AST_2",
         lhs = "DELTA(s, t) && s, t are base atoms && s = t is not satisfiable",
         rhs = "C(0)",
+        heads=(ScalarDelta,),
         rewrite_method=delta_ast_2_rewrite
     )
     rules.append(DELTA_AST_2)
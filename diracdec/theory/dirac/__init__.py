@@ -1,5 +1,5 @@
 from .syntax import *
 
-from .trs import construct_trs, dirac_cime2_file
+from .trs import construct_trs, dirac_cime2_file, EXPANSION_RULES
 
 from .parser_build import construct_parser
\ No newline at end of file
@@ -15,6 +15,30 @@ from .syntax import *
 from ..atomic_base import AtomicBase
 from ..complex_scalar import ComplexScalar
 
+# the rules that expand the terms, which are tried in the last stage of StagedTRS.split(trs, EXPANSION_RULES)
+# the staged split is opt-in: the shipped TRSs still try all the rules together, which gives the same normal forms faster
+EXPANSION_RULES = [
+    'SCR-DOT-5',
+    'SCR-DOT-6',
+    'SCR-5',
+
+    'KET-MLT-6',
+    'KET-MLT-7',
+    'BRA-MLT-6',
+    'BRA-MLT-7',
+    'OPT-MLT-9',
+    'OPT-MLT-10',
+
+    'OPT-OUTER-5',
+    'OPT-OUTER-6',
+    'KET-TSR-6',
+    'KET-TSR-7',
+    'BRA-TSR-6',
+    'BRA-TSR-7',
+    'OPT-TSR-7',
+    'OPT-TSR-8',
+]
+
 def construct_trs(
         CScalar: Type[ComplexScalar], 
         ABase: Type[AtomicBase], 
@@ -38,6 +62,7 @@ def construct_trs(
         "ATOMIC-BASE",
         lhs = "a",
         rhs = "a",
+        heads=(ABase,),
         rewrite_method=atomic_base_rewrite,
         rule_repr="(* base -> simp(base) *)"
     ))
@@ -49,6 +74,7 @@ def construct_trs(
         "COMPLEX-SCALAR",
         lhs = "a",
         rhs = "a",
+        heads=(CScalar,),
         rewrite_method=complex_scalar_rewrite,
         rule_repr="(* complex -> simp(complex) *)"
     ))
@@ -92,6 +118,7 @@ def construct_trs(
         "DELTA-1",
         lhs = "DELTA(s, PAIR(t1, t2))",
         rhs = "DELTA(FST(s), t1) MLTS DELTA(SND(s), t2)",
+        heads=(ScalarDelta,),
         rewrite_method=delta_1_rewrite
     ))
 
@@ -118,6 +145,7 @@ def construct_trs(
         "DELTA-2",
         lhs = "DELTA(FST(s), FST(t)) MLTS DELTA(SND(s), SND(t))",
         rhs = "DELTA(s, t)",
+        heads=(ScalarMlt,),
         rewrite_method=delta_2_rewrite
     ))
     
@@ -134,6 +162,7 @@ def construct_trs(
         "SCR-COP-1",
         lhs="C(0) ADDS a", 
         rhs="a",
+        heads=(ScalarAdd,),
         rewrite_method=scr_cop_1_rewrite
     ))
 
@@ -153,21 +182,23 @@ def construct_trs(
         "SCR-COP-2",
         lhs="C(a) ADDS C(b)", 
         rhs="C(a + b)",
+        heads=(ScalarAdd,),
         rewrite_method=scr_cop_2_rewrite
     ))
 
     def scr_cop_3_rewrite(rule, trs, term):
         if isinstance(term, ScalarAdd):
-            for i in range(len(term.args)):
-                for j in range(i+1, len(term.args)):
-                    if term.args[i] == term.args[j]:
-                        new_args = (ScalarMlt(C2, term.args[i]),) + term.remained_terms(i, j)
-                        return ScalarAdd(*new_args)
+            pair = term.equal_pair()
+            if pair is not None:
+                i, j = pair
+                new_args = (ScalarMlt(C2, term.args[i]),) + term.remained_terms(i, j)
+                return ScalarAdd(*new_args)
                     
     trs.append(Rule(
         "SCR-COP-3",
         lhs = "S0 ADDS S0",
         rhs = "C(1 + 1) MLTS S0",
+        heads=(ScalarAdd,),
         rewrite_method=scr_cop_3_rewrite
     ))
 
@@ -188,6 +219,7 @@ def construct_trs(
         "SCR-COP-4",
         lhs = "(C(a) MLTS S0) ADDS S0",
         rhs = "C(a + 1) MLTS S0",
+        heads=(ScalarAdd,),
         rewrite_method=scr_cop_4_rewrite
     ))
 
@@ -212,6 +244,7 @@ def construct_trs(
         "SCR-COP-5",
         lhs = "(C(a) MLTS S0) ADDS (C(b) MLTS S0)",
         rhs = "C(a + b) MLTS S0",
+        heads=(ScalarAdd,),
         rewrite_method=scr_cop_5_rewrite
     ))
 
@@ -224,6 +257,7 @@ def construct_trs(
         "SCR-COP-6",
         lhs="C(0) MLTS a", 
         rhs="C(0)",
+        heads=(ScalarMlt,),
         rewrite_method=scr_cop_6_rewrite
     ))
 
@@ -236,6 +270,7 @@ def construct_trs(
         "SCR-COP-7",
         lhs="C(1) MLTS a", 
         rhs="a",
+        heads=(ScalarMlt,),
         rewrite_method=scr_cop_7_rewrite
     ))
 
@@ -255,6 +290,7 @@ def construct_trs(
         "SCR-COP-8",
         lhs="C(a) MLTS C(b)",
         rhs="C(a * b)",
+        heads=(ScalarMlt,),
         rewrite_method=scr_cop_8_rewrite
     ))
 
@@ -269,6 +305,7 @@ def construct_trs(
         "SCR-COP-9",
         lhs="a MLTS (b ADDS c)",
         rhs="(a MLTS b) ADDS (a MLTS c)",
+        heads=(ScalarMlt,),
         rewrite_method=scr_cop_9_rewrite
     ))
 
@@ -281,6 +318,7 @@ def construct_trs(
         "SCR-COP-10",
         lhs="CONJS(C(a))",
         rhs="C(a ^*)",
+        heads=(ScalarConj,),
         rewrite_method=scr_cop_10_rewrite
     ))
         
@@ -294,6 +332,7 @@ def construct_trs(
         "SCR-COP-11",
         lhs="CONJS(DELTA(a, b))",
         rhs="DELTA(a, b)",
+        heads=(ScalarConj,),
         rewrite_method=scr_cop_11_rewrite
     ))
 
@@ -307,6 +346,7 @@ def construct_trs(
         "SCR-COP-12",
         lhs="CONJS(a ADDS b)",
         rhs="CONJS(a) ADDS CONJS(b)",
+        heads=(ScalarConj,),
         rewrite_method=scr_cop_12_rewrite
     ))
 
@@ -320,6 +360,7 @@ def construct_trs(
         "SCR-COP-13",
         lhs="CONJS(a MLTS b)",
         rhs="CONJS(a) MLTS CONJS(b)",
+        heads=(ScalarConj,),
         rewrite_method=scr_cop_13_rewrite
     ))
 
@@ -373,6 +414,7 @@ def construct_trs(
         "SCR-DOT-5",
         lhs = "(B1 ADD B2) DOT K0",
         rhs = "(B1 DOT K0) ADDS (B2 DOT K0)",
+        heads=(ScalarDot,),
         rewrite_method=scr_dot_5_rewrite
     ))
 
@@ -385,6 +427,7 @@ def construct_trs(
         "SCR-DOT-6",
         lhs = "B0 DOT (K1 ADD K2)",
         rhs = "(B0 DOT K1) ADDS (B0 DOT K2)",
+        heads=(ScalarDot,),
         rewrite_method=scr_dot_6_rewrite
     ))
 
@@ -467,6 +510,7 @@ def construct_trs(
         "ADJ-UNI-4",
         lhs = "ADJ(X1 ADD X2)",
         rhs = "ADJ(X1) ADD ADJ(X2)",
+        heads=(Adj,),
         rewrite_method=adj_uni_4_rewrite
     ))
 
@@ -574,6 +618,7 @@ def construct_trs(
         "SCR-5",
         lhs = "S0 SCR (X1 ADD X2)",
         rhs = "(S0 SCR X1) ADD (S0 SCR X2)",
+        heads=(Scal,),
         rewrite_method=scr_5_rewrite
     ))
 
@@ -587,52 +632,62 @@ def construct_trs(
         "ADD-1",
         lhs = "0X ADD X0",
         rhs = "X0",
+        heads=(Add,),
         rewrite_method=add_1_rewrite
     ))
 
     def add_2_rewrite(rule, trs, term):
         if isinstance(term, Add):
-            for i in range(len(term.args)):
-                for j in range(i+1, len(term.args)):
-                    if term.args[i] == term.args[j]:
-                        new_args = (Scal(C2, term.args[i]),) + term.remained_terms(i, j)
-                        return Add(*new_args)
+            pair = term.equal_pair()
+            if pair is not None:
+                i, j = pair
+                new_args = (Scal(C2, term.args[i]),) + term.remained_terms(i, j)
+                return Add(*new_args)
     trs.append(Rule(
         "ADD-2",
         lhs = "X0 ADD X0",
         rhs = "C(1 + 1) SCR X0",
+        heads=(Add,),
         rewrite_method=add_2_rewrite
     ))
 
     def add_3_rewrite(rule, trs, term):
         if isinstance(term, Add):
+            # the index of the arguments
+            index = {}
+            for j in range(len(term.args)):
+                index.setdefault(term.args[j], j)
+
             for i in range(len(term.args)):
                 if isinstance(term.args[i], Scal):
-                    for j in range(len(term.args)):
-                        if term.args[i].args[1] == term.args[j]:
-                            new_args = (
-                                Scal(ScalarAdd(term.args[i].args[0], C1), term.args[j]),) + term.remained_terms(i, j)
-                            return Add(*new_args)
+                    j = index.get(term.args[i].args[1])
+                    if j is not None:
+                        new_args = (
+                            Scal(ScalarAdd(term.args[i].args[0], C1), term.args[j]),) + term.remained_terms(i, j)
+                        return Add(*new_args)
     trs.append(Rule(
         "ADD-3",
         lhs = "(S0 SCR X0) ADD X0",
         rhs = "(S0 ADDS C(1)) SCR X0",
+        heads=(Add,),
         rewrite_method=add_3_rewrite
     ))
 
     def add_4_rewrite(rule, trs, term):
         if isinstance(term, Add):
-            for i in range(len(term.args)):
-                if isinstance(term.args[i], Scal):
-                    for j in range(i+1, len(term.args)):
-                        if isinstance(term.args[j], Scal):
-                            if term.args[i].args[1] == term.args[j].args[1]:
-                                new_args = (Scal(ScalarAdd(term.args[i].args[0], term.args[j].args[0]), term.args[i].args[1]),) + term.remained_terms(i, j)
-                                return Add(*new_args)
+            # the index of the scaled terms
+            index = {}
+            for j in range(len(term.args)):
+                if isinstance(term.args[j], Scal):
+                    i = index.setdefault(term.args[j].args[1], j)
+                    if i != j:
+                        new_args = (Scal(ScalarAdd(term.args[i].args[0], term.args[j].args[0]), term.args[i].args[1]),) + term.remained_terms(i, j)
+                        return Add(*new_args)
     trs.append(Rule(
         "ADD-4",
         lhs = "(S1 SCR X0) ADD (S2 SCR X0)",
         rhs = "(S1 ADDS S2) SCR X0",
+        heads=(Add,),
         rewrite_method=add_4_rewrite
     ))
 
@@ -680,6 +735,7 @@ def construct_trs(
         "KET-MLT-6",
         lhs = "(O1 ADD O2) MLTK K0",
         rhs = "(O1 MLTK K0) ADD (O2 MLTK K0)",
+        heads=(KetApply,),
         rewrite_method=ket_mlt_6_rewrite
     ))
 
@@ -692,6 +748,7 @@ def construct_trs(
         "KET-MLT-7",
         lhs = "O0 MLTK (K1 ADD K2)",
         rhs = "(O0 MLTK K1) ADD (O0 MLTK K2)",
+        heads=(KetApply,),
         rewrite_method=ket_mlt_7_rewrite
     ))
 
@@ -765,6 +822,7 @@ def construct_trs(
         "KET-TSR-6",
         lhs = "(K1 ADD K2) TSRK K0",
         rhs = "(K1 TSRK K0) ADD (K2 TSRK K0)",
+        heads=(KetTensor,),
         rewrite_method=ket_tsr_6_rewrite
     ))
 
@@ -776,6 +834,7 @@ def construct_trs(
         "KET-TSR-7",
         lhs = "K0 TSRK (K1 ADD K2)",
         rhs = "(K0 TSRK K1) ADD (K0 TSRK K2)",
+        heads=(KetTensor,),
         rewrite_method=ket_tsr_7_rewrite
     ))
 
@@ -822,6 +881,7 @@ def construct_trs(
         "BRA-MLT-6",
         lhs = "B0 MLTB (O1 ADD O2)",
         rhs = "(B0 MLTB O1) ADD (B0 MLTB O2)",
+        heads=(BraApply,),
         rewrite_method=bra_mlt_6_rewrite
     ))
 
@@ -834,6 +894,7 @@ def construct_trs(
         "BRA-MLT-7",
         lhs = "(B1 ADD B2) MLTB O0",
         rhs = "(B1 MLTB O0) ADD (B2 MLTB O0)",
+        heads=(BraApply,),
         rewrite_method=bra_mlt_7_rewrite
     ))
 
@@ -907,6 +968,7 @@ def construct_trs(
         "BRA-TSR-6",
         lhs = "(B1 ADD B2) TSRB B0",
         rhs = "(B1 TSRB B0) ADD (B2 TSRB B0)",
+        heads=(BraTensor,),
         rewrite_method=bra_tsr_6_rewrite
     ))
 
@@ -918,6 +980,7 @@ def construct_trs(
         "BRA-TSR-7",
         lhs = "B0 TSRB (B1 ADD B2)",
         rhs = "(B0 TSRB B1) ADD (B0 TSRB B2)",
+        heads=(BraTensor,),
         rewrite_method=bra_tsr_7_rewrite
     ))
 
@@ -957,6 +1020,7 @@ def construct_trs(
         "OPT-OUTER-5",
         lhs = "(K1 ADD K2) OUTER B0",
         rhs = "(K1 OUTER B0) ADD (K2 OUTER B0)",
+        heads=(OpOuter,),
         rewrite_method=opt_outer_5_rewrite
     ))
 
@@ -968,6 +1032,7 @@ def construct_trs(
         "OPT-OUTER-6",
         lhs = "K0 OUTER (B1 ADD B2)",
         rhs = "(K0 OUTER B1) ADD (K0 OUTER B2)",
+        heads=(OpOuter,),
         rewrite_method=opt_outer_6_rewrite
     ))
 
@@ -1028,6 +1093,7 @@ def construct_trs(
         "OPT-MLT-9",
         lhs = "(O1 ADD O2) MLTO O0",
         rhs = "(O1 MLTO O0) ADD (O2 MLTO O0)",
+        heads=(OpApply,),
         rewrite_method=opt_mlt_9_rewrite
     ))
 
@@ -1039,6 +1105,7 @@ def construct_trs(
         "OPT-MLT-10",
         lhs = "O0 MLTO (O1 ADD O2)",
         rhs = "(O0 MLTO O1) ADD (O0 MLTO O2)",
+        heads=(OpApply,),
         rewrite_method=opt_mlt_10_rewrite
     ))
 
@@ -1105,6 +1172,7 @@ def construct_trs(
         "OPT-TSR-7",
         lhs = "(O1 ADD O2) TSRO O0",
         rhs = "(O1 TSRO O0) ADD (O2 TSRO O0)",
+        heads=(OpTensor,),
         rewrite_method=opt_tsr_7_rewrite
     ))
 
@@ -1116,6 +1184,7 @@ def construct_trs(
         "OPT-TSR-8",
         lhs = "O0 TSRO (O1 ADD O2)",
         rhs = "(O0 TSRO O1) ADD (O0 TSRO O2)",
+        heads=(OpTensor,),
         rewrite_method=opt_tsr_8_rewrite
     ))
 
@@ -1230,25 +1299,7 @@ def construct_trs(
             'OPT-TSR-6',
 
             # expansion in the last stage
-            'SCR-DOT-5',
-            'SCR-DOT-6',
-            'SCR-5',
-
-            'KET-MLT-6',
-            'KET-MLT-7',
-            'BRA-MLT-6',
-            'BRA-MLT-7',
-            'OPT-MLT-9',
-            'OPT-MLT-10',
-
-            'OPT-OUTER-5',
-            'OPT-OUTER-6',
-            'KET-TSR-6',
-            'KET-TSR-7',
-            'BRA-TSR-6',
-            'BRA-TSR-7',
-            'OPT-TSR-7',
-            'OPT-TSR-8',
+            *EXPANSION_RULES,
         ]
     )
 
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from ..dirac.syntax import *
 
-from ..trs import BindVarTerm, MultiBindTerm, new_var, new_var_ls, seq_content_eq
+from ..trs import BindVarTerm, MultiBindTerm, new_var, new_var_ls, seq_content_eq, subst_untouched, BOUND_VAR
 
 import itertools
 
@@ -150,21 +150,37 @@ class SumTemplate(MultiBindTerm):
         
         else:
             return False
+        
+    def __hash__(self) -> int:
+        '''
+        The hash is invariant under alpha-conversion and the permutation of bind variables.
+        '''
+        if self._hash is None:
+            sub = Subst({v: BOUND_VAR for v, t in self.bind_vars})
+            self._hash = hash((
+                type(self), 
+                tuple(sorted(hash(t.subst(sub)) for v, t in self.bind_vars)), 
+                self.body.subst(sub)))
+        return self._hash
 
     
     def size(self) -> int:
-        return self.body.size() + len(self.bind_vars) + 1
+        if self._size is None:
+            self._size = self.body.size() + len(self.bind_vars) + 1
+        return self._size
     
-    def variables(self) -> set[Var]:
-        bind_vars = set()
-        for v, t in self.bind_vars:
-            bind_vars.add(v.name)
-
-        set_vars = set()
-        for v, t in self.bind_vars:
-            set_vars |= t.variables()
-
-        return (self.body.variables() | set_vars) - bind_vars
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            bind_vars = set()
+            for v, t in self.bind_vars:
+                bind_vars.add(v.name)
+
+            set_vars = set()
+            for v, t in self.bind_vars:
+                set_vars |= t.variables()
+
+            self._variables = (self.body.variables() | set_vars) - bind_vars
+        return self._variables
     
     @property
     def is_ground(self) -> bool:
@@ -201,6 +217,8 @@ class SumTemplate(MultiBindTerm):
         check whether the bind variable appears in sigma.
         change the bind variable if so.
         '''
+        if subst_untouched(self, sigma):
+            return self
 
         if not isinstance(sigma, Subst):
             sigma = Subst(sigma)
@@ -64,6 +64,7 @@ def construct_trs(
         "TRANS-UNI-5",
         lhs = "TP(X1 ADD X2)",
         rhs = "TP(X1) ADD TP(X2)",
+        heads=(Transpose,),
         rewrite_method=trans_5_rewrite
     ))
 
@@ -139,6 +140,7 @@ def construct_trs(
         "SET-SIMP-1",
         lhs = "USET UNION X",
         rhs = "USET",
+        heads = (UnionSet,),
         rewrite_method = set_simp_1_rewrite
     ))
 
@@ -152,6 +154,7 @@ def construct_trs(
         "SET-SIMP-2",
         lhs = "ESET UNION X",
         rhs = "X",
+        heads = (UnionSet,),
         rewrite_method = set_simp_2_rewrite
     ))
 
@@ -165,6 +168,7 @@ def construct_trs(
         "SUM-ELIM-1",
         lhs = "SUMS(i, T, C(0))",
         rhs = "C(0)",
+        heads = (SumS,),
         rewrite_method = sum_elim_1_rewrite
     ))
 
@@ -176,6 +180,7 @@ def construct_trs(
         "SUM-ELIM-2",
         lhs = "SUM(i, T, 0X)",
         rhs = "0X",
+        heads = (Sum,),
         rewrite_method = sum_elim_2_rewrite
     ))
 
@@ -200,6 +205,7 @@ def construct_trs(
         "SUM-ELIM-3",
         lhs = "SUMS(i, USET, DELTA(i, s))",
         rhs = "C(1)",
+        heads = (SumS,),
         rewrite_method = sum_elim_3_rewrite
     ))
 
@@ -225,6 +231,7 @@ def construct_trs(
         "SUM-ELIM-4",
         lhs = "SUMS(i, USET, DELTA(i, s) MLTS S0)",
         rhs = "S0[i:=s]",
+        heads = (SumS,),
         rewrite_method = sum_elim_4_rewrite
     ))
 
@@ -252,6 +259,7 @@ def construct_trs(
         "SUM-ELIM-5",
         lhs = "SUM(i, USET, DELTA(i, s) SCR X)",
         rhs = "X[i:=s]",
+        heads = (Sum,),
         rewrite_method = sum_elim_5_rewrite
     ))
 
@@ -280,6 +288,7 @@ def construct_trs(
         "SUM-ELIM-6",
         lhs = "SUM(i, USET, (DELTA(i, s) MLTS S0) SCR X)",
         rhs = "S[i:=s] SCR X[i:=s]",
+        heads = (Sum,),
         rewrite_method = sum_elim_6_rewrite
     ))
 
@@ -295,6 +304,7 @@ def construct_trs(
         "SUM-DIST-1",
         rhs = "SUMS(i, T, S1 MLTS X)",
         lhs = "SUMS(i, T, S1) MLTS X",
+        heads = (SumS,),
         rewrite_method = sum_dist_1_rewrite
     ))
 
@@ -306,6 +316,7 @@ def construct_trs(
         "SUM-DIST-2",
         lhs = "CONJS(SUMS(i, T, A))",
         rhs = "SUMS(i, T, CONJS(A))",
+        heads = (ScalarConj,),
         rewrite_method = sum_dist_2_rewrite
     ))
 
@@ -318,6 +329,7 @@ def construct_trs(
         "SUM-DIST-3",
         lhs = "ADJ(SUM(i, T, A))",
         rhs = "SUM(i, T, ADJ(A))",
+        heads = (Adj,),
         rewrite_method = sum_dist_3_rewrite
     ))
 
@@ -329,6 +341,7 @@ def construct_trs(
         "SUM-DIST-4",
         lhs = "TP(SUM(i, T, A))",
         rhs = "SUM(i, T, TP(A))",
+        heads = (Transpose,),
         rewrite_method = sum_dist_4_rewrite
     ))
 
@@ -341,6 +354,7 @@ def construct_trs(
         "SUM-DIST-5",
         lhs = "SUM(i, T, X SCR A)",
         rhs = "X SCR SUM(i, T, A)",
+        heads = (Sum,),
         rewrite_method = sum_dist_5_rewrite
     ))
 
@@ -352,6 +366,7 @@ def construct_trs(
         "SUM-DIST-6",
         lhs = "SUM(i, T, A SCR X)",
         rhs = "SUMS(i, T, A) SCR X",
+        heads = (Sum,),
         rewrite_method = sum_dist_6_rewrite
     ))
     
@@ -366,6 +381,7 @@ def construct_trs(
         "SUM-DIST-7",
         lhs = "SUM(x, T, x1 {DOT/MLTK/MLTB/MLTO} X)",
         rhs = "SUM(x, T, x1) {DOT/MLTK/MLTB/MLTO} X",
+        heads = (Sum,),
         rewrite_method = sum_dist_7_rewrite
     ))
 
@@ -377,6 +393,7 @@ def construct_trs(
         "SUM-DIST-8",
         lhs = "SUM(x, T, X {DOT/MLTK/MLTB/MLTO} x2)",
         rhs = "X {DOT/MLTK/MLTB/MLTO} SUM(x, T, x2)",
+        heads = (Sum,),
         rewrite_method = sum_dist_8_rewrite
     ))
 
@@ -389,6 +406,7 @@ def construct_trs(
         "SUM-DIST-9",
         lhs = "SUM(x, T, x1 {TSRK/TSRB/OUTER/TSRO} X)",
         rhs = "SUM(x, T, x1) {TSRK/TSRB/OUTER/TSRO} X",
+        heads = (Sum,),
         rewrite_method = sum_dist_9_rewrite
     ))
 
@@ -401,6 +419,7 @@ def construct_trs(
         "SUM-DIST-10",
         lhs = "SUM(x, T, X {TSRK/TSRB/OUTER/TSRO} x2)",
         rhs = "X {TSRK/TSRB/OUTER/TSRO} SUM(x, T, x2)",
+        heads = (Sum,),
         rewrite_method = sum_dist_10_rewrite
     ))
 
@@ -422,6 +441,7 @@ def construct_trs(
         "SUM-COMP-1",
         lhs = "SUM(i, T, A) {DOT/MLTK/MLTB/MLTO} X (with side condition)",
         rhs = "SUM(i, T, A {DOT/MLTK/MLTB/MLTO} X)",
+        heads = (ScalarDot, KetApply, BraApply, OpApply),
         rewrite_method = sum_comp_1_rewrite
     ))
 
@@ -443,6 +463,7 @@ def construct_trs(
         "SUM-COMP-2",
         lhs = "X {DOT/MLTK/MLTB/MLTO} SUM(i, T, A) (with side condition)",
         rhs = "SUM(i, T, X {DOT/MLTK/MLTB/MLTO} A)",
+        heads = (ScalarDot, KetApply, BraApply, OpApply),
         rewrite_method = sum_comp_2_rewrite
     ))
 
@@ -462,6 +483,7 @@ def construct_trs(
         "SUM-COMP-3",
         lhs = "SUM(i, T, A) {TSRK/TSRB/OUTER/TSRO} X (with side condition)",
         rhs = "SUM(i, T, A {TSRK/TSRB/OUTER/TSRO} X)",
+        heads = (KetTensor, BraTensor, OpOuter, OpTensor),
         rewrite_method = sum_comp_3_rewrite
     ))
 
@@ -481,6 +503,7 @@ def construct_trs(
         "SUM-COMP-4",
         lhs = "X {TSRK/TSRB/OUTER/TSRO} SUM(i, T, A) (with side condition)",
         rhs = "SUM(i, T, X {TSRK/TSRB/OUTER/TSRO} A)",
+        heads = (KetTensor, BraTensor, OpOuter, OpTensor),
         rewrite_method = sum_comp_4_rewrite
     ))
 
@@ -494,6 +517,7 @@ def construct_trs(
         "SUM-COMP-5",
         lhs = "SUMS(i, T, S0)",
         rhs = "SUMS(i, T, C(1)) MLTS S0",
+        heads = (SumS,),
         rewrite_method = sum_comp_5_rewrite
     ))
 
@@ -507,6 +531,7 @@ def construct_trs(
         "SUM-COMP-6",
         lhs = "SUM(i, T, A)",
         rhs = "SUMS(i, T, C(1)) SCR A",
+        heads = (Sum,),
         rewrite_method = sum_comp_6_rewrite
     ))
 
@@ -580,6 +605,7 @@ def construct_trs(
         "BETA-REDUCTION",
         lhs = "APPLY(LAMBDA(x, A), a)",
         rhs = "A[x := a]",
+        heads = (Apply,),
         rewrite_method = beta_reduction_rewrite,
         rule_repr = "(* beta-reduction: APPLY(LAMBDA(x, A), a) -> A[x := a] ;*)",
     ))
@@ -641,6 +667,7 @@ def construct_entry_trs(
         "SUM-ELIM-7",
         lhs = "SUM(i, (BRA(i) DOT K0) SCR KET(i))",
         rhs = "K0",
+        heads = (Sum,),
         rewrite_method = sum_elim_7_rewrite
     ))
 
@@ -659,6 +686,7 @@ def construct_entry_trs(
         "SUM-ELIM-8",
         lhs = "SUM(i, (B0 DOT KET(i)) SCR BRA(i))",
         rhs = "B0",
+        heads = (Sum,),
         rewrite_method = sum_elim_8_rewrite
     ))
 
@@ -689,6 +717,7 @@ def construct_entry_trs(
         "SUM-ELIM-9",
         lhs = "SUM(i, SUM(j, (BRA(i) DOT (A MLTK KET(j))) SCR (KET(i) OUTER BRA(j)) ))",
         rhs = "A",
+        heads = (Sum,),
         rewrite_method = sum_elim_9_rewrite
     ))
 
@@ -721,6 +750,7 @@ def construct_entry_trs(
         "SUM-ELIM-10",
         lhs = "SUM(i, SUM(j, (BRA(i) DOT (A MLTK KET(j))) SCR (KET(j) OUTER BRA(i)) ))",
         rhs = "TP(A)",
+        heads = (Sum,),
         rewrite_method = sum_elim_10_rewrite
     ))
 
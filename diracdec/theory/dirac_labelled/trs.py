@@ -54,6 +54,7 @@ def construct_trs(
         "RSET-1",
         lhs = "S UNIONR ESETR",
         rhs = "S",
+        heads=(UnionRSet,),
         rewrite_method=rset_1_rewrite
     ))
 
@@ -67,6 +68,7 @@ def construct_trs(
         "RSET-2",
         lhs = "S UNIONR S",
         rhs = "S",
+        heads=(UnionRSet,),
         rewrite_method=rset_2_rewrite
     ))
 
@@ -85,6 +87,7 @@ def construct_trs(
         "RSET-3",
         lhs = "SETR(FST(R)) UNIONR SETR(SND(R))",
         rhs = "R",
+        heads=(UnionRSet,),
         rewrite_method=rset_3_rewrite
     ))
     
@@ -116,6 +119,7 @@ def construct_trs(
         "RSET-7",
         lhs = " (S1 UNIONR S2) SUBR X ",
         rhs = " (S1 SUBR X) UNIONR (S2 SUBR X) ",
+        heads=(SubRSet,),
         rewrite_method=rset_7_rewrite
     ))
 
@@ -128,6 +132,7 @@ def construct_trs(
         "RSET-8",
         lhs = " S1 SUBR (S2 UNIONR S3) ",
         rhs = " (S1 SUBR S2) SUBR S3 ",
+        heads=(SubRSet,),
         rewrite_method=rset_8_rewrite
     ))
 
@@ -145,6 +150,7 @@ def construct_trs(
         "RSET-9",
         lhs = " SETR(R1) UNIONR SETR(R2) (R1 is in R2) ",
         rhs = "SETR(R2)",
+        heads=(UnionRSet,),
         rewrite_method=rset_9_rewrite
     ))
 
@@ -156,6 +162,7 @@ def construct_trs(
         "RSET-10",
         lhs = " SETR(R1) SUBR SETR(R2) (R1 is in R2) ",
         rhs = "ESETR",
+        heads=(SubRSet,),
         rewrite_method=rset_10_rewrite
     ))
 
@@ -171,6 +178,7 @@ def construct_trs(
         "RSET-11",
         lhs = " SETR(R2) SUBR SETR(R1) (R1 is in R2) ",
         rhs = " SETR(FSTR(R2) SUBR SETR(R1)) UNIONR SETR(SNDR(R2) SUBR SETR(R1)) ",
+        heads=(SubRSet,),
         rewrite_method=rset_11_rewrite
     ))
 
@@ -182,6 +190,7 @@ def construct_trs(
         "RSET-12",
         lhs = " SETR(R1) SUBR SETR(R2) (R1 || R2) ",
         rhs = " SETR(R1) ",
+        heads=(SubRSet,),
         rewrite_method=rset_12_rewrite
     ))
 
@@ -251,6 +260,7 @@ def construct_trs(
         "TSR-DECOMP-3",
         lhs = " (A {TSRK/TSRB/TSRO} B)[PAIRR(Q, R)] ",
         rhs = " (A[Q]) {TSRKL/TSRBL/TSROL} (B[R]) ",
+        heads = (Labelled1,),
         rewrite_method = tsr_decomp_3_rewrite
     ))
 
@@ -284,6 +294,7 @@ def construct_trs(
         "TSR-COMP-1",
         lhs = " (A[FSTR(Q); FSTR(R)]) TSROL (B[SNDR(Q); SNDR(R)]) ",
         rhs = " (A TSRO B)[Q; R] ",
+        heads = (OpTensorL,),
         rewrite_method = tsr_comp_1_rewrite
     ))
 
@@ -310,6 +321,7 @@ def construct_trs(
         "TSR-COMP-2",
         lhs = " (A[FSTR(Q)]) {TSRKL/TSRBL/TSROL} (B[SNDR(Q)]) ",
         rhs = " (A {TSRK/TSRB/TSRO} B)[Q] ",
+        heads = (KetTensorL, BraTensorL, OpTensorL),
         rewrite_method = tsr_comp_2_rewrite
     ))
     
@@ -322,6 +334,7 @@ def construct_trs(
         "DOT-TSR-1",
         lhs = " (A[Q;R]) MLTOL (B[S;T]) (R || S) ",
         rhs = " (A[Q;R]) TSROL (B[S;T]) ",
+        heads = (OpApplyL,),
         rewrite_method = dot_tsr_1_rewrite
     ))
 
@@ -358,6 +371,7 @@ def construct_trs(
         "LABEL-LIFT-5",
         lhs = " (A ADD B)[R] ",
         rhs = " (A[R]) ADD (B[R]) ",
+        heads = (Labelled1,),
         rewrite_method = label_lift_5_rewrite
     ))
 
@@ -368,6 +382,7 @@ def construct_trs(
         "LABEL-LIFT-6",
         lhs = " (A ADD B)[Q; R] ",
         rhs = " (A[Q; R]) ADD (B[Q; R]) ",
+        heads = (Labelled2,),
         rewrite_method = label_lift_6_rewrite
     ))
 
@@ -388,6 +403,7 @@ def construct_trs(
         "LABEL-LIFT-7",
         lhs = " A ADD A ",
         rhs = " C(1+1) SCR A ",
+        heads = (Add,),
         rewrite_method = label_lift_7_rewrite
     ))
 
@@ -397,7 +413,8 @@ def construct_trs(
             for i in range(len(term.args)):
                 ti = term.args[i]
                 if isinstance(ti, Scal):
-                    for j in range(i + 1, len(term.args)):
+                    # A can be on either side of (S SCR A) in the arguments
+                    for j in range(len(term.args)):
                         tj = term.args[j]
                         if ti.args[1] == tj:
                             return Add(
@@ -410,6 +427,7 @@ def construct_trs(
         "LABEL-LIFT-8",
         lhs = " (S SCR A) ADD A ",
         rhs = " (S ADDS C(1)) SCR A ",
+        heads = (Add,),
         rewrite_method = label_lift_8_rewrite
     ))
 
@@ -431,6 +449,7 @@ def construct_trs(
         "LABEL-LIFT-9",
         lhs = " (S1 SCR A) ADD (S2 SCR A) ",
         rhs = " (S1 ADDS S2) SCR A ",
+        heads = (Add,),
         rewrite_method = label_lift_9_rewrite
     ))
 
@@ -481,6 +500,7 @@ def construct_trs(
         "LABEL-LIFT-15",
         lhs = " (A[R]) {MLTOL/MLTKL/MLTBL} (B[R]) ",
         rhs = " (A {MLTOL/MLTKL/MLTBL} B)[R] ",
+        heads = (KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_lift_15_rewrite
     ))
 
@@ -532,6 +552,7 @@ def construct_trs(
         "OPT-EXT-2",
         lhs = "(A[Q]) MLTOL (B[R]) (Q is a subterm of R at p)",
         rhs = "(ext(A, p) MLTO B)[R]",
+        heads = (OpApplyL,),
         rewrite_method = opt_ext_2_rewrite
     ))
 
@@ -558,6 +579,7 @@ def construct_trs(
         "OPT-EXT-3",
         lhs = "(A[Q]) MLTOL (B[R]) (R is a subterm of Q at p)",
         rhs = "(A MLTO ext(B, p))[Q]",
+        heads = (OpApplyL,),
         rewrite_method = opt_ext_3_rewrite
     ))
 
@@ -570,6 +592,7 @@ def construct_trs(
         "LABEL-SUM-1",
         lhs = " SUM(x, T, A)[R] ",
         rhs = " SUM(x, T, A[R]) ",
+        heads = (Labelled1,),
         rewrite_method = label_sum_1_rewrite
     ))
 
@@ -581,6 +604,7 @@ def construct_trs(
         "LABEL-SUM-2",
         lhs = " SUM(x, T, A)[Q; R] ",
         rhs = " SUM(x, T, A[Q; R]) ",
+        heads = (Labelled2,),
         rewrite_method = label_sum_2_rewrite
     ))
 
@@ -606,6 +630,7 @@ def construct_trs(
         "LABEL-SUM-3",
         lhs = "SUM(i, T, A) {DOT/MLTK/MLTB/MLTO} X (with side condition)",
         rhs = "SUM(i, T, A {DOT/MLTK/MLTB/MLTO} X)",
+        heads = (ScalarDotL, KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_sum_3_rewrite
     ))
 
@@ -630,6 +655,7 @@ def construct_trs(
         "LABEL-SUM-4",
         lhs = "X {DOT/MLTK/MLTB/MLTO} SUM(i, T, A) (with side condition)",
         rhs = "SUM(i, T, X {DOT/MLTK/MLTB/MLTO} A)",
+        heads = (ScalarDotL, KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_sum_4_rewrite
     ))
 
@@ -693,6 +719,7 @@ def construct_trs(
         "LABEL-TEMP-1",
         lhs = "A[R] {MLTO/MLTK/MLTB} (B[Q] TSRL X) (R is in Q)",
         rhs = "(A[R] {MLTO/MLTK/MLTB} B[Q]) TSRL X",
+        heads = (KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_temp_1_rewrite
     ))
 
@@ -718,6 +745,7 @@ def construct_trs(
         "LABEL-TEMP-1B",
         lhs = "(Y TSRBL B[R]) MLTBL (K[R] OUTERL X)",
         rhs = "(B DOT K) SCR (Y TSRBL X)",
+        heads = (BraApplyL,),
         rewrite_method = label_temp_1b_rewrite
     ))
 
@@ -739,6 +767,7 @@ def construct_trs(
         "LABEL-TEMP-2",
         lhs = "(A[Q] TSRL X) {MLTO/MLTK/MLTB} B[R] (R is in Q)",
         rhs = "(A[Q] {MLTO/MLTK/MLTB} B[R]) TSRL X",
+        heads = (KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_temp_2_rewrite
     ))
 
@@ -764,6 +793,7 @@ def construct_trs(
         "LABEL-TEMP-2B",
         lhs = "(X OUTERL B[R]) MLTKL (K[R] TSRKL Y)",
         rhs = "(B DOT K) SCR (X TSRKL Y)",
+        heads = (KetApplyL,),
         rewrite_method = label_temp_2b_rewrite
     ))
 
@@ -786,6 +816,7 @@ def construct_trs(
         "LABEL-TEMP-3",
         lhs = "A[R] DOT (B[R] TSRL X)",
         rhs = "(A[R] DOT B[R]) SCR X",
+        heads = (ScalarDot,),
         rewrite_method = label_temp_3_rewrite
     ))
 
@@ -802,6 +833,7 @@ def construct_trs(
         "LABEL-TEMP-4",
         lhs = "(A[R] TSRL X) DOT B[R]",
         rhs = "(A[R] DOT B[R]) SCR X",
+        heads = (ScalarDot,),
         rewrite_method = label_temp_4_rewrite
     ))
 
@@ -833,6 +865,7 @@ def construct_trs(
         "LABEL-TEMP-8",
         lhs = "1O {MLTOL/MLTBL/MLTKL} X",
         rhs = "X",
+        heads=(KetApplyL, BraApplyL, OpApplyL),
         rewrite_method=label_temp_8_rewrite
     ))
 
@@ -844,6 +877,7 @@ def construct_trs(
         "LABEL-TEMP-9",
         lhs = "X {MLTOL/MLTBL/MLTKL} 1O",
         rhs = "X",
+        heads=(KetApplyL, BraApplyL, OpApplyL),
         rewrite_method=label_temp_9_rewrite
     ))
 
@@ -924,6 +958,7 @@ def construct_trs(
         "LABEL-TEMP-16",
         lhs = "A {MLTOL/MLTKL/MLTBL/MLTO/DOTL} (B ADD C)",
         rhs = "A {MLTOL/MLTKL/MLTBL/MLTO/DOTL} B ADD A {MLTOL/MLTKL/MLTBL/MLTO/DOTL} C",
+        heads=(KetApplyL, BraApplyL, OpApplyL, ScalarDotL),
         rewrite_method=label_temp_16_rewrite
     ))
 
@@ -935,6 +970,7 @@ def construct_trs(
         "LABEL-TEMP-17",
         lhs = "(A ADD B) {MLTOL/MLTKL/MLTBL/MLTO/DOTL} C",
         rhs = "A {MLTOL/MLTKL/MLTBL/MLTO/DOTL} C ADD B {MLTOL/MLTKL/MLTBL/MLTO/DOTL} C",
+        heads=(KetApplyL, BraApplyL, OpApplyL, ScalarDotL),
         rewrite_method=label_temp_17_rewrite
     ))
 
@@ -945,6 +981,7 @@ def construct_trs(
         "LABEL-TEMP-18",
         lhs = " 0X {TSR} X / X {TSR} 0X",
         rhs = " 0X ",
+        heads = (OpTensorL, BraTensorL, KetTensorL, OpOuterL),
         rewrite_method = label_temp_18_rewrite
     ))
 
@@ -956,6 +993,7 @@ def construct_trs(
         "LABEL-TEMP-18B",
         lhs = " 0X {DOT} X / X {DOT} 0X",
         rhs = " 0X ",
+        heads = (KetApplyL, BraApplyL, OpApplyL),
         rewrite_method = label_temp_18B_rewrite
     ))
 
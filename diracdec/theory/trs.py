@@ -4,9 +4,16 @@ The architecture of the term rewriting system
 
 from __future__ import annotations
 import sys
-from typing import Callable, Set, TextIO, Tuple, Any, Dict, List, Sequence, Container, Type
+import copy
+import time
+import json
+import weakref
+import threading
+import hashlib
+from contextlib import contextmanager
+from typing import Callable, Set, TextIO, Tuple, Any, Dict, List, Sequence, Container, Type, Iterator
 
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 
 from IPython.core.display import Image
 
@@ -15,6 +22,7 @@ from ..backends import render_tex, render_tex_to_svg
 
 
 import itertools
+from collections import OrderedDict
 from itertools import combinations
 
 def new_var(vars: Container[str|Var], prefix: str = "x") -> Var:
@@ -38,6 +46,13 @@ def new_var_ls(vars: Container[str|Var], count:int, prefix: str = "x") -> tuple[
         i += 1
     return tuple(res)
 
+def subst_untouched(term: Term, sigma: Subst | dict[Var, Term]) -> bool:
+    '''
+    check whether the substitution leaves the term unchanged, i.e. no free variable of the term is in the domain of sigma.
+    '''
+    data = sigma.data if isinstance(sigma, Subst) else sigma
+    return not any(var in data for var in term.variables())
+
 def seq_content_eq(ls1: Sequence, ls2: Sequence) -> bool:
     '''
     check whether the contents of the sequences are equal up to permutations
@@ -53,13 +68,57 @@ def seq_content_eq(ls1: Sequence, ls2: Sequence) -> bool:
                 return False
         return True
 
-class Term(ABC):
+class TermMeta(ABCMeta):
+    '''
+    The metaclass of terms. When hash-consing is on, the constructed terms are replaced by their interned representatives.
+    '''
+    def __call__(cls, *args, **kwargs):
+        term = super().__call__(*args, **kwargs)
+
+        # note: constructors like AC may return the argument directly, which may not be a term
+        if InternTable.active is not None and isinstance(term, Term):
+            return InternTable.active.intern(term)
+        return term
+
+
+class Term(ABC, metaclass=TermMeta):
     '''
     The abstract class for all terms in the term rewriting system.
     '''
     fsymbol_print = 'term'
     fsymbol = 'TERM'
 
+    # the nf_token of the TRS under which this term is known to be in normal form (set during the rewriting)
+    nf_token : object | None = None
+
+    # the cached hash value
+    _hash : int | None = None
+
+    # the cached key of the term order, and whether the key decides the equality
+    _order_key : Tuple | None = None
+    _order_exact : bool = True
+
+    # the intern table that holds this term, and whether the equality with other terms in the table is the identity
+    interned : InternTable | None = None
+    intern_exact : bool = False
+
+    # whether the equality of the atoms of this class is decided by their repr.
+    # It should be False for the atoms whose __eq__ falls back to a semantic comparison.
+    syntactic_eq : bool = True
+
+    # the cached free variables and size (terms are immutable)
+    _variables : frozenset[Var] | None = None
+    _size : int | None = None
+
+    def __getstate__(self) -> dict:
+        '''
+        The cached attributes are not pickled, since they are only valid in the current process (or refer to the term itself).
+        '''
+        state = self.__dict__.copy()
+        for attr in ('nf_token', '_hash', '_order_key', '_order_exact', 'interned', 'intern_exact', '_variables', '_size'):
+            state.pop(attr, None)
+        return state
+
     @abstractmethod
     def __str__(self) -> str:
         pass
@@ -89,7 +148,10 @@ class Term(ABC):
         pass
 
     @abstractmethod
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
+        '''
+        Return the free variables. The result is cached, so it should not be modified.
+        '''
         pass
 
     @property
@@ -100,6 +162,21 @@ class Term(ABC):
     def subst(self, sigma : Subst | dict[Var, Term]) -> Term:
         pass
 
+    def order_key(self) -> Tuple:
+        '''
+        Return the key of a total order on terms, which is used to store the arguments of AC symbols in a canonical order.
+        Equal terms have equal keys. The converse holds if order_exact is True. (For atoms it relies on the requirement on repr.)
+        '''
+        if self._order_key is None:
+            self._order_key = (2, type(self).__qualname__, repr(self))
+            self._order_exact = self.syntactic_eq
+        return self._order_key
+    
+    @property
+    def order_exact(self) -> bool:
+        self.order_key()
+        return self._order_exact
+
 
     #############################################
     # utilities
@@ -149,8 +226,13 @@ class Var(Term):
     def __hash__(self):
         return hash(self.name)
     
-    def variables(self) -> set[Var]:
-        return {self}
+    def order_key(self) -> Tuple:
+        return (0, self.name)
+    
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = frozenset((self,))
+        return self._variables
     
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
         if isinstance(sigma, Subst):
@@ -188,8 +270,22 @@ class StdTerm(Term):
         if self is other:
             return True
         
+        if both_interned(self, other):
+            return False
+        
         return isinstance(other, type(self)) and self.args == other.args
     
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((type(self), self.args))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        if self._order_key is None:
+            self._order_key = (1, self.fsymbol, type(self).__qualname__, tuple(arg.order_key() for arg in self.args))
+            self._order_exact = all(arg.order_exact for arg in self.args)
+        return self._order_key
+    
     def __getitem__(self, index) -> Term:
         return self.args[index]
     
@@ -197,22 +293,30 @@ class StdTerm(Term):
         '''
         Return the size of the abstract syntax tree.
         '''
-        return 1 + sum(arg.size() for arg in self.args)
+        if self._size is None:
+            self._size = 1 + sum(arg.size() for arg in self.args)
+        return self._size
     
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Return a set of (the name of) all variables in this term. (including the bind variables)
         '''
-        res = set()
-        for arg in self.args:
-            res |= arg.variables()
-        return res
+        if self._variables is None:
+            self._variables = frozenset().union(*(arg.variables() for arg in self.args))
+        return self._variables
     
     def subst(self, sigma : Subst | dict[Var, Term]) -> Term:
+        '''
+        The subterms untouched by the substitution are shared, and the term is only rebuilt when some argument changes.
+        '''
+        if subst_untouched(self, sigma):
+            return self
         
         new_args = tuple(
             arg.subst(sigma) for arg in self.args
         )
+        if all(new_arg is arg for new_arg, arg in zip(new_args, self.args)):
+            return self
         return type(self)(*new_args)
 
 class BindVarTerm(Term):
@@ -259,15 +363,34 @@ class BindVarTerm(Term):
         
         else:
             return False
+        
+    def __hash__(self) -> int:
+        '''
+        The hash is invariant under alpha-conversion.
+        '''
+        if self._hash is None:
+            self._hash = hash((type(self), self.body.subst({self.bind_var: BOUND_VAR})))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        '''
+        The key is not invariant under alpha-conversion, so it does not decide the equality.
+        '''
+        if self._order_key is None:
+            self._order_key = (3, type(self).__qualname__, self.bind_var.name, self.body.order_key())
+            self._order_exact = False
+        return self._order_key
     
     def size(self) -> int:
-        return self.body.size() + 2
+        if self._size is None:
+            self._size = self.body.size() + 2
+        return self._size
     
     
-    def variables(self) -> set[Var]:
-        res = self.body.variables()
-        res.discard(self.bind_var)
-        return res
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = self.body.variables() - {self.bind_var}
+        return self._variables
 
 
     def rename_bind(self, new_v: Var) -> BindVarTerm:
@@ -293,6 +416,9 @@ class BindVarTerm(Term):
         check whether the bind variable appears in sigma.
         change the bind variable if so.
         '''
+        if subst_untouched(self, sigma):
+            return self
+        
         if isinstance(sigma, dict):
             sigma = Subst(sigma)
 
@@ -316,6 +442,9 @@ class MultiBindTerm(Term):
             obj = object.__new__(cls)
             MultiBindTerm.__init__(obj, bind_vars, body)
             return obj
+        
+    def __getnewargs__(self) -> Tuple:
+        return (self.bind_vars, self.body)
 
     def __init__(self, bind_vars: Tuple[Var, ...], body: Term):
         # try to flatten
@@ -363,15 +492,35 @@ class MultiBindTerm(Term):
         
         else:
             return False
+        
+    def __hash__(self) -> int:
+        '''
+        The hash is invariant under alpha-conversion and the permutation of bind variables.
+        '''
+        if self._hash is None:
+            self._hash = hash((type(self), len(self.bind_vars), self.body.subst({v: BOUND_VAR for v in self.bind_vars})))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        '''
+        The key is not invariant under alpha-conversion, so it does not decide the equality.
+        '''
+        if self._order_key is None:
+            self._order_key = (3, type(self).__qualname__, repr(self.bind_vars), self.body.order_key())
+            self._order_exact = False
+        return self._order_key
 
     
     def size(self) -> int:
-        return self.body.size() + len(self.bind_vars) + 1
+        if self._size is None:
+            self._size = self.body.size() + len(self.bind_vars) + 1
+        return self._size
     
     
-    def variables(self) -> set[Var]:
-        res = self.body.variables()
-        return res - set(self.bind_vars)
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = self.body.variables() - set(self.bind_vars)
+        return self._variables
 
 
     def rename_bind(self, new_vars: Tuple[Var, ...]) -> MultiBindTerm:
@@ -402,6 +551,9 @@ class MultiBindTerm(Term):
         check whether the bind variable appears in sigma.
         change the bind variable if so.
         '''
+        if subst_untouched(self, sigma):
+            return self
+        
         vset = sigma.domain | sigma.vrange
         avoided_term = self.avoid_vars(vset)
         return type(self)(avoided_term.bind_vars, avoided_term.body.subst(sigma))
@@ -439,10 +591,24 @@ class CommBinary(StdTerm):
         if self is other:
             return True
         
+        if both_interned(self, other):
+            return False
+        
         if isinstance(other, type(self)):
             return seq_content_eq(self.args, other.args)
         
         return False
+    
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((type(self), tuple(sorted(hash(arg) for arg in self.args))))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        if self._order_key is None:
+            self._order_key = (1, self.fsymbol, type(self).__qualname__, tuple(sorted(arg.order_key() for arg in self.args)))
+            self._order_exact = all(arg.order_exact for arg in self.args)
+        return self._order_key
 
     def __repr__(self) -> str:
         return f'{self.fsymbol}({repr(self.args[0])}, {repr(self.args[1])})'
@@ -466,6 +632,9 @@ class Assoc(StdTerm):
             Assoc.__init__(obj, *tup)
             return obj
         
+    def __getnewargs__(self) -> Tuple:
+        return self.args
+        
     def __init__(self, *tup: Any):
         '''
         The method of flatten the tuple of arguments for the associative symbol.
@@ -485,10 +654,16 @@ class Assoc(StdTerm):
         if self is other:
             return True
         
+        if both_interned(self, other):
+            return False
+        
         if isinstance(other, type(self)):
             return self.args == other.args
         
         return False
+    
+    def __hash__(self) -> int:
+        return StdTerm.__hash__(self)
 
 
     def __str__(self) -> str:
@@ -506,7 +681,7 @@ class Assoc(StdTerm):
         return rf' \left ({f" {self.fsymbol_print} ".join(map(lambda x: x.tex(), self.args))} \right )'
     
     def subst(self, sigma: Subst) -> Term:
-        return type(self)(*tuple(arg.subst(sigma) for arg in self.args))
+        return StdTerm.subst(self, sigma)
     
     def remained_terms(self, *idx: int):
         '''
@@ -517,6 +692,9 @@ class Assoc(StdTerm):
 class AC(StdTerm):
     arity = 2
 
+    # whether the arguments were sorted by exact keys (the keys of pending atoms are inexact, see WolframCScalar.order_key)
+    _sorted_exact : bool = True
+
     def __new__(cls, *tup: Any):
         '''
         return the element directly when tuple has only one element
@@ -530,10 +708,14 @@ class AC(StdTerm):
             AC.__init__(obj, *tup)
             return obj
         
+    def __getnewargs__(self) -> Tuple:
+        return self.args
+        
     def __init__(self, *tup: Any):
         '''
         The method of flatten the tuple of arguments for the ac_symbol.
         Assume that the items in tup are already flattened.
+        The arguments are stored in the order of Term.order_key.
         '''
 
         new_ls = []
@@ -543,16 +725,45 @@ class AC(StdTerm):
             else:
                 new_ls.append(item)
 
+        new_ls.sort(key = lambda item: item.order_key())
+        if not all(item.order_exact for item in new_ls):
+            self._sorted_exact = False
+
         self.args = tuple(new_ls)
 
     def __eq__(self, other) -> bool:
         if self is other:
             return True
         
+        if both_interned(self, other):
+            return False
+        
         if isinstance(other, type(self)):
+            if len(self.args) != len(other.args):
+                return False
+
+            if self.args == other.args:
+                return True
+            
+            # the arguments are sorted, so different sequences mean different terms unless the order is not exact
+            if self.order_exact and other.order_exact:
+                return False
+            
             return seq_content_eq(self.args, other.args)
         
         return False
+    
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((type(self), tuple(sorted(hash(arg) for arg in self.args))))
+        return self._hash
+
+    def order_key(self) -> Tuple:
+        if self._order_key is None:
+            keys = tuple(arg.order_key() for arg in self.args)
+            self._order_key = (1, self.fsymbol, type(self).__qualname__, keys if self._sorted_exact else tuple(sorted(keys)))
+            self._order_exact = self._sorted_exact and all(arg.order_exact for arg in self.args)
+        return self._order_key
 
 
     def __str__(self) -> str:
@@ -570,13 +781,142 @@ class AC(StdTerm):
         return rf' \left ({f" {self.fsymbol_print} ".join(map(lambda x: x.tex(), self.args))} \right )'
     
     def subst(self, sigma: Subst) -> Term:
-        return type(self)(*tuple(arg.subst(sigma) for arg in self.args))
+        return StdTerm.subst(self, sigma)
     
     def remained_terms(self, *idx: int):
         '''
         collect the terms that are not in the idx, and return as a new tuple.
         '''
         return tuple(self.args[i] for i in range(len(self.args)) if i not in idx)
+    
+    def equal_pair(self) -> Tuple[int, int] | None:
+        '''
+        return the indices (i, j) with i < j of two equal arguments, or None if there are no such arguments.
+        (Equal arguments are neighbours in the sorted arguments when the order is exact.)
+        '''
+        if self.order_exact:
+            for i in range(len(self.args) - 1):
+                if self.args[i] == self.args[i+1]:
+                    return i, i+1
+            return None
+
+        for i in range(len(self.args)):
+            for j in range(i+1, len(self.args)):
+                if self.args[i] == self.args[j]:
+                    return i, j
+        return None
+
+
+################################################################################
+# hash-consing
+
+def both_interned(t1: Term, t2: Any) -> bool:
+    '''
+    check whether the two terms are interned in the same table, so that they are equal only if they are identical.
+    '''
+    return t1.intern_exact and isinstance(t2, Term) and t2.intern_exact and t1.interned is t2.interned
+
+
+class InternTable:
+    '''
+    The table for hash-consing, which makes structurally equal terms the same object.
+
+    The terms are keyed by their symbols and the identities of their (interned) arguments. Other atoms are keyed by their repr, which relies on the requirement that the equivalence of repr is equivalent to that of terms.
+    (The atoms with a semantic equality, see Term.syntactic_eq, are still interned, but their equality is not the identity.)
+    Only weak references are kept, so that the terms are released when they are no longer used.
+    '''
+
+    # the table used for the term construction. None means hash-consing is off.
+    active : InternTable | None = None
+
+    def __init__(self):
+        self.table : weakref.WeakValueDictionary[Any, Term] = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def intern(self, term: Term) -> Term:
+        '''
+        return the interned representative of the term.
+        '''
+        if term.interned is self:
+            return term
+
+        if isinstance(term, Var):
+            key = (Var, term.name)
+            exact = True
+        
+        elif isinstance(term, StdTerm):
+            args = tuple(self.intern(arg) for arg in term.args)
+            if any(new is not old for new, old in zip(args, term.args)):
+                return self.intern(type(term)(*args))
+            
+            if isinstance(term, (AC, CommBinary)):
+                key = (type(term), tuple(sorted(map(id, args))))
+            else:
+                key = (type(term), tuple(map(id, args)))
+            exact = all(arg.intern_exact for arg in args)
+        
+        elif isinstance(term, Typing):
+            sub, T = self.intern(term.term), self.intern(term.type)
+            if sub is not term.term or T is not term.type:
+                return self.intern(type(term)(sub, T))
+            key = (type(term), id(sub), id(T))
+            exact = sub.intern_exact and T.intern_exact
+
+        elif isinstance(term, FunType):
+            arg_type, ret_type = self.intern(term.arg_type), self.intern(term.ret_type)
+            if arg_type is not term.arg_type or ret_type is not term.ret_type:
+                return self.intern(type(term)(arg_type, ret_type))
+            key = (type(term), id(arg_type), id(ret_type))
+            exact = arg_type.intern_exact and ret_type.intern_exact
+
+        # equality of bind terms is up to alpha-conversion, which is not decided by identity
+        elif isinstance(term, BindVarTerm):
+            body = self.intern(term.body)
+            if body is not term.body:
+                return self.intern(type(term)(term.bind_var, body))
+            key = (type(term), term.bind_var.name, id(body))
+            exact = False
+
+        elif isinstance(term, MultiBindTerm):
+            body = self.intern(term.body)
+            if body is not term.body:
+                return self.intern(type(term)(term.bind_vars, body))
+            key = (type(term), repr(term.bind_vars), id(body))
+            exact = False
+
+        else:
+            key = (type(term), repr(term))
+            exact = term.syntactic_eq
+
+        res = self.table.get(key)
+        if res is None:
+            term.interned = self
+            term.intern_exact = exact
+            self.table[key] = term
+            return term
+        return res
+    
+
+@contextmanager
+def hash_consing(table: InternTable | None = None):
+    '''
+    Turn on hash-consing in the context. The terms constructed in the context are interned in the table.
+    If table is None, the active table is used, or a new table is created.
+    '''
+    old_table = InternTable.active
+    if table is None:
+        table = InternTable() if old_table is None else old_table
+
+    InternTable.active = table
+    try:
+        yield table
+    finally:
+        InternTable.active = old_table
+
+# the variable that replaces the bind variables when calculating the hash of bind terms
+BOUND_VAR = Var("#")
 
 ################################################################################
 # universal algebra methods
@@ -665,12 +1005,45 @@ class Subst:
     def get_idempotent(self) -> Subst:
         '''
         Return the equivalent substitution to rewrite the term repeatedly until it's fixed
+
+        The definitions are sorted topologically by their dependencies, and each definition is substituted exactly once into the already closed ones, which are shared in the result.
+        Raise ValueError if the definitions are cyclic, since the repeated rewriting does not terminate then.
         '''
-        res = self
-        while not res.is_idempotent:
-            res = self.composite(res)
+        if self.is_idempotent:
+            return self
 
-        return res
+        # the dependencies and dependents of each definition
+        deps : dict[Var, set[Var]] = {}
+        dependents : dict[Var, list[Var]] = {var : [] for var in self.data}
+        for var, rhs in self.data.items():
+            deps[var] = {v for v in rhs.variables() if v in self.data}
+            for dep in deps[var]:
+                dependents[dep].append(var)
+
+        # Kahn's algorithm
+        order : list[Var] = []
+        waiting = {var : len(deps[var]) for var in self.data}
+        ready = [var for var in self.data if waiting[var] == 0]
+        while ready:
+            var = ready.pop()
+            order.append(var)
+            for dependent in dependents[var]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) < len(self.data):
+            cyclic = ", ".join(str(var) for var in self.data if waiting[var] > 0)
+            raise ValueError(f"The substitution has cyclic definitions and no idempotent equivalent. Involved variables: {cyclic}.")
+
+        closed : dict[Var, Term] = {}
+        for var in order:
+            if deps[var]:
+                closed[var] = self.data[var].subst({dep : closed[dep] for dep in deps[var]})
+            else:
+                closed[var] = self.data[var]
+
+        return Subst({var : closed[var] for var in self.data})
 
 ##################################################################
 # matching
@@ -701,12 +1074,29 @@ class Matching:
     
 
     def solve(self) -> list[Subst]:
-        subst_res = []
-        self.solve_matching(tuple(self.ineqs), {}, subst_res)
-        return subst_res
+        return self.all_solutions()
+    
+    def all_solutions(self) -> list[Subst]:
+        '''
+        return all the solutions of the matching problem.
+        '''
+        return list(self.iter_matching(tuple(self.ineqs), {}))
+    
+    def iter_solutions(self) -> Iterator[Subst]:
+        '''
+        return the generator of the solutions, which are calculated lazily.
+        '''
+        return self.iter_matching(tuple(self.ineqs), {})
 
     @staticmethod
     def solve_matching(ineqs: Tuple[Tuple[Term, Term], ...], pre_subst: dict[Var, Term], subst_res: list[Subst]) -> None:
+        subst_res.extend(Matching.iter_matching(ineqs, pre_subst))
+
+    @staticmethod
+    def iter_matching(ineqs: Tuple[Tuple[Term, Term], ...], pre_subst: dict[Var, Term]) -> Iterator[Subst]:
+        '''
+        The generator of the solutions. The branches (of commutative and AC symbols) are only explored when the previous solutions are consumed.
+        '''
 
         subst = pre_subst.copy()
 
@@ -735,33 +1125,15 @@ class Matching:
                         ineqs = ineqs[1:]
                         # check different situations, possibly branch into different cases
                         if isinstance(lhs, CommBinary):
-                            Matching.solve_matching(ineqs + ((lhs[0], rhs[0]), (lhs[1], rhs[1])), subst, subst_res)
-                            Matching.solve_matching(ineqs + ((lhs[0], rhs[1]), (lhs[1], rhs[0])), subst, subst_res)
+                            yield from Matching.iter_matching(ineqs + ((lhs[0], rhs[0]), (lhs[1], rhs[1])), subst)
+                            yield from Matching.iter_matching(ineqs + ((lhs[0], rhs[1]), (lhs[1], rhs[0])), subst)
                             return
 
                         if isinstance(lhs, AC):
                             assert isinstance(rhs, AC)
                             
-                            # get all possible bipartition of rhs.args
-                            bipartitions = []
-                            for i in range(1, len(rhs.args)):
-                                for comb in combinations(range(len(rhs.args)), i):
-                                    bipartitions.append(
-                                        (
-                                            type(rhs)(rhs.remained_terms(*comb)), 
-                                            type(rhs)(rhs.remained_terms(*tuple(i for i in range(len(rhs.args)) if i not in comb)))
-                                        )
-                                    )
-                            
-                            for bipartite in bipartitions:
-                                Matching.solve_matching(
-                                    ineqs + 
-                                    (
-                                        (lhs.args[0], type(rhs)(*bipartite[0])), 
-                                        (type(lhs)(*lhs.remained_terms(0)), type(rhs)(*bipartite[1]))
-                                    ), 
-                                    subst, subst_res
-                                )
+                            for ac_subst in Matching.iter_ac_matching(lhs, rhs, subst):
+                                yield from Matching.iter_matching(ineqs, ac_subst)
 
                             return
                         
@@ -795,14 +1167,99 @@ class Matching:
                 else:
                     return
                     
-        subst_res.append(Subst(subst))
+        yield Subst(subst)
+
+
+    @staticmethod
+    def iter_ac_matching(lhs: AC, rhs: AC, pre_subst: dict[Var, Term]) -> Iterator[dict[Var, Term]]:
+        '''
+        Match the AC pattern lhs against the term rhs with the same AC symbol, and generate the extended substitutions.
+
+        A non-variable argument of the pattern can only match a single argument of rhs (the arguments are flattened), so these arguments are matched first, only against the arguments with the same head symbol. The remaining arguments of rhs are then distributed to the variables.
+        '''
+        if len(rhs.args) < len(lhs.args):
+            return
+        
+        patterns = tuple(arg for arg in lhs.args if not isinstance(arg, Var))
+        variables = tuple(arg for arg in lhs.args if isinstance(arg, Var))
+
+        def match_patterns(k: int, remained: Tuple[Term, ...], subst: dict[Var, Term]) -> Iterator[dict[Var, Term]]:
+            if k == len(patterns):
+                yield from Matching.distribute_ac_args(type(rhs), variables, remained, subst)
+                return
+            
+            pattern = patterns[k]
+            last_tried = None
+            for i, arg in enumerate(remained):
+                if isinstance(pattern, StdTerm) and type(arg) is not type(pattern):
+                    continue
 
+                # equal arguments give the same solutions (and they are neighbours in the sorted arguments)
+                if last_tried is not None and arg == last_tried:
+                    continue
+                last_tried = arg
+
+                for sol in Matching.iter_matching(((pattern, arg),), subst):
+                    yield from match_patterns(k + 1, remained[:i] + remained[i+1:], sol.data)
+
+        yield from match_patterns(0, rhs.args, pre_subst)
+
+    @staticmethod
+    def distribute_ac_args(ac: Type[AC], variables: Tuple[Var, ...], remained: Tuple[Term, ...], subst: dict[Var, Term]) -> Iterator[dict[Var, Term]]:
+        '''
+        Generate the substitutions that assign every variable a nonempty part of the remained arguments, such that the parts make up all the remained arguments.
+        '''
+        if len(variables) == 0:
+            if len(remained) == 0:
+                yield subst
+            return
+        
+        if len(remained) < len(variables):
+            return
+        
+        # the variables already assigned go first, since they take fixed arguments
+        bound = [i for i, v in enumerate(variables) if v in subst]
+        if len(bound) > 0:
+            i = bound[0]
+            term = subst[variables[i]]
+            rest = list(remained)
+            for part in (term.args if type(term) is ac else (term,)):
+                for j in range(len(rest)):
+                    if rest[j] == part:
+                        del rest[j]
+                        break
+                else:
+                    return
+            yield from Matching.distribute_ac_args(ac, variables[:i] + variables[i+1:], tuple(rest), subst)
+            return
+        
+        var, rest_vars = variables[0], variables[1:]
+
+        # the last variable takes all the remained arguments
+        if len(rest_vars) == 0:
+            new_subst = subst.copy()
+            new_subst[var] = ac(*remained)
+            yield new_subst
+            return
+        
+        # otherwise try all the possible parts
+        for size in range(1, len(remained) - len(rest_vars) + 1):
+            for comb in combinations(range(len(remained)), size):
+                new_subst = subst.copy()
+                new_subst[var] = ac(*(remained[j] for j in comb))
+                yield from Matching.distribute_ac_args(ac, rest_vars, tuple(remained[j] for j in range(len(remained)) if j not in comb), new_subst)
 
     @staticmethod
     def single_match(lhs : Term, rhs : Term) -> list[Subst]:
-        subst_res = []
-        Matching.solve_matching(((lhs, rhs),), {}, subst_res)
-        return subst_res
+        return list(Matching.iter_matching(((lhs, rhs),), {}))
+    
+    @staticmethod
+    def first_match(lhs : Term, rhs : Term) -> Subst | None:
+        '''
+        return the first solution of matching lhs against rhs, or None if there is no solution.
+        (The other solutions are not calculated.)
+        '''
+        return next(Matching.iter_matching(((lhs, rhs),), {}), None)
     
 ############################################################################
 # term rewriting rules
@@ -812,15 +1269,35 @@ class Matching:
 
 
 
+def head_symbols(lhs: Term|str) -> Tuple[Type[Term], ...] | None:
+    '''
+    Return the head symbols of the terms that the pattern [lhs] can match, or None if it can match any term.
+    '''
+    if isinstance(lhs, StdTerm):
+        return (type(lhs),)
+    elif isinstance(lhs, Typing):
+        return (Typing,)
+    else:
+        return None
+
+
 class Rule:
+
+    # the compiled matcher of lhs -> rhs, built at the first use
+    _matcher : Callable[[Term], Term|None] | None = None
+    _matcher_ready : bool = False
+
     def __init__(self, 
                  rule_name: str,
                  lhs: Term|str, 
                  rhs: Term|str,
                  rewrite_method : Callable[[Rule, TRS, Term], Term|None],
-                 rule_repr: str|None = None):
+                 rule_repr: str|None = None,
+                 heads: Sequence[Type[Term]]|None = None):
         '''
         note: the rewrite_method checks whether the current rule can rewrite the given term (not including subterms)
+
+        heads: the classes of the terms that the rewrite_method can possibly rewrite. The rule will only be tried on instances of these classes. None means the rule will be tried on every term.
         '''
 
         assert isinstance(rule_repr, (str, type(None))), "The rule_repr should be a string or None."
@@ -830,6 +1307,7 @@ class Rule:
         self.rhs = rhs
         self.rewrite_method = rewrite_method
         self.rule_repr = rule_repr
+        self.heads = None if heads is None else tuple(heads)
 
     def __str__(self) -> str:
         return str(HSeqBlock(
@@ -860,7 +1338,131 @@ class Rule:
             new_lhs, 
             new_rhs, 
             self.rewrite_method, 
-            self.rule_repr)
+            self.rule_repr,
+            self.heads)
+    
+    @property
+    def matcher(self) -> Callable[[Term], Term|None] | None:
+        '''
+        The compiled matcher of lhs -> rhs (see compile_rule), or None if the rule cannot be compiled.
+        '''
+        if not self._matcher_ready:
+            self._matcher = compile_rule(self.lhs, self.rhs)
+            self._matcher_ready = True
+        return self._matcher
+
+    
+##################################################################
+# compiled matching
+# linear patterns without equational theories are compiled into Python functions, which check the symbols by `type(...) is` and access the arguments directly.
+
+def structural_subst(term: Term) -> bool:
+    '''
+    Whether the substitution method of the term only rebuilds it from the substituted arguments.
+    '''
+    return type(term).subst in (
+        StdTerm.subst, InfixBinary.subst, CommBinary.subst, Assoc.subst, AC.subst, StdTypeTerm.subst, Typing.subst)
+
+# the compiled sources. The sources do not depend on the variable names, so the renamed rules share the functions.
+compiled_sources : Dict[str, Callable[..., Callable[[Term], Term|None]]] = {}
+
+def compile_rule(lhs: Term|str, rhs: Term|str) -> Callable[[Term], Term|None] | None:
+    '''
+    Compile the rule lhs -> rhs into a function, which returns the rewriting result of the term (not including subterms) or None. The result is the same as matching lhs with Matching.first_match and applying the substitution on rhs.
+
+    Return None if lhs is not linear, or contains symbols with equational theories (commutative, associative and AC symbols).
+    '''
+    if not isinstance(lhs, Term) or not isinstance(rhs, Term):
+        return None
+    
+    consts : List[Any] = []
+    lines : List[str] = []
+    bound : Dict[Var, str] = {}
+    counter = itertools.count()
+
+    def const(obj: Any) -> str:
+        consts.append(obj)
+        return f'K{len(consts) - 1}'
+    
+    def local() -> str:
+        return f't{next(counter)}'
+
+    def compile_match(pattern: Term, name: str) -> bool:
+        if isinstance(pattern, Var):
+            if pattern in bound:
+                return False
+            bound[pattern] = name
+
+        elif isinstance(pattern, StdTerm):
+            if isinstance(pattern, (CommBinary, Assoc, AC)):
+                return False
+            
+            lines.append(f'if type({name}) is not {const(type(pattern))}: return None')
+            for i, arg in enumerate(pattern.args):
+                arg_name = local()
+                lines.append(f'{arg_name} = {name}.args[{i}]')
+                if not compile_match(arg, arg_name):
+                    return False
+
+        elif isinstance(pattern, Typing):
+            lines.append(f'if not isinstance({name}, {const(Typing)}): return None')
+            for attr in ('term', 'type'):
+                attr_name = local()
+                lines.append(f'{attr_name} = {name}.{attr}')
+                if not compile_match(getattr(pattern, attr), attr_name):
+                    return False
+
+        # terms outside the term rewriting system are compared directly
+        else:
+            lines.append(f'if not {const(pattern)} == {name}: return None')
+
+        return True
+    
+    uses_sigma = False
+
+    def compile_build(term: Term) -> Tuple[str, bool]:
+        '''
+        Return the expression constructing the substituted term, and whether the term is unchanged by the substitution.
+        '''
+        nonlocal uses_sigma
+
+        if isinstance(term, Var):
+            if term in bound:
+                return bound[term], False
+            return const(term), True
+        
+        if structural_subst(term):
+            args = (term.term, term.type) if isinstance(term, Typing) else term.args
+            compiled_args = [compile_build(arg) for arg in args]
+            if all(unchanged for _, unchanged in compiled_args):
+                return const(term), True
+            return f'{const(type(term))}({", ".join(expr for expr, _ in compiled_args)})', False
+        
+        # other terms (e.g. scalars) have their own substitution methods
+        uses_sigma = True
+        return f'{const(term)}.subst(sigma)', False
+    
+    if not compile_match(lhs, 'term'):
+        return None
+    
+    result, _ = compile_build(rhs)
+    if uses_sigma:
+        lines.append(f'sigma = {const(Subst)}({{{", ".join(f"{const(var)}: {name}" for var, name in bound.items())}}})')
+    lines.append(f'return {result}')
+
+    source = f'def make({", ".join(f"K{i}" for i in range(len(consts)))}):\n' \
+        + '    def matcher(term):\n' \
+        + ''.join(f'        {line}\n' for line in lines) \
+        + '    return matcher\n'
+    
+    make = compiled_sources.get(source)
+    if make is None:
+        namespace : Dict[str, Any] = {}
+        exec(source, namespace)
+        make = namespace['make']
+        compiled_sources[source] = make
+
+    return make(*consts)
 
     
 ##################################################################
@@ -874,11 +1476,15 @@ def canonical_rewrite(rule: CanonicalRule, trs : TRS, term : Term) -> Term | Non
 
     (The parameter [trs] is necessary to be consistent with customized rewriting methods.)
     '''
-    subst = Matching.single_match(rule.lhs, term)
-    if len(subst) == 0:
+    matcher = rule.matcher
+    if matcher is not None:
+        return matcher(term)
+    
+    subst = Matching.first_match(rule.lhs, term)
+    if subst is None:
         return None
     else:
-        return subst[0](rule.rhs)
+        return subst(rule.rhs)
         
 class CanonicalRule(Rule):
     def __init__(self, 
@@ -892,6 +1498,7 @@ class CanonicalRule(Rule):
         self.rhs = rhs
         self.rule_repr = rule_repr
         self.rewrite_method = canonical_rewrite
+        self.heads = head_symbols(lhs)
 
         
     def subst(self, sigma : Subst|dict[Var, Term]) -> CanonicalRule:
@@ -971,45 +1578,591 @@ let F = signature
 
 
 ######################################################################
-# term rewriting system
-        
-class TRS:
+# discrimination tree
 
-    def __init__(self, rules: Sequence[Rule]):
-        '''
-        side_info_procs provides methods to preprocess side informations (executed in sequence)
-        '''
-        self.rules : List[Rule] = []
-        self.extended_rules : List[Rule] = []
+def index_key(term: Term) -> Tuple[Any, Tuple[Term, ...]]:
+    '''
+    Return the key of the term in the discrimination tree, and the subterms to be indexed next.
+    The key is None for variables and the terms outside the term rewriting system, which are not indexed.
+    The arguments of symbols with equational theories are not indexed, since they are not matched positionally.
+    '''
+    if isinstance(term, StdTerm):
+        if isinstance(term, (CommBinary, Assoc, AC)):
+            return (type(term), 0), ()
+        return (type(term), len(term.args)), term.args
+    
+    if isinstance(term, Typing):
+        return Typing, (term.term, term.type)
+    
+    return None, ()
 
-        # the rule sequence that will be check during the rewriting. the order maters.
-        self.rule_seq : List[Rule] = []
 
-        self.rule_seq_name = []
+class DiscriminationTree:
+    '''
+    The index of patterns, which are flattened into the sequences of symbols (in preorder) and stored in a trie.
+    Variables (and the other terms not indexed) in the patterns become wildcards, which skip a whole subterm.
+    
+    Retrieving with a term returns the values of the patterns that can possibly match the term. (The matching still has to be checked.)
+    '''
+    class Node:
+        def __init__(self):
+            self.children : Dict[Any, DiscriminationTree.Node] = {}
+            self.wildcard : DiscriminationTree.Node | None = None
+            self.values : List[Any] = []
+
+    def __init__(self):
+        self.root = DiscriminationTree.Node()
+
+    def insert(self, pattern: Term, value: Any) -> None:
+        node = self.root
+        todo = [pattern]
+        while len(todo) > 0:
+            key, args = index_key(todo.pop())
+            if key is None:
+                if node.wildcard is None:
+                    node.wildcard = DiscriminationTree.Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(key, DiscriminationTree.Node())
+                todo.extend(reversed(args))
 
-        for rule in rules:
-            self.append(rule)
+        node.values.append(value)
+
+    def retrieve(self, term: Term) -> Set[Any]:
+        res = set()
+
+        # the nodes reached, and the subterms (as a stack) to be checked next
+        todo : List[Tuple[DiscriminationTree.Node, Tuple[Term, ...]]] = [(self.root, (term,))]
+        while len(todo) > 0:
+            node, pending = todo.pop()
+            if len(pending) == 0:
+                res.update(node.values)
+                continue
+
+            subterm, rest = pending[-1], pending[:-1]
+            if node.wildcard is not None:
+                todo.append((node.wildcard, rest))
+
+            key, args = index_key(subterm)
+            if key is not None:
+                child = node.children.get(key)
+                if child is not None:
+                    todo.append((child, rest + args[::-1]))
 
-    def copy(self) -> TRS:
-        res = TRS([])
-        res.rules = self.rules.copy()
-        res.extended_rules = self.extended_rules.copy()
-        res.rule_seq = self.rule_seq.copy()
-        res.rule_seq_name = self.rule_seq_name.copy()
         return res
 
-    
-    def __getitem__(self, __rule_name: str) -> Rule|None:
-        '''
-        return the rule with the given name
-        '''
-        for rule in self.extended_rules:
-            if rule.rule_name == __rule_name:
-                return rule
-        return None
 
+######################################################################
+# normal form cache
 
-    def append(self, rule: Rule) -> None:
+class NormalFormCache:
+    '''
+    The bounded LRU cache from (TRS.nf_token, term) to the normal form of the term.
+    The nf_token identifies the rule set, so the entries of old rule sets are never hit (and are evicted eventually).
+    Unhashable terms are not cached.
+    The cache can be shared by the normalizations in several threads.
+    '''
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.data : OrderedDict[Tuple[object, Term], Term] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __str__(self) -> str:
+        return f"NormalFormCache(size={len(self.data)}/{self.maxsize}, hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+
+    def get(self, nf_token: object, term: Term) -> Term | None:
+        key = (nf_token, term)
+        try:
+            hash(key)
+        except TypeError:
+            # customized terms may be unhashable, and they are not cached
+            return None
+
+        with self.lock:
+            res = self.data.get(key)
+            if res is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.data.move_to_end(key)
+            return res
+    
+    def put(self, nf_token: object, term: Term, normal_form: Term) -> None:
+        key = (nf_token, term)
+        try:
+            hash(key)
+        except TypeError:
+            return
+
+        with self.lock:
+            self.data[key] = normal_form
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        '''
+        remove all the entries and reset the statistics.
+        '''
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+# the cache shared by all TRS by default
+default_nf_cache = NormalFormCache()
+
+
+class RewriteListener:
+    '''
+    The listener of the rewritings, which is notified by the TRS it is registered in (see TRS.listeners). The callbacks do nothing by default.
+    The listeners are only dispatched when registered, so there is no overhead otherwise.
+    '''
+    def on_normalize(self, trs: TRS, term: Term) -> None:
+        '''
+        called when the normalization of the term starts.
+        '''
+        pass
+
+    def on_node(self, trs: TRS, term: Term) -> None:
+        '''
+        called when the rules are tried on the (sub)term.
+        '''
+        pass
+
+    def on_rule_attempt(self, trs: TRS, rule: Rule, term: Term, result: Term | None, elapsed: float) -> None:
+        '''
+        called after the rewrite_method of the rule is called on the term, with the result (None if failed) and the time spent in seconds.
+        '''
+        pass
+
+    def on_rewrite(self, trs: TRS, rule_name: str | None, path: Tuple[int, ...], redex: Term, contractum: Term) -> None:
+        '''
+        called when the redex at the path (the indices of the subterms from the root, see subterms) is rewritten. The rule name is None for a cached normal form.
+        '''
+        pass
+
+    def on_step(self, trs: TRS, step: int, term: Term) -> None:
+        '''
+        called after each step of the normalization, with the current term.
+        '''
+        pass
+
+    def on_normal_form(self, trs: TRS, term: Term, normal_form: Term) -> None:
+        '''
+        called when the normal form of the term is reached.
+        '''
+        pass
+
+    def on_stage_change(self, staged_trs: StagedTRS, stage: Stage, term: Term) -> None:
+        '''
+        called when the stage starts on the term in a staged rewriting.
+        '''
+        pass
+
+
+class RuleProfile:
+    '''
+    The statistics of a rule: the calls of its rewrite_method, the successful ones, and the time (in seconds) spent in the failed and successful calls.
+    The time is inclusive, i.e. it contains the normalizations invoked by the rewrite_method.
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.hit_time = 0.
+        self.miss_time = 0.
+
+    @property
+    def total_time(self) -> float:
+        return self.hit_time + self.miss_time
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls > 0 else 0.
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'total_time': self.total_time,
+            'mean_time': self.mean_time,
+            'hit_time': self.hit_time,
+            'miss_time': self.miss_time,
+        }
+
+
+class RewriteProfiler(RewriteListener):
+    '''
+    The profiler of the rewritings, which records the statistics of each rule (by name) and the totals of the normalizations.
+    It is enabled by registering it in TRS.listeners (or using TRS.profiling), and there is no profiling by default.
+
+    normalizations: the number of calls of TRS.normalize
+    steps: the number of rewriting steps
+    nodes: the number of the (sub)terms on which the rules are tried
+    peak_size: the maximum size of the terms during the normalizations
+    '''
+    def __init__(self):
+        self.rules : Dict[str, RuleProfile] = {}
+        self.normalizations = 0
+        self.steps = 0
+        self.nodes = 0
+        self.peak_size = 0
+
+    def record(self, rule_name: str, success: bool, elapsed: float) -> None:
+        '''
+        record a call of the rewrite_method of the rule.
+        '''
+        profile = self.rules.get(rule_name)
+        if profile is None:
+            profile = self.rules[rule_name] = RuleProfile()
+
+        profile.calls += 1
+        if success:
+            profile.hits += 1
+            profile.hit_time += elapsed
+        else:
+            profile.miss_time += elapsed
+
+    def record_term(self, term: Term) -> None:
+        '''
+        record the size of a term during the normalization.
+        '''
+        size = term.size()
+        if size > self.peak_size:
+            self.peak_size = size
+
+    def on_normalize(self, trs: TRS, term: Term) -> None:
+        self.normalizations += 1
+        self.record_term(term)
+
+    def on_node(self, trs: TRS, term: Term) -> None:
+        self.nodes += 1
+
+    def on_rule_attempt(self, trs: TRS, rule: Rule, term: Term, result: Term | None, elapsed: float) -> None:
+        self.record(rule.rule_name, result is not None, elapsed)
+
+    def on_step(self, trs: TRS, step: int, term: Term) -> None:
+        self.steps += 1
+        self.record_term(term)
+
+    def clear(self) -> None:
+        self.rules.clear()
+        self.normalizations = 0
+        self.steps = 0
+        self.nodes = 0
+        self.peak_size = 0
+
+    def sorted_rules(self, sort_by: str = 'total_time') -> List[Tuple[str, RuleProfile]]:
+        '''
+        return the (rule name, profile) pairs in the descending order of the given statistics.
+        '''
+        return sorted(self.rules.items(), key = lambda item: getattr(item[1], sort_by), reverse = True)
+
+    def to_dict(self) -> dict:
+        return {
+            'normalizations': self.normalizations,
+            'steps': self.steps,
+            'nodes': self.nodes,
+            'peak_size': self.peak_size,
+            'rules': {name: profile.to_dict() for name, profile in self.sorted_rules()},
+        }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.to_dict(), indent = indent)
+
+    def table(self, sort_by: str = 'total_time', limit: int | None = None) -> str:
+        '''
+        return the report as a text table, with the rules in the descending order of the given statistics.
+        '''
+        rows = self.sorted_rules(sort_by)
+        if limit is not None:
+            rows = rows[:limit]
+
+        width = max([len('rule')] + [len(name) for name, _ in rows])
+        lines = [
+            f"normalizations: {self.normalizations}, steps: {self.steps}, nodes: {self.nodes}, peak size: {self.peak_size}",
+            f"{'rule':<{width}} {'calls':>10} {'hits':>10} {'total(s)':>12} {'mean(ms)':>10} {'hit(s)':>12} {'miss(s)':>12}",
+        ]
+        for name, p in rows:
+            lines.append(f"{name:<{width}} {p.calls:>10} {p.hits:>10} {p.total_time:>12.6f} {p.mean_time*1000:>10.4f} {p.hit_time:>12.6f} {p.miss_time:>12.6f}")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.table()
+
+
+class RewriteStep:
+    '''
+    The event of a rewriting step. The terms are kept as references, and they are only formatted when the step is rendered.
+
+    index: the index of the step in the trace
+    rule_name: the name of the applied rule, or None for a cached normal form
+    path: the indices of the subterms from the root to the redex (see subterms)
+    '''
+    __slots__ = ('index', 'rule_name', 'path', 'redex', 'contractum')
+
+    def __init__(self, index: int, rule_name: str | None, path: Tuple[int, ...], redex: Term, contractum: Term):
+        self.index = index
+        self.rule_name = rule_name
+        self.path = path
+        self.redex = redex
+        self.contractum = contractum
+
+    @property
+    def caption(self) -> str:
+        return "apply cached normal form" if self.rule_name is None else f"apply {self.rule_name}"
+
+    def block(self) -> FormBlock:
+        return FrameBlock(
+            HSeqBlock(str(self.redex), ' -> ', str(self.contractum), v_align='c'),
+            caption=self.caption
+        )
+
+    def __str__(self) -> str:
+        return str(self.block())
+
+    def to_dict(self) -> dict:
+        return {
+            'step': self.index,
+            'rule': self.rule_name,
+            'path': list(self.path),
+            'redex': str(self.redex),
+            'contractum': str(self.contractum),
+        }
+
+
+class RewriteTrace(RewriteListener):
+    '''
+    The trace of the rewriting steps, recorded by TRS.normalize(..., trace = ...) (only for this normalization, and not the nested ones).
+    The steps are recorded as RewriteStep events, which are formatted only when the trace is read (or written to the sink).
+
+    sink: the stream to write the steps as JSON lines.
+    window: the range of step indices to record. The steps outside are only counted.
+    keep: whether to keep the steps in memory.
+    '''
+    def __init__(self, sink: TextIO | None = None, window: Tuple[int, int] | None = None, keep: bool = True):
+        self.sink = sink
+        self.window = window
+        self.keep = keep
+
+        self.steps : List[RewriteStep] = []
+        self.count = 0
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __iter__(self) -> Iterator[RewriteStep]:
+        return iter(self.steps)
+
+    def __getitem__(self, idx: int) -> RewriteStep:
+        return self.steps[idx]
+
+    def on_rewrite(self, trs: TRS, rule_name: str | None, path: Tuple[int, ...], redex: Term, contractum: Term) -> None:
+        index = self.count
+        self.count += 1
+        if self.window is not None and not (self.window[0] <= index < self.window[1]):
+            return
+
+        step = RewriteStep(index, rule_name, path, redex, contractum)
+        if self.keep:
+            self.steps.append(step)
+        if self.sink is not None:
+            self.sink.write(json.dumps(step.to_dict()) + "\n")
+
+    def render(self, start: int | None = None, stop: int | None = None) -> str:
+        '''
+        render the steps (with the indices in the range) as text.
+        '''
+        return "".join(
+            str(step) + "\n\n" for step in self.steps 
+            if (start is None or step.index >= start) and (stop is None or step.index < stop)
+        )
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+class Budget:
+    '''
+    The budget of a normalization, which is checked between the steps. When it is exhausted, the normalization stops and returns the current term, and the reason is recorded.
+    The budget also works as a cancellation token: call cancel (e.g. from another thread) to stop the normalization.
+
+    timeout: the wall-clock time limit in seconds, counted from the construction of the budget.
+    max_size: the maximum size of the terms.
+    reason: None, or the reason of stopping ("cancelled", "deadline" or "size").
+    '''
+    def __init__(self, timeout: float | None = None, max_size: int | None = None):
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.max_size = max_size
+        self.cancelled = False
+        self.reason : str | None = None
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    @property
+    def exhausted(self) -> bool:
+        return self.reason is not None
+
+    def check(self, term: Term) -> str | None:
+        '''
+        check the budget for the current term. Return and record the reason of stopping, or None if the normalization can continue.
+        '''
+        if self.reason is None:
+            if self.cancelled:
+                self.reason = "cancelled"
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.reason = "deadline"
+            elif self.max_size is not None and term.size() > self.max_size:
+                self.reason = "size"
+        return self.reason
+
+
+######################################################################
+# zipper of terms, for the traversals without recursion
+
+def subterms(term: Term) -> Tuple[Term, ...]:
+    '''
+    return the subterms that the rewriting traverses into.
+    '''
+    if isinstance(term, StdTerm):
+        return term.args
+    elif isinstance(term, (BindVarTerm, MultiBindTerm)):
+        return (term.body,)
+    elif isinstance(term, Typing):
+        return (term.term,)
+    else:
+        return ()
+    
+def replace_subterms(term: Term, new_subterms: Sequence[Term]) -> Term:
+    '''
+    return the term with the subterms (in the order of subterms) replaced.
+    '''
+    if isinstance(term, StdTerm):
+        return type(term)(*new_subterms)
+    elif isinstance(term, BindVarTerm):
+        # risk exists: term.bind_var may collide with new_subterm
+        # but normal rewriting rules should not cause this problem because there are no free variables on the RHS
+        return type(term)(term.bind_var, new_subterms[0])
+    elif isinstance(term, MultiBindTerm):
+        return type(term)(term.bind_vars, new_subterms[0])
+    elif isinstance(term, Typing):
+        return type(term)(new_subterms[0], term.type)
+    else:
+        raise ValueError(f"The term {term} has no subterms.")
+
+def replace_subterm(term: Term, i: int, new_subterm: Term) -> Term:
+    '''
+    return the term with the i-th subterm (in the order of subterms) replaced.
+    '''
+    children = subterms(term)
+    return replace_subterms(term, children[:i] + (new_subterm,) + children[i+1:])
+    
+def rebuild_zipper(frames: List[List[Any]], new_focus: Term) -> Term:
+    '''
+    rebuild the ancestors in the zipper after the focus is replaced by new_focus, and return the new focus.
+    If an ancestor does not keep the subterm at the same position (e.g. the arguments of AC symbols are flattened and sorted), the zipper is cut there and the ancestor becomes the focus.
+    '''
+    term = new_focus
+    for frame in reversed(frames):
+        term = replace_subterm(frame[0], frame[1], term)
+        frame[0] = term
+
+    for k in range(len(frames)):
+        child = frames[k + 1][0] if k + 1 < len(frames) else new_focus
+        children = subterms(frames[k][0])
+        if frames[k][1] >= len(children) or children[frames[k][1]] is not child:
+            focus = frames[k][0]
+            del frames[k:]
+            return focus
+        
+    return new_focus
+
+def zipper_root(frames: List[List[Any]], focus: Term) -> Term:
+    return frames[0][0] if len(frames) > 0 else focus
+
+
+######################################################################
+# term rewriting system
+        
+class TRS:
+
+    def __init__(self, rules: Sequence[Rule]):
+        '''
+        side_info_procs provides methods to preprocess side informations (executed in sequence)
+        '''
+        self.rules : List[Rule] = []
+        self.extended_rules : List[Rule] = []
+
+        # the rule sequence that will be check during the rewriting. the order maters.
+        self.rule_seq : List[Rule] = []
+
+        self.rule_seq_name = []
+
+        # the index from term classes to the candidate rules (in the order of rule_seq), together with their positions and whether they are in pattern_index. It is built lazily, and should be cleared whenever rule_seq changes.
+        self.rule_index : Dict[Type[Term], List[Tuple[int, Rule, bool]]] = {}
+
+        # the discrimination tree of the canonical rules, from the LHS patterns to the positions in rule_seq. It is built lazily, and should be cleared whenever rule_seq changes.
+        self.pattern_index : DiscriminationTree | None = None
+
+        # the free variables in the rules. It is calculated lazily, and should be cleared whenever the rules change.
+        self.rule_variables : frozenset[Var] | None = None
+
+        # the token to mark the terms in normal form. It is renewed whenever the rules change, so that old marks become invalid.
+        self.nf_token = object()
+
+        # the cache of normal forms, which is shared by the TRS instances by default. None means no caching.
+        self.nf_cache : NormalFormCache | None = default_nf_cache
+
+        # the listeners of the rewritings. The list is replaced instead of modified in place, since it is shared by the renamed TRS.
+        self.listeners : List[RewriteListener] = []
+
+        # the rewritings found by try_rules (or the cache) but not dispatched yet, as (rule name, redex, contractum, path relative to the rewritten position). The traversals dispatch them with the positions. It is only used when there are listeners.
+        self.pending_rewrites : List[Tuple[str | None, Term, Term, Tuple[int, ...]]] = []
+
+        for rule in rules:
+            self.append(rule)
+
+    def copy(self) -> TRS:
+        res = TRS([])
+        res.rules = self.rules.copy()
+        res.extended_rules = self.extended_rules.copy()
+        res.rule_seq = self.rule_seq.copy()
+        res.rule_seq_name = self.rule_seq_name.copy()
+        res.nf_cache = self.nf_cache
+        res.listeners = self.listeners
+        return res
+
+    def fork(self) -> TRS:
+        '''
+        return the TRS sharing the rules, the normal forms (nf_token) and the caches, but with its own listeners and pending rewritings, so that it can normalize in another thread.
+        '''
+        res = copy.copy(self)
+        res.listeners = list(self.listeners)
+        res.pending_rewrites = []
+        return res
+
+    
+    def __getitem__(self, __rule_name: str) -> Rule|None:
+        '''
+        return the rule with the given name
+        '''
+        for rule in self.extended_rules:
+            if rule.rule_name == __rule_name:
+                return rule
+        return None
+
+
+    def append(self, rule: Rule) -> None:
         '''
         append a rule to the TRS
         '''
@@ -1035,6 +2188,11 @@ class TRS:
             self.rule_seq.append(ext_rule)
             self.rule_seq_name.append(ext_rule.rule_name)
 
+        self.rule_index.clear()
+        self.pattern_index = None
+        self.rule_variables = None
+        self.nf_token = object()
+
     def set_rule_seq(self, rule_seq: List[str]) -> None:
         '''
         set the rule sequence that will be check during the rewriting. the order maters.
@@ -1053,6 +2211,89 @@ class TRS:
 
         self.rule_seq_name = rule_seq.copy()
 
+        self.rule_index.clear()
+        self.pattern_index = None
+        self.rule_variables = None
+        self.nf_token = object()
+
+    @staticmethod
+    def is_pattern_rule(rule: Rule) -> bool:
+        '''
+        whether the rule rewrites exactly the instances of its LHS pattern, so that it can be indexed by the pattern.
+        '''
+        return rule.rewrite_method in (canonical_rewrite, canonical_typing) and isinstance(rule.lhs, Term)
+
+    def candidate_rules(self, term: Term) -> List[Rule]:
+        '''
+        return the rules in rule_seq that can possibly rewrite the term (not including subterms), keeping the order of rule_seq.
+        The canonical rules are filtered by the pattern_index, and the other rules by their heads.
+        '''
+        T = type(term)
+        entries = self.rule_index.get(T)
+        if entries is None:
+            entries = [
+                (i, rule, self.is_pattern_rule(rule)) for i, rule in enumerate(self.rule_seq) 
+                if rule.heads is None or issubclass(T, rule.heads)
+            ]
+            self.rule_index[T] = entries
+
+        if self.pattern_index is None:
+            self.pattern_index = DiscriminationTree()
+            for i, rule in enumerate(self.rule_seq):
+                if self.is_pattern_rule(rule):
+                    self.pattern_index.insert(rule.lhs, i)
+
+        matched = self.pattern_index.retrieve(term)
+        return [rule for i, rule, indexed in entries if not indexed or i in matched]
+
+    @contextmanager
+    def listening(self, *listeners: RewriteListener):
+        '''
+        Register the listeners in the context.
+        '''
+        old_listeners = self.listeners
+        self.listeners = old_listeners + list(listeners)
+        try:
+            yield
+        finally:
+            self.listeners = old_listeners
+
+    @contextmanager
+    def profiling(self, profiler: RewriteProfiler | None = None):
+        '''
+        Turn on the profiling of this TRS in the context, and yield the profiler.
+        If profiler is None, a new profiler is created.
+        '''
+        if profiler is None:
+            profiler = RewriteProfiler()
+
+        with self.listening(profiler):
+            yield profiler
+
+    @contextmanager
+    def tracing(self, trace: RewriteTrace | None):
+        '''
+        Record the rewriting steps of this TRS in the trace in the context. The traces registered before are suspended, so that the trace only contains the steps of one normalization (None means no tracing).
+        '''
+        old_listeners = self.listeners
+        if trace is not None or any(isinstance(listener, RewriteTrace) for listener in old_listeners):
+            self.listeners = [listener for listener in old_listeners if not isinstance(listener, RewriteTrace)]
+            if trace is not None:
+                self.listeners.append(trace)
+        try:
+            yield trace
+        finally:
+            self.listeners = old_listeners
+
+    def dispatch_rewrites(self, path: Tuple[int, ...]) -> None:
+        '''
+        dispatch the pending rewritings at the path to the listeners.
+        '''
+        for rule_name, redex, contractum, rel_path in self.pending_rewrites:
+            for listener in self.listeners:
+                listener.on_rewrite(self, rule_name, path + rel_path, redex, contractum)
+        self.pending_rewrites.clear()
+
     def subtrs(self, rule_names: List[str]) -> TRS:
         '''
         return the sub TRS with the rules with the given names
@@ -1077,6 +2318,17 @@ class TRS:
             res += repr(rule) + "\n"
         return res
     
+    def fingerprint(self) -> str:
+        '''
+        The sha256 digest of the rule sequence (the rules in order, with their rewriting methods), which identifies the TRS across processes.
+        (The implementation of the rewriting methods is not covered.)
+        '''
+        digest = hashlib.sha256()
+        for rule in self.rule_seq:
+            method = rule.rewrite_method
+            digest.update(f'{repr(rule)}\n{method.__module__}.{method.__qualname__}\n'.encode())
+        return digest.hexdigest()
+    
     def cime_vars_repr(self) -> str:
         '''
         The description of the variables in the signature language of CiME2.
@@ -1106,16 +2358,19 @@ let R = TRS F X "
     def __add__(self, other: TRS) -> TRS:
         return TRS(self.rules + other.rules)
 
-    def variables(self) -> set[Var]:
+    def variables(self) -> frozenset[Var]:
         '''
         Return a set of all free variables in the rules.
         (This method is not that rigorous, and only acts as a hint.)
+        The result is cached until the rules change.
         '''
-        res = set()
-        for rule in self.extended_rules:
-            if isinstance(rule.lhs, Term) and isinstance(rule.rhs, Term):
-                res |= rule.lhs.variables() | rule.rhs.variables()
-        return res
+        if self.rule_variables is None:
+            res = set()
+            for rule in self.extended_rules:
+                if isinstance(rule.lhs, Term) and isinstance(rule.rhs, Term):
+                    res |= rule.lhs.variables() | rule.rhs.variables()
+            self.rule_variables = frozenset(res)
+        return self.rule_variables
     
     def subst(self, sigma : Subst) -> TRS:
         '''
@@ -1138,7 +2393,14 @@ let R = TRS F X "
             for var in overlap:
                 subst[var] = new_var(overlap|set(subst.keys()), var.name)
             
-            return self.subst(Subst(subst))
+            res = self.subst(Subst(subst))
+
+            # renaming the variables does not change the normal forms, or the patterns up to variables
+            res.nf_token = self.nf_token
+            res.pattern_index = self.pattern_index
+            res.nf_cache = self.nf_cache
+            res.listeners = self.listeners
+            return res
 
         else:
             return self
@@ -1149,56 +2411,108 @@ let R = TRS F X "
             verbose: bool = False, 
             stream: TextIO = sys.stdout,
             step_limit : int | None = None,
-            alg: str = "inner_most") -> Term:
+            alg: str = "inner_most",
+            trace: RewriteTrace | None = None,
+            budget: Budget | None = None) -> Term:
+        '''
+        trace: the trace to record the rewriting steps in (see RewriteTrace).
+        budget: the limits checked between the steps (see Budget). The current term is returned when it is exhausted, and the reason is recorded in the budget.
+        '''
 
         # check the variable conincidence
         renamed_trs = self.avoid_vars(term.variables())
 
         current_term = term          
 
-        # choose the algorithm
-        if alg == "outer_most":
-            rewrite = renamed_trs.rewrite_outer_most  
-        elif alg == "inner_most":
-            rewrite = renamed_trs.rewrite_inner_most
+        # the steps are recorded by the renamed TRS during this normalization (and not the nested ones)
+        with renamed_trs.tracing(trace):
+            listeners = renamed_trs.listeners
+            for listener in listeners:
+                listener.on_normalize(renamed_trs, term)
 
-        step=0
-        while True:
+            # the zipper of the current term. For the inner most strategy, the search for the next redex continues from the last rewritten position (the terms before it are in normal form).
+            frames : List[List[Any]] = []
+            focus = current_term
 
-            # check whether the step limit is reached
-            step += 1
-            if step_limit is not None and step > step_limit:
-                return current_term
+            step=0
+            while True:
 
-            if verbose:
-                stream.write(f"== STEP {step} ==\n")
-                stream.write("Current Term:\n")
-                stream.write(str(current_term)+"\n\n")
-                
-            # check whether rewrite rules are applicable
-            new_term = rewrite(current_term, verbose, stream)
+                # check whether the step limit is reached
+                step += 1
+                if step_limit is not None and step > step_limit:
+                    return current_term
+
+                if budget is not None and budget.check(current_term) is not None:
+                    if verbose:
+                        stream.write(f"The budget is exhausted ({budget.reason}).\n")
+                    return current_term
 
-            if new_term is None:
                 if verbose:
-                    stream.write("It is the normal form.\n")
-                return current_term
+                    stream.write(f"== STEP {step} ==\n")
+                    stream.write("Current Term:\n")
+                    stream.write(str(current_term)+"\n\n")
+                
+                # check whether rewrite rules are applicable
+                if alg == "outer_most":
+                    frames, focus = [], current_term
+                    new_focus = renamed_trs.search_outer_most(frames, focus, verbose, stream)
+                elif alg == "inner_most":
+                    new_focus = renamed_trs.search_inner_most(frames, focus, renamed_trs.reduce, True, None, verbose, stream)
+                elif alg == "parallel_inner_most":
+                    frames, new_focus = [], renamed_trs.rewrite_parallel_inner_most(current_term, verbose, stream)
+                else:
+                    raise ValueError(f"Unknown algorithm '{alg}'.")
+
+                if new_focus is None:
+                    if verbose:
+                        stream.write("It is the normal form.\n")
+
+                    if renamed_trs.nf_cache is not None and current_term is not term:
+                        renamed_trs.nf_cache.put(renamed_trs.nf_token, term, current_term)
+
+                    for listener in listeners:
+                        listener.on_normal_form(renamed_trs, term, current_term)
+
+                    return current_term
             
-            current_term = new_term
+                focus = new_focus
+                current_term = zipper_root(frames, focus)
+
+                for listener in listeners:
+                    listener.on_step(renamed_trs, step, current_term)
             
     
-
-    def rewrite_outer_most(self, term : Term, verbose:bool = False, stream: TextIO = sys.stdout) -> Term | None:
+    def reduce(self, parent: Term | None, term: Term, verbose: bool = False, stream: TextIO = sys.stdout) -> Term | None:
         '''
-        rewrite the term using the rules. Return the result.
-        return None when no rewriting is applicable
+        try to rewrite the term using the rules (not including subterms). Return the result, or None and mark the term as normal form (assuming the subterms are in normal form).
+        '''
+        new_term = self.try_rules(term, verbose, stream)
+        if new_term is None:
+            term.nf_token = self.nf_token
+        return new_term
 
-        algorithm: outer most
+    def try_rules(self, term: Term, verbose: bool = False, stream: TextIO = sys.stdout) -> Term | None:
         '''
+        try to rewrite the term using the rules (not including subterms). Return the result if successful, otherwise return None.
+        '''
+        listeners = self.listeners
+        for listener in listeners:
+            listener.on_node(self, term)
+
+        for rule in self.candidate_rules(term):
+            if not listeners:
+                new_term = rule.rewrite_method(rule, self, term)
+            else:
+                start = time.perf_counter()
+                new_term = rule.rewrite_method(rule, self, term)
+                elapsed = time.perf_counter() - start
+                for listener in listeners:
+                    listener.on_rule_attempt(self, rule, term, new_term, elapsed)
 
-        # try to rewrite the term using the rules
-        for rule in self.rule_seq:
-            new_term = rule.rewrite_method(rule, self, term)
             if new_term is not None:
+                if listeners:
+                    self.pending_rewrites.append((rule.rule_name, term, new_term, ()))
+
                 # output information
                 if verbose:
                     stream.write(str(
@@ -1207,86 +2521,317 @@ let R = TRS F X "
                         caption=f"apply {rule.rule_name}"
                         )
                         ) + "\n\n")
-
                 return new_term
-                        
-        if isinstance(term, StdTerm):
-            # try to rewrite the subterms
-            for i in range(len(term.args)):
-                new_subterm = self.rewrite_outer_most(term.args[i], verbose, stream)
-                if new_subterm is not None:
-                    return type(term)(*term.args[:i], new_subterm, *term.args[i+1:])
-                
-        elif isinstance(term, BindVarTerm):
-            new_body = self.rewrite_outer_most(term.body, verbose, stream)
-            if new_body is not None:
-                # risk exists: term.bind_var may collide with new_body
-                # but normal rewriting rules should not cause this problem because there are no free variables on the RHS
-                return type(term)(term.bind_var, new_body)
             
-        elif isinstance(term, MultiBindTerm):
-            new_body = self.rewrite_outer_most(term.body, verbose, stream)
-            if new_body is not None:
-                return type(term)(term.bind_vars, new_body)
-            
-        elif isinstance(term, Typing):
-            new_term = self.rewrite_inner_most(term.term, verbose, stream)
+        return None
+
+    def search_inner_most(self, 
+            frames: List[List[Any]], 
+            focus: Term, 
+            reduce: Callable[[Term | None, Term, bool, TextIO], Term | None],
+            use_cache: bool,
+            root_parent: Term | None = None,
+            verbose: bool = False, 
+            stream: TextIO = sys.stdout,
+            nested: bool = False) -> Term | None:
+        '''
+        Search the inner most redex from the focus (without recursion), and rewrite it. Return the new focus (the rewritten subterm, or its ancestor, see rebuild_zipper), or None if no rewriting is applicable at or after the focus.
+
+        frames: the zipper of the focus, i.e. the list of [ancestor, index of the subterm on the path] from the root to the parent of the focus. It is updated in place to the zipper of the rewritten subterm (with the rebuilt ancestors), so that the search can continue from there. Use zipper_root to get the new term.
+
+        reduce: the method to rewrite a term (not including subterms), given its parent.
+        use_cache: whether to use the normal forms in nf_cache.
+        root_parent: the parent of the root.
+        nested: whether the search is in a subterm rewritten by an outer traversal. The pending rewritings are then not dispatched, but kept with the paths relative to the root, and the outer traversal dispatches them at the position of the root.
+        '''
+        while True:
+            # enter the focus
+            new_term = None
+            if focus.nf_token is not self.nf_token:
+
+                # the normal forms cached by the previous normalizations
+                if use_cache and self.nf_cache is not None:
+                    new_term = self.nf_cache.get(self.nf_token, focus)
+                    if new_term is not None and self.listeners:
+                        self.pending_rewrites.append((None, focus, new_term, ()))
+                    if new_term is not None and verbose:
+                        stream.write(str(
+                            FrameBlock(
+                            HSeqBlock(str(focus), ' -> ', str(new_term), v_align='c'),
+                            caption=f"apply cached normal form"
+                            )
+                            ) + "\n\n")
+
+                if new_term is None:
+                    # try to rewrite the subterms first
+                    children = subterms(focus)
+                    if len(children) > 0:
+                        frames.append([focus, 0])
+                        focus = children[0]
+                        continue
+
+                    new_term = reduce(frames[-1][0] if len(frames) > 0 else root_parent, focus, verbose, stream)
+
+            # leave the focus, and continue with the next subterm or the parent
+            while new_term is None:
+                if len(frames) == 0:
+                    return None
+                
+                frame = frames[-1]
+                children = subterms(frame[0])
+                if frame[1] + 1 < len(children):
+                    frame[1] += 1
+                    focus = children[frame[1]]
+                    break
+
+                frames.pop()
+                focus = frame[0]
+                new_term = reduce(frames[-1][0] if len(frames) > 0 else root_parent, focus, verbose, stream)
+
             if new_term is not None:
-                return type(term)(new_term, term.type)
+                if self.pending_rewrites:
+                    path = tuple(frame[1] for frame in frames)
+                    if nested:
+                        self.pending_rewrites = [(rule_name, redex, contractum, path + rel_path) 
+                            for rule_name, redex, contractum, rel_path in self.pending_rewrites]
+                    else:
+                        self.dispatch_rewrites(path)
+                return rebuild_zipper(frames, new_term)
 
-            
-        return None
+    def search_outer_most(self, 
+            frames: List[List[Any]], 
+            focus: Term, 
+            verbose: bool = False, 
+            stream: TextIO = sys.stdout) -> Term | None:
+        '''
+        Search the outer most redex from the focus (without recursion), and rewrite it. Return the new focus (see search_inner_most), or None if no rewriting is applicable.
+
+        frames: the zipper of the focus (see search_inner_most).
+        '''
+        while True:
+            # enter the focus
+            new_term = None
+            if focus.nf_token is not self.nf_token:
+                new_term = self.try_rules(focus, verbose, stream)
+
+                if new_term is None:
+                    if isinstance(focus, Typing):
+                        # the typed term is rewritten by the inner most strategy
+                        new_subterm = self.rewrite_inner_most(focus.term, verbose, stream)
+                        if new_subterm is not None:
+                            new_term = replace_subterm(focus, 0, new_subterm)
+                        else:
+                            focus.nf_token = self.nf_token
+
+                    else:
+                        children = subterms(focus)
+                        if len(children) > 0:
+                            frames.append([focus, 0])
+                            focus = children[0]
+                            continue
+                        
+                        focus.nf_token = self.nf_token
+
+            # leave the focus, and continue with the next subterm or the parent
+            while new_term is None:
+                if len(frames) == 0:
+                    return None
+                
+                frame = frames[-1]
+                children = subterms(frame[0])
+                if frame[1] + 1 < len(children):
+                    frame[1] += 1
+                    focus = children[frame[1]]
+                    break
+
+                # all the subterms are in normal form
+                frames.pop()
+                frame[0].nf_token = self.nf_token
+
+            if new_term is not None:
+                if self.pending_rewrites:
+                    self.dispatch_rewrites(tuple(frame[1] for frame in frames))
+                return rebuild_zipper(frames, new_term)
     
 
-    def rewrite_inner_most(self, term : Term, verbose:bool = False, stream:TextIO = sys.stdout) -> Term | None:
+    def rewrite_outer_most(self, term : Term, verbose:bool = False, stream: TextIO = sys.stdout) -> Term | None:
         '''
         rewrite the term using the rules. Return the result.
         return None when no rewriting is applicable
 
         algorithm: outer most
         '''
+        frames : List[List[Any]] = []
+        new_focus = self.search_outer_most(frames, term, verbose, stream)
+        if new_focus is None:
+            return None
+        return zipper_root(frames, new_focus)
+    
+
+    def rewrite_parallel_inner_most(self, term : Term, verbose:bool = False, stream:TextIO = sys.stdout) -> Term | None:
+        '''
+        rewrite all the disjoint inner most redexes of the term in one pass. Return the result.
+        return None when no rewriting is applicable
+
+        algorithm: parallel inner most. The term is traversed bottom-up (without recursion). The rules are tried on a subterm only if its subterms are in normal form, and every subterm is rebuilt at most once.
+        '''
+        # the frames of (ancestor, its subterms, the results of the subterms visited), where None means unchanged
+        frames : List[Tuple[Term, Tuple[Term, ...], List[Term | None]]] = []
+        focus = term
 
-        if isinstance(term, StdTerm):
-            # try to rewrite the subterms
-            for i in range(len(term.args)):
-                new_subterm = self.rewrite_inner_most(term.args[i], verbose, stream)
-                if new_subterm is not None:
-                    return type(term)(*term.args[:i], new_subterm, *term.args[i+1:])
+        while True:
+            # enter the focus
+            res = None
+            if focus.nf_token is not self.nf_token:
+
+                # the normal forms cached by the previous normalizations
+                if self.nf_cache is not None:
+                    res = self.nf_cache.get(self.nf_token, focus)
+                    if res is not None and self.listeners:
+                        self.pending_rewrites.append((None, focus, res, ()))
+                    if res is not None and verbose:
+                        stream.write(str(
+                            FrameBlock(
+                            HSeqBlock(str(focus), ' -> ', str(res), v_align='c'),
+                            caption=f"apply cached normal form"
+                            )
+                            ) + "\n\n")
+
+                if res is None:
+                    children = subterms(focus)
+                    if len(children) > 0:
+                        frames.append((focus, children, []))
+                        focus = children[0]
+                        continue
+
+                    res = self.reduce(None, focus, verbose, stream)
+
+            # leave the focus, and continue with the next subterm or the parent
+            while True:
+                if self.pending_rewrites:
+                    self.dispatch_rewrites(tuple(len(results) for _, _, results in frames))
+
+                if len(frames) == 0:
+                    return res
                 
-        elif isinstance(term, BindVarTerm):
-            new_body = self.rewrite_inner_most(term.body, verbose, stream)
-            if new_body is not None:
-                # risk exists: term.bind_var may collide with new_body
-                # but normal rewriting rules should not cause this problem because there are no free variables on the RHS
-                return type(term)(term.bind_var, new_body)
-            
-        elif isinstance(term, MultiBindTerm):
-            new_body = self.rewrite_inner_most(term.body, verbose, stream)
-            if new_body is not None:
-                return type(term)(term.bind_vars, new_body)
+                parent, children, results = frames[-1]
+                results.append(res)
+                if len(results) < len(children):
+                    focus = children[len(results)]
+                    break
+
+                frames.pop()
+                if all(r is None for r in results):
+                    res = self.reduce(None, parent, verbose, stream)
+                else:
+                    res = replace_subterms(parent, [c if r is None else r for c, r in zip(children, results)])
+    
 
-        elif isinstance(term, Typing):
-            new_term = self.rewrite_inner_most(term.term, verbose, stream)
-            if new_term is not None:
-                return type(term)(new_term, term.type)
+    def rewrite_inner_most(self, term : Term, verbose:bool = False, stream:TextIO = sys.stdout) -> Term | None:
+        '''
+        rewrite the term using the rules. Return the result.
+        return None when no rewriting is applicable
 
-        # try to rewrite the term using the rules
-        for rule in self.rule_seq:
-            new_term = rule.rewrite_method(rule, self, term)
-            if new_term is not None:
-                # output information
-                if verbose:
-                    stream.write(str(
-                        FrameBlock(
-                        HSeqBlock(str(term), ' -> ', str(new_term), v_align='c'),
-                        caption=f"apply {rule.rule_name}"
-                        )
-                        ) + "\n\n")
-                return new_term
-        
-        return None
+        algorithm: inner most
+        '''
+        frames : List[List[Any]] = []
+        new_focus = self.search_inner_most(frames, term, self.reduce, True, None, verbose, stream)
+        if new_focus is None:
+            return None
+        return zipper_root(frames, new_focus)
     
 
+class Stage:
+    '''
+    A stage of the staged rewriting strategy.
+    The step is either a TRS, which normalizes the term to the fixpoint of its own rules, or a function which transforms the term once (e.g., the juxtapose rewriting).
+    '''
+    def __init__(self, name: str, step: TRS | Callable[[Term], Term], alg: str = "inner_most"):
+        self.name = name
+        self.step = step
+        self.alg = alg
+
+    def __str__(self) -> str:
+        return f"Stage({self.name})"
+
+    def __call__(self, term: Term, verbose: bool = False, stream: TextIO = sys.stdout, trace: RewriteTrace | None = None, budget: Budget | None = None) -> Term:
+        if isinstance(self.step, TRS):
+            return self.step.normalize(term, verbose, stream, alg = self.alg, trace = trace, budget = budget)
+        return self.step(term)
+
+
+class StagedTRS:
+    '''
+    The rewriting strategy described as an ordered list of stages. Each stage is finished before the next one starts, and only tries its own rules.
+
+    rounds: the number of times to run the whole pipeline. None means repeating the pipeline until a whole round leaves the term unchanged, and the stages should all be TRSs (or idempotent functions) in this case.
+    '''
+    def __init__(self, stages: Sequence[Stage], rounds: int | None = 1, listeners: Sequence[RewriteListener] = ()):
+        self.stages = list(stages)
+        self.rounds = rounds
+
+        # the listeners notified when the stages change
+        self.listeners : List[RewriteListener] = list(listeners)
+
+    def __str__(self) -> str:
+        return " -> ".join(stage.name for stage in self.stages)
+
+    @staticmethod
+    def split(trs: TRS, *groups: Sequence[str], rounds: int | None = None) -> StagedTRS:
+        '''
+        Split the TRS into stages. Each group of rule names makes a stage in the given order, and the remaining rules (in the order of rule_seq) make the first stage.
+        The pipeline is repeated until the fixpoint by default, so that the result is in normal form w.r.t. all the rules.
+        The split TRS is opt-in, and none of the shipped TRSs (or eq_check) use it: each round restarts the traversal in every stage, which is slower than trying all the rules together.
+        '''
+        grouped = set(itertools.chain(*groups))
+        for name in grouped:
+            if trs[name] is None:
+                raise ValueError(f"The rule with the name {name} does not exist.")
+
+        rules = set(trs.rules)
+        main = [rule.rule_name for rule in trs.rule_seq if rule in rules and rule.rule_name not in grouped]
+
+        stages = []
+        for i, names in enumerate([main] + [list(group) for group in groups]):
+            sub = trs.subtrs(names)
+            sub.nf_cache = trs.nf_cache
+            sub.listeners = trs.listeners
+            stages.append(Stage("main" if i == 0 else f"stage-{i}", sub))
+
+        return StagedTRS(stages, rounds, trs.listeners)
+
+    def normalize(self, term: Term, verbose: bool = False, stream: TextIO = sys.stdout, trace: RewriteTrace | None = None, budget: Budget | None = None) -> Term:
+        '''
+        budget: the budget shared by the stages (see Budget). The current term is returned when it is exhausted.
+        '''
+        current_term = term
+
+        # the number of the last stages which leave the current term unchanged (the stage that produces the term counts, since its result is a fixpoint)
+        stable = 0
+
+        round_count = 0
+        while self.rounds is None or round_count < self.rounds:
+            round_count += 1
+
+            for stage in self.stages:
+                if self.rounds is None and stable == len(self.stages):
+                    return current_term
+
+                if budget is not None and budget.check(current_term) is not None:
+                    return current_term
+
+                if verbose:
+                    stream.write(f"== ROUND {round_count}, {stage.name} ==\n")
+                for listener in self.listeners:
+                    listener.on_stage_change(self, stage, current_term)
+                new_term = stage(current_term, verbose, stream, trace, budget)
+
+                stable = stable + 1 if new_term == current_term else 1
+                current_term = new_term
+
+        return current_term
+
+
 class TypeTerm(Term):
     '''
     The term that represent a type.
@@ -1340,15 +2885,38 @@ class Typing(Term):
         return rf' \left ( {self.term} : {self.type} \right )'
     
     def __eq__(self, __value: Term) -> bool:
+        if self is __value:
+            return True
+        
+        if both_interned(self, __value):
+            return False
+        
         return isinstance(__value, Typing) and self.term == __value.term and self.type == __value.type
+    
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((type(self), self.term, self.type))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        if self._order_key is None:
+            self._order_key = (1, self.fsymbol, type(self).__qualname__, (self.term.order_key(), self.type.order_key()))
+            self._order_exact = self.term.order_exact and self.type.order_exact
+        return self._order_key
 
     def size(self) -> int:
-        return self.term.size() + self.type.size() + 1
+        if self._size is None:
+            self._size = self.term.size() + self.type.size() + 1
+        return self._size
     
-    def variables(self) -> set[Var]:
-        return self.term.variables() | self.type.variables()
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = self.term.variables() | self.type.variables()
+        return self._variables
     
     def subst(self, sigma: Subst | dict[Var, Term]) -> Typing:
+        if subst_untouched(self, sigma):
+            return self
         return type(self)(self.term.subst(sigma), self.type.subst(sigma))
     
 class FunType(TypeTerm):
@@ -1375,15 +2943,38 @@ class FunType(TypeTerm):
         return rf' \left ( {self.arg_type} \rightarrow {self.ret_type} \right )'
     
     def __eq__(self, __value: Term) -> bool:
+        if self is __value:
+            return True
+        
+        if both_interned(self, __value):
+            return False
+        
         return isinstance(__value, FunType) and self.arg_type == __value.arg_type and self.ret_type == __value.ret_type
     
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((type(self), self.arg_type, self.ret_type))
+        return self._hash
+    
+    def order_key(self) -> Tuple:
+        if self._order_key is None:
+            self._order_key = (1, self.fsymbol, type(self).__qualname__, (self.arg_type.order_key(), self.ret_type.order_key()))
+            self._order_exact = self.arg_type.order_exact and self.ret_type.order_exact
+        return self._order_key
+    
     def size(self) -> int:
-        return self.arg_type.size() + self.ret_type.size() + 1
+        if self._size is None:
+            self._size = self.arg_type.size() + self.ret_type.size() + 1
+        return self._size
     
-    def variables(self) -> set[Var]:
-        return self.arg_type.variables() | self.ret_type.variables()
+    def variables(self) -> frozenset[Var]:
+        if self._variables is None:
+            self._variables = self.arg_type.variables() | self.ret_type.variables()
+        return self._variables
     
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
+        if subst_untouched(self, sigma):
+            return self
         return type(self)(self.arg_type.subst(sigma), self.ret_type.subst(sigma))
     
 
@@ -1393,11 +2984,15 @@ def canonical_typing(rule: TypingRule, trs: TRS, term: Term) -> Term|None:
     assert isinstance(rule.lhs, Term)
     assert isinstance(rule.rhs, Typing)
 
-    subst = Matching.single_match(rule.lhs, term)
-    if len(subst) == 0:
+    matcher = rule.matcher
+    if matcher is not None:
+        return matcher(term)
+
+    subst = Matching.first_match(rule.lhs, term)
+    if subst is None:
         return None
     else:
-        return subst[0](rule.rhs)
+        return subst(rule.rhs)
 
 class TypingRule(Rule):
     '''
@@ -1410,7 +3005,8 @@ class TypingRule(Rule):
                  lhs: Term|str,
                  rhs: Typing|str,
                  rewrite_method : Callable[[TypingRule, TRS, Term], Term|None] = canonical_typing,
-                 rule_repr: str|None = None):
+                 rule_repr: str|None = None,
+                 heads: Sequence[Type[Term]]|None = None):
         
         if isinstance(rhs, TypeTerm):
             assert isinstance(rhs, Typing), "the RHS should be a typing symbol"
@@ -1441,13 +3037,18 @@ class TypingRule(Rule):
         self.rewrite_method = rewrite_method
         self.rule_repr = rule_repr
 
+        if heads is None and rewrite_method is canonical_typing:
+            self.heads = head_symbols(lhs)
+        else:
+            self.heads = None if heads is None else tuple(heads)
+
     def subst(self, sigma: Subst | dict[Var, Term]) -> TypingRule:
         if isinstance(sigma, dict):
             sigma = Subst(sigma)
             
         new_lhs = self.lhs.subst(sigma) if isinstance(self.lhs, Term) else self.lhs
         new_rhs = self.rhs.subst(sigma) if isinstance(self.rhs, Typing) else self.rhs
-        return type(self)(self.rule_name, new_lhs, new_rhs, self.rewrite_method, self.rule_repr)
+        return type(self)(self.rule_name, new_lhs, new_rhs, self.rewrite_method, self.rule_repr, self.heads)
 
 
 class TypeChecker(TRS):
@@ -1500,6 +3101,11 @@ class TypeChecker(TRS):
             self.rule_seq.append(flt_rule)
             self.rule_seq_name.append(flt_rule.rule_name)
 
+        self.rule_index.clear()
+        self.pattern_index = None
+        self.rule_variables = None
+        self.nf_token = object()
+
 
     
     
@@ -1509,6 +3115,8 @@ class TypeChecker(TRS):
         res.extended_rules = self.extended_rules.copy()
         res.rule_seq = self.rule_seq.copy()
         res.rule_seq_name = self.rule_seq_name.copy()
+        res.nf_cache = self.nf_cache
+        res.listeners = self.listeners
         return res
 
 
@@ -1539,6 +3147,14 @@ class TypeChecker(TRS):
 
         current_term = term          
 
+        listeners = renamed_trs.listeners
+        for listener in listeners:
+            listener.on_normalize(renamed_trs, term)
+
+        # the zipper of the current term, and the search continues from the last rewritten position
+        frames : List[List[Any]] = []
+        focus = current_term
+
         step=0
         while True:
 
@@ -1553,14 +3169,21 @@ class TypeChecker(TRS):
                 stream.write(str(current_term)+"\n\n")
                 
             # check whether rewrite rules are applicable
-            new_term = renamed_trs.rewrite_typing(None, current_term, verbose, stream) # type: ignore
+            new_focus = renamed_trs.search_inner_most(frames, focus, renamed_trs.reduce_typing, False, None, verbose, stream) # type: ignore
 
-            if new_term is None:
+            if new_focus is None:
                 if verbose:
                     stream.write("Type Checking & Inferrence Finished.\n")
+
+                for listener in listeners:
+                    listener.on_normal_form(renamed_trs, term, current_term)
                 break
             
-            current_term = new_term
+            focus = new_focus
+            current_term = zipper_root(frames, focus)
+
+            for listener in listeners:
+                listener.on_step(renamed_trs, step, current_term)
 
         # check the final term
         if well_typed_check:
@@ -1569,52 +3192,30 @@ class TypeChecker(TRS):
 
         return current_term
 
-    def rewrite_typing(self, parent: Term | None, term: Term, verbose: bool = False, stream: TextIO = sys.stdout) -> Term | None:
+    def reduce_typing(self, parent: Term | None, term: Term, verbose: bool = False, stream: TextIO = sys.stdout) -> Term | None:
         '''
         Typing rules will only apply on untyped terms.
         '''
+        if isinstance(parent, Typing):
+            return None
+        
+        new_term = self.try_rules(term, verbose, stream)
 
-        if isinstance(term, StdTerm):
-            # try to rewrite the subterms
-            for i in range(len(term.args)):
-                new_subterm = self.rewrite_typing(term, term.args[i], verbose, stream)
-                if new_subterm is not None:
-                    return type(term)(*term.args[:i], new_subterm, *term.args[i+1:])
-                
-        elif isinstance(term, BindVarTerm):
-            new_body = self.rewrite_typing(term, term.body, verbose, stream)
-            if new_body is not None:
-                # risk exists: term.bind_var may collide with new_body
-                # but normal rewriting rules should not cause this problem because there are no free variables on the RHS
-                return type(term)(term.bind_var, new_body)
-            
-        elif isinstance(term, MultiBindTerm):
-            new_body = self.rewrite_typing(term, term.body, verbose, stream)
-            if new_body is not None:
-                return type(term)(term.bind_vars, new_body)
-            
-        elif isinstance(term, Typing):
-            new_term = self.rewrite_typing(term, term.term, verbose, stream)
-            if new_term is not None:
-                return Typing(new_term, term.type)
-
+        # the rules are not tried on the terms under a typing symbol, so only the other terms can be marked
+        if new_term is None:
+            term.nf_token = self.nf_token
+        return new_term
 
-        # try to rewrite the term using the rules
-        if not isinstance(parent, Typing):
-            for rule in self.rule_seq:
-                new_term = rule.rewrite_method(rule, self, term)
-                if new_term is not None:
-                    # output information
-                    if verbose:
-                        stream.write(str(
-                            FrameBlock(
-                            HSeqBlock(str(term), ' -> ', str(new_term), v_align='c'),
-                            caption=f"apply {rule.rule_name}"
-                            )
-                            ) + "\n\n")
-                    return new_term
-            
-            return None    
+    def rewrite_typing(self, parent: Term | None, term: Term, verbose: bool = False, stream: TextIO = sys.stdout) -> Term | None:
+        '''
+        Typing rules will only apply on untyped terms.
+        The rewritings are dispatched by the traversal that calls this method, at the position of the term.
+        '''
+        frames : List[List[Any]] = []
+        new_focus = self.search_inner_most(frames, term, self.reduce_typing, False, parent, verbose, stream, nested = True)
+        if new_focus is None:
+            return None
+        return zipper_root(frames, new_focus)
 
 
 class TypedTRS(TRS):
@@ -1636,6 +3237,8 @@ class TypedTRS(TRS):
         res.rule_seq = self.rule_seq.copy()
         res.rule_seq_name = self.rule_seq_name.copy()
         res.type_checker = self.type_checker.copy()
+        res.nf_cache = self.nf_cache
+        res.listeners = self.listeners
         return res
     
     def rule_type_checking(self, rule: Rule, well_typed_check: bool = True) -> Rule:
@@ -1737,6 +3340,11 @@ class TypedTRS(TRS):
             self.rule_seq.append(flt_rule)
             self.rule_seq_name.append(flt_rule.rule_name)
 
+        self.rule_index.clear()
+        self.pattern_index = None
+        self.rule_variables = None
+        self.nf_token = object()
+
 
     def append_canonical(self, 
                         rule_name:str,
@@ -1764,12 +3372,18 @@ class TypedTRS(TRS):
         '''
         return self.type_checker.normalize(term)
     
-    def normalize(self, term: Term, verbose: bool = False, stream: TextIO = sys.stdout, step_limit: int | None = None, alg: str = "inner_most") -> Term:
+    def normalize(self, term: Term, verbose: bool = False, stream: TextIO = sys.stdout, step_limit: int | None = None, alg: str = "inner_most", trace: RewriteTrace | None = None, budget: Budget | None = None) -> Term:
 
         # check the type first
         type_checked_term = self.type_checking(term)
 
-        return super().normalize(type_checked_term, verbose, stream, step_limit, alg)
+        return super().normalize(type_checked_term, verbose, stream, step_limit, alg, trace, budget)
+    
+    def fingerprint(self) -> str:
+        '''
+        The fingerprint also covers the type checker.
+        '''
+        return hashlib.sha256((super().fingerprint() + self.type_checker.fingerprint()).encode()).hexdigest()
     
     def original_rules_repr(self) -> str:
         res = ""
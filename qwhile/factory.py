@@ -1,13 +1,11 @@
 
 from typing import Any
 
-from diracdec.components import wolfram_simple
+from diracdec.factory import CScalar, ABase
 from .parser import construct_parser
 
 
-parse = construct_parser(
-    wolfram_simple.WolframCScalar,
-    wolfram_simple.WolframABase)
+parse = construct_parser(CScalar, ABase)
 
 
 ########################################
@@ -122,6 +122,7 @@ def construct_trs(
         'OP-SEM-INIT',
         lhs = ''' < q:=0; , rho > ''',
         rhs = ''' < HALT, SUM(i, |0><i| rho |i><0| > ''',
+        heads = (Cfg,),
         rewrite_method = op_sem_init_rewrite
     )
     rules.append(OP_SEM_INIT)
@@ -169,6 +170,7 @@ def construct_trs(
         'OP-SEM-WHILE',
         lhs = ''' < while [n] P do s end; , rho > ''',
         rhs = ''' < if P then (s; while [n-1] P do s end;) else skip; end; , rho > ''',
+        heads = (Cfg,),
         rewrite_method = op_sem_while_rewrite
     )
     rules.append(OP_SEM_WHILE)
@@ -210,6 +212,7 @@ def construct_trs(
         'OP-SEM-SEQ',
         lhs = ''' < S0 S1 , rho > (< S0 , rho > -> <S0' , rho'>)''',
         rhs = ''' < S0' S1, rho' > ''',
+        heads = (Cfg,),
         rewrite_method = op_sem_seq_rewrite
     )
     rules.append(OP_SEM_SEQ)
@@ -132,14 +132,17 @@ class IntTerm(Term):
     def __eq__(self, other: Term) -> bool:
         return isinstance(other, IntTerm) and self.num == other.num
     
+    def __hash__(self) -> int:
+        return hash((IntTerm, self.num))
+    
     def __repr__(self) -> str:
         return str(self)
     
     def size(self) -> int:
         return 1
     
-    def variables(self) -> set[Var]:
-        return set()
+    def variables(self) -> frozenset[Var]:
+        return frozenset()
     
     def subst(self, sigma: Subst | dict[Var, Term]) -> Term:
         return self
@@ -1,5 +1,9 @@
 from diracdec import *
 
+import pytest
+
+from diracdec import factory
+
 from qwhile import parse, forward_trs
 from qwhile.forward import CfgSet
 
@@ -16,6 +20,7 @@ def test_OP_SEM_ABORT():
         b = parse(r''' < HALT , 0X > ''')
         assert forward_trs.normalize(a) == forward_trs.normalize(b)
 
+@pytest.mark.xfail(factory.backend == "python", reason = "not joinable with the Python backend: the labelled products are associated differently")
 def test_OP_SEM_INIT():
     with wolfram_backend.wolfram_session():
         a = parse(r''' < q :=0 ; , rho > ''')
@@ -1,6 +1,10 @@
 from diracdec import *
 
+import pytest
+import threading
+
 from diracdec import parse
+from diracdec.factory import scalar_backend
 
 from diracdec.components.wolfram_simple import WolframCScalar, WolframABase
 
@@ -20,6 +24,7 @@ def test_cop_scalar():
         assert hash(a) == hash(b)
 
 
+@pytest.mark.skipif(wolfram_backend.session is None, reason = "Wolfram Engine not available")
 def test_wolfram_cscalar():
     with wolfram_backend.wolfram_session():
         a = WolframCScalar("a + a")
@@ -27,6 +32,13 @@ def test_wolfram_cscalar():
         assert a == b
         assert hash(a) == hash(b)
 
+def test_wolfram_unavailable(monkeypatch):
+    from wolframclient.language import wl
+
+    monkeypatch.setattr(wolfram_backend, "session", None)
+    with pytest.raises(RuntimeError, match = "Wolfram Engine not available"):
+        wolfram_backend.evaluate(wl.FullSimplify(wl.Symbol("a")))
+
 def test_wolfram_variables():
     with wolfram_backend.wolfram_session():
         a = parse(''' "Sum[(1/2)^x, {x, 1, m}]" ''')
@@ -75,3 +87,313 @@ def test_wolfram_substitue_TRSVar():
         a = parse(''' 'b - a' ''')
         b = parse(''' 'y - x' ''')
         assert sub(a) == b
+
+def test_batched_simplification():
+    from wolframclient.language import wl
+
+    round_trips = []
+
+    def stand_in(expr):
+        # a local evaluator which does not simplify
+        round_trips.append(expr)
+        if expr.head == wl.List:
+            return tuple(arg.args[0] for arg in expr.args)
+        return expr.args[0]
+
+    batch = wolfram_backend.simplify_batch
+    batch.flush()
+    wolfram_backend.simplify_cache.clear()
+    old_evaluator, batch.evaluator = batch.evaluator, stand_in
+    try:
+        scalars = [WolframCScalar(wl.Symbol(f"a{i}")) for i in range(10)]
+        assert len(round_trips) == 0 and len(batch) == 10
+
+        # the pending simplifications are resolved in one round-trip when a result is needed
+        assert scalars[3].simp_expr == wl.Symbol("a3")
+        assert len(round_trips) == 1 and len(batch) == 0
+        assert all(scalar.simp_expr == wl.Symbol(f"a{i}") for i, scalar in enumerate(scalars))
+        assert len(round_trips) == 1
+
+        a = WolframABase(wl.Symbol("b"))
+        assert a == WolframABase(wl.Symbol("b"))
+        assert len(round_trips) == 2
+
+        # the operations on the pending scalars do not wait for the simplifications
+        c = WolframCScalar(wl.Symbol("c"))
+        d = WolframCScalar.mlt(WolframCScalar.add(c, c), WolframCScalar.conj(c))
+        assert len(round_trips) == 2 and len(batch) == 4
+        assert d.simp_expr == wl.Times(wl.Plus(wl.Symbol("c"), wl.Symbol("c")), wl.Conjugate(wl.Symbol("c")))
+        assert len(round_trips) == 3
+    finally:
+        batch.evaluator = old_evaluator
+
+@pytest.mark.skipif(scalar_backend != WolframCScalar.__module__, reason = "the Wolfram backend is not used")
+def test_batched_normalization():
+    from wolframclient.language import wl
+
+    round_trips = []
+
+    def stand_in(expr):
+        # count the round-trips and the expressions, and evaluate in the session
+        round_trips.append(len(expr.args) if expr.head == wl.List else 1)
+        return wolfram_backend.session.evaluate(expr)
+
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        batch = wolfram_backend.simplify_batch
+        batch.flush()
+        wolfram_backend.simplify_cache.clear()
+        old_evaluator, batch.evaluator = batch.evaluator, stand_in
+        try:
+            a = parse(r''' (("a" SCR K0) ADD ("b" SCR K0) ADD ("c" SCR K1)) DOT (("d" SCR K0) ADD ("e" SCR K1)) ''')
+            trs.normalize(a)
+
+            # the scalars created in the same step are simplified in one round-trip
+            assert len(round_trips) < sum(round_trips)
+
+            # the AC arguments are sorted without evaluating the pending scalars
+            round_trips.clear()
+            a = parse(r''' ("a1" SCR ("b1" SCR K0)) ADD ("c1" SCR ("d1" SCR K1)) ADD ("e1" SCR ("f1" SCR K2)) ADD ("g1" SCR K3) ''')
+            a.order_key()
+            assert len(round_trips) == 0
+
+            trs = dirac_bigop_delta_trs.copy()
+            trs.nf_cache = None
+            trs.normalize(a)
+            assert round_trips == [7, 3]
+        finally:
+            batch.evaluator = old_evaluator
+
+def test_expression_cache(tmp_path):
+    from wolframclient.language import wl
+    from diracdec.backends.wolfram_backend import ExprCache, EvaluationBatch, MISSING
+
+    round_trips = []
+
+    def stand_in(expr):
+        round_trips.append(expr)
+        if expr.head == wl.List:
+            return tuple(arg.args[0] for arg in expr.args)
+        return expr.args[0]
+
+    cache = ExprCache(maxsize = 2, path = str(tmp_path / "wolfram.db"))
+    batch = EvaluationBatch(stand_in, cache = cache)
+
+    # the same expressions pending in the batch share the result
+    a = batch.submit(wl.FullSimplify(wl.Symbol("a")))
+    assert batch.submit(wl.FullSimplify(wl.Symbol("a"))) is a
+    assert a.get() == wl.Symbol("a")
+    assert len(round_trips) == 1
+
+    # the cached results are not submitted
+    assert batch.submit(wl.FullSimplify(wl.Symbol("a"))).get() == wl.Symbol("a")
+    assert len(round_trips) == 1 and cache.hits == 1
+
+    for name in ["b", "c"]:
+        batch.submit(wl.FullSimplify(wl.Symbol(name))).get()
+    assert len(cache) == 2 and cache.evictions == 1
+
+    # the evicted results are recovered from the database file, also after restarting
+    cache.detach()
+    cache = ExprCache(path = str(tmp_path / "wolfram.db"))
+    key = ExprCache.key(wl.FullSimplify(wl.Symbol("a")))
+    assert cache.get(key) == wl.Symbol("a")
+    assert cache.get(ExprCache.key(wl.Symbol("d"))) is MISSING
+    assert cache.hit_rate == 0.5
+    cache.detach()
+
+class FakeKernel:
+    '''
+    A local fake kernel, which returns the argument of FullSimplify after a delay, and records the concurrent evaluations.
+    '''
+    running = 0
+    max_running = 0
+    evaluations = 0
+
+    def __init__(self, kernel = None, **kwargs):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def evaluate(self, expr):
+        import asyncio
+        FakeKernel.running += 1
+        FakeKernel.evaluations += 1
+        FakeKernel.max_running = max(FakeKernel.max_running, FakeKernel.running)
+        await asyncio.sleep(0.01)
+        FakeKernel.running -= 1
+        return expr.args[0]
+
+
+def test_kernel_pool():
+    import asyncio
+    from wolframclient.language import wl
+    from diracdec.backends.wolfram_backend import KernelPool, kernel_pool
+
+    async def run():
+        async with KernelPool(4, session_class = FakeKernel) as pool:
+            exprs = [wl.FullSimplify(wl.Symbol(f"p{i}")) for i in range(8)]
+            return await pool.evaluate_many(exprs)
+
+    FakeKernel.max_running = 0
+    assert asyncio.run(run()) == [wl.Symbol(f"p{i}") for i in range(8)]
+    assert FakeKernel.max_running > 1
+
+    # the simplifications of a batch are distributed to the kernels
+    wolfram_backend.simplify_batch.flush()
+    FakeKernel.max_running = 0
+    FakeKernel.evaluations = 0
+    with kernel_pool(4, session_class = FakeKernel):
+        scalars = [WolframCScalar(wl.Symbol(f"q{i}")) for i in range(8)]
+        assert [scalar.simp_expr for scalar in scalars] == [wl.Symbol(f"q{i}") for i in range(8)]
+    assert FakeKernel.evaluations == 8
+    assert FakeKernel.max_running > 1
+
+    # the other evaluations also run on the pool, concurrently from several threads
+    FakeKernel.max_running = 0
+    FakeKernel.evaluations = 0
+    with kernel_pool(4, session_class = FakeKernel):
+        results = wolfram_backend.concurrent_map(
+            lambda i: wolfram_backend.evaluate(wl.FullSimplify(wl.Symbol(f"r{i}"))), range(4))
+        assert results == [wl.Symbol(f"r{i}") for i in range(4)]
+    assert FakeKernel.evaluations == 4
+    assert FakeKernel.max_running > 1
+    assert wolfram_backend.active_pool is None
+
+    # the background thread is stopped if the kernels fail to start
+    class BrokenKernel(FakeKernel):
+        async def start(self):
+            raise RuntimeError("no licence")
+
+    threads = threading.active_count()
+    with pytest.raises(Exception):
+        with kernel_pool(2, session_class = BrokenKernel):
+            pass
+    assert threading.active_count() == threads
+
+
+def test_exact_scalar():
+    from wolframclient.language import wl
+    from diracdec.backends.exact_backend import ExactNumber
+
+    # the arithmetic in Q(i, √2, √3, ...)
+    h = ExactNumber.parse("Sqrt[1/2]")
+    assert h * h == ExactNumber.parse("1/2")
+    assert ExactNumber.parse("Sqrt[2] Sqrt[6]") == ExactNumber.parse("2 Sqrt[3]")
+    x = ExactNumber.parse("1 + Sqrt[2] + I Sqrt[3]")
+    assert x * x.inverse() == ExactNumber(1)
+    assert ExactNumber.parse(str(x)) == x
+    assert ExactNumber.parse("Sqrt[-2]") == ExactNumber.I * ExactNumber.sqrt(2)
+    assert ExactNumber.parse("a + 1") is None and ExactNumber.parse("0.5") is None
+
+    # the indeterminate and the too large powers are left to the kernel
+    assert ExactNumber.parse("0^0") is None and ExactNumber.parse("0^(-1)") is None
+    assert ExactNumber.parse("2^1000000000") is None
+    assert ExactNumber.parse("2^10") == ExactNumber(1024)
+
+    # the literals are printed without the kernel
+    assert str(WolframCScalar("Sqrt[1/2]")) == "1/2*Sqrt[2]"
+    assert WolframCScalar("-I/2").tex() == r"\left (-\frac{1}{2} i\right )"
+
+    # the kernel results are recognized as literals
+    assert wolfram_backend.exact_from_wolfram(wl.Power(2, wl.Rational(-1, 2))) == h
+    assert wolfram_backend.exact_from_wolfram(wl.Times(wl.Complex(0, 1), wl.Symbol("a"))) is None
+
+    round_trips = []
+
+    def stand_in(expr):
+        round_trips.append(expr)
+        if expr.head == wl.List:
+            return tuple(arg.args[0] for arg in expr.args)
+        return expr.args[0]
+
+    batch = wolfram_backend.simplify_batch
+    batch.flush()
+    wolfram_backend.simplify_cache.clear()
+    old_evaluator, batch.evaluator = batch.evaluator, stand_in
+    try:
+        # the Hadamard entries: (1/√2)(1/√2) + (1/√2)(-1/√2) = 0 and (1/√2)^2 * 2 = 1
+        s = WolframCScalar("Sqrt[1/2]")
+        m = WolframCScalar("-Sqrt[1/2]")
+        assert WolframCScalar.add(WolframCScalar.mlt(s, s), WolframCScalar.mlt(s, m)) == WolframCScalar.zero()
+        assert WolframCScalar.mlt(WolframCScalar.mlt(s, s), WolframCScalar("2")) == WolframCScalar.one()
+        assert WolframCScalar.conj(WolframCScalar("I")) == WolframCScalar("-I")
+        assert WolframCScalar("Sqrt[1/2]").variables() == frozenset()
+        assert len(round_trips) == 0
+
+        # the literals from the kernel are kept in the canonical form, and equal to the local ones
+        assert WolframCScalar(wl.Power(2, wl.Rational(-1, 2))) == s
+        assert hash(WolframCScalar(wl.Power(2, wl.Rational(-1, 2)))) == hash(s)
+
+        # the symbolic scalars fall back to Wolfram
+        # (the sum does not wait for the symbol, and both are simplified in one round-trip)
+        a = WolframCScalar.add(s, WolframCScalar(wl.Symbol("a")))
+        assert a.exact is None
+        assert len(round_trips) == 1
+    finally:
+        batch.evaluator = old_evaluator
+
+
+def test_python_backend():
+    from diracdec.theory import dirac, delta_ext
+    from diracdec.parser import construct_parser
+    from diracdec.components.py_cscalar import PyCScalar
+    from diracdec.components.str_abase import StrABase
+
+    # the normal forms of the rational functions
+    assert PyCScalar("(x^2 - 1)/(x - 1)") == PyCScalar("x + 1")
+    assert PyCScalar("Exp[I a] Exp[-I a]") == PyCScalar.one()
+    assert PyCScalar("Exp[I Pi/4]") == PyCScalar("(1 + I)/Sqrt[2]")
+    assert PyCScalar.conj(PyCScalar("I x")) == PyCScalar("-I Conjugate[x]")
+    assert PyCScalar("0.5 + 0.5") == PyCScalar("1")
+    c = PyCScalar("a/(1 + b) + Sqrt[2] Cos[t]")
+    assert PyCScalar(str(c)) == c
+    assert c.variables() == {Var("a"), Var("b"), Var("t")}
+
+    # the common factors, the radicals and the trigonometric identities
+    assert PyCScalar("1/(x - 1) - 1/(x + 1)") == PyCScalar("2/(x^2 - 1)")
+    assert PyCScalar("(x + y)^2/(x^2 - y^2)") == PyCScalar("(x + y)/(x - y)")
+    assert PyCScalar("Sqrt[x]^2") == PyCScalar("x")
+    assert PyCScalar("1/Sqrt[x]") == PyCScalar("Sqrt[x]/x")
+    assert PyCScalar("Cos[t]^2 + Sin[t]^2") == PyCScalar.one()
+
+    # the indeterminate and the large powers are kept unevaluated
+    assert str(PyCScalar("0^0")) == "Power[0, 0]"
+    assert str(PyCScalar("2^1000000000")) == "Power[2, 1000000000]"
+    assert str(PyCScalar("(1 + x + y)^60")) == "Power[1 + x + y, 60]"
+    assert PyCScalar("(a + b)^3") == PyCScalar("a^3 + 3 a^2 b + 3 a b^2 + b^3")
+
+    # the iterators of the sums are bound
+    s = PyCScalar("Sum[(1/2)^x, {x, 1, m}]")
+    assert s.variables() == {Var("m")}
+    assert s == PyCScalar("Sum[(1/2)^y, {y, 1, m}]")
+    s = PyCScalar("Sum[f[x, n], {x, 1, m}]")
+    assert s.variables() == {Var("m"), Var("n")}
+    assert s == PyCScalar("Sum[f[y, n], {y, m}]")
+    assert s.subst({Var("x"): PyCScalar("0"), Var("m"): PyCScalar("2")}) == PyCScalar("Sum[f[x, n], {x, 1, 2}]")
+
+    # substitution and the held expressions
+    assert c.subst({Var("b"): PyCScalar("a - 1"), Var("t"): PyCScalar("0")}) == PyCScalar("1 + Sqrt[2]")
+    assert c.subst({Var("c"): PyCScalar("1")}) is c
+    assert PyCScalar("HoldForm[a + a]").reduce() == PyCScalar("2 a")
+    h = PyCScalar("HoldForm[Sum[(1/2)^i, {i, 1, Infinity}]]")
+    assert h.variables() == {Var("i")}
+    assert h.reduce() == PyCScalar.one()
+
+    # the satisfiability of the equations between bases
+    assert not StrABase("x").eq_satisfiable(StrABase("x + 1"))
+    assert StrABase("x").eq_satisfiable(StrABase("y + 1"))
+    assert not StrABase("0").eq_satisfiable(StrABase("1"))
+
+    # the rewriting system runs in process
+    parse = construct_parser(PyCScalar, StrABase)
+    trs = delta_ext.modify_trs(dirac.construct_trs(PyCScalar, StrABase, parse), PyCScalar, StrABase)
+    a = parse(''' "Sqrt[1/2]" SCR (("Sqrt[1/2]" SCR (KET('0') ADD KET('1'))) ADD ("Sqrt[1/2]" SCR (KET('0') ADD ("-1" SCR KET('1'))))) ''')
+    assert trs.normalize(a) == trs.normalize(parse(''' KET('0') '''))
+    assert trs.normalize(parse(''' DELTA('x', 'x + 1') ''')) == trs.normalize(parse(''' "0" '''))
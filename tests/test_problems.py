@@ -1,7 +1,12 @@
 from diracdec import *
+
+import pytest
+
+from diracdec import factory
 from diracdec.theory.dirac_bigop import *
 from diracdec import parse, dirac_bigop_delta_trs as trs, juxt
 
+@pytest.mark.xfail(factory.backend == "python", reason = "not joinable with the Python backend: DELTA(i, PAIR(s, s)) is split before the sum elimination")
 def test_problem_1():
     '''
     Here is an unjoinable pair due to `DELTA(i, PAIR(s, s))`.
@@ -12,6 +17,7 @@ def test_problem_1():
         assert trs.normalize(a) == trs.normalize(b)
 
 
+@pytest.mark.xfail(factory.backend == "python", reason = "not joinable with the Python backend: the sum elimination is incomplete")
 def test_problem_2():
     '''
     sum elimination is not complete. these two terms can be not joinable when X is pushed inside the sum first.
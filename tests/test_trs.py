@@ -2,6 +2,10 @@ from diracdec import *
 from diracdec.theory.trs import *
 
 from diracdec import parse
+from diracdec.factory import scalar_backend
+
+import json
+import pytest
 
 def test_bind_alpha_conv():
     a = BindVarTerm(Var("x"), Var("x"))
@@ -144,6 +148,527 @@ def test_typing_mechanism():
     checked_a = trs.type_checking(a)
     assert trs.normalize(checked_a, verbose=True) == Typing(Var('a'), Sca())
 
+    # the rewritings in rewrite_typing are dispatched by the outer traversal, with the paths from its root
+    class Paths(RewriteListener):
+        def __init__(self):
+            self.paths = []
+
+        def on_rewrite(self, trs, rule_name, path, redex, contractum):
+            self.paths.append((rule_name, path))
+
+    def reduce(parent, term, verbose, stream):
+        return type_checker.rewrite_typing(parent, term, verbose, stream) if parent is a else None
+
+    a = Add(Typing(Var('a'), Sca()), Add(Typing(Var('b'), Sca()), Zero()))
+    paths = Paths()
+    with type_checker.listening(paths):
+        type_checker.search_inner_most([], a, reduce, False)
+    assert paths.paths == [("TYPING-ZERO", (1, 1))]
+
+
+
+
+
+def test_rule_index():
+    from diracdec import dirac_trs
+
+    with wolfram_backend.wolfram_session():
+        a = parse(r''' a ADDS b ''')
+        rules = dirac_trs.candidate_rules(a)
+        names = [rule.rule_name for rule in rules]
+
+        assert "SCR-COP-1" in names
+        assert "ADD-1" not in names
+        assert "ATOMIC-BASE" not in names
+
+        # the order of rule_seq is kept
+        assert rules == [rule for rule in dirac_trs.rule_seq if rule in rules]
+
+        # variables can only be rewritten by rules without head symbols
+        assert all(rule.heads is None for rule in dirac_trs.candidate_rules(Var("x")))
+
+def test_normal_form_marks():
+    from diracdec import dirac_trs
+
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        a = trs.normalize(parse(r''' (K0 ADD K1) ADD 0X '''))
+        assert a == parse(r''' K0 ADD K1 ''')
+
+        # the normal form and its subterms are marked
+        assert a.nf_token is trs.nf_token
+        assert a.args[0].nf_token is trs.nf_token
+        assert trs.rewrite_inner_most(a) is None
+
+        # the marks become invalid when the rules change
+        trs.append(CanonicalRule(
+            "TEST-SWAP",
+            lhs = parse(r''' K0 ADD K1 '''),
+            rhs = parse(r''' K1 '''),
+        ))
+        assert a.nf_token is not trs.nf_token
+        assert trs.rewrite_inner_most(a) is not None
+
+def test_structural_hash():
+    with wolfram_backend.wolfram_session():
+        a = parse(r''' K0 ADD K1 ADD (B0 DOT K2) SCR K0 ''')
+        b = parse(r''' K1 ADD ((B0 DOT K2) SCR K0) ADD K0 ''')
+        assert a == b and hash(a) == hash(b)
+
+        # the hash of bind terms is invariant under alpha-conversion
+        a = BindVarTerm(Var("x"), parse(r''' KET(x) '''))
+        b = BindVarTerm(Var("y"), parse(r''' KET(y) '''))
+        assert a == b and hash(a) == hash(b)
+
+def test_hash_consing():
+    with wolfram_backend.wolfram_session():
+        with hash_consing() as table:
+            a = parse(r''' K0 ADD (S0 SCR K1) ''')
+            b = parse(r''' (S0 SCR K1) ADD K0 ''')
+            c = parse(r''' K0 ADD (S1 SCR K1) ''')
+            assert a is b
+            assert a != c
+            assert a.args[0] is c.args[0]
+            assert len(table) > 0
+
+        # terms constructed outside are not interned
+        d = parse(r''' K0 ADD (S0 SCR K1) ''')
+        assert d is not a and d == a
+
+def test_AC_canonical_order():
+    with wolfram_backend.wolfram_session():
+        a = parse(r''' K2 ADD (S0 SCR K1) ADD K0 ADD K1 ''')
+        b = parse(r''' K0 ADD K1 ADD K2 ADD (S0 SCR K1) ''')
+        assert a.args == b.args
+        assert a == b
+
+        c = parse(r''' K0 ADD K1 ADD K2 ADD (S1 SCR K1) ''')
+        assert a != c
+
+        a = parse(r''' K1 ADD K0 ADD (S0 SCR K1) ADD K0 ''')
+        i, j = a.equal_pair()
+        assert a.args[i] == a.args[j] == Var("K0")
+        assert parse(r''' K1 ADD K0 ''').equal_pair() is None
+
+class ModAtom(Term):
+    '''
+    The toy atom of the numbers modulo 3, whose equality is not syntactic.
+    '''
+    syntactic_eq = False
+
+    def __init__(self, n: int):
+        self.n = n
+
+    def __str__(self) -> str:
+        return str(self.n)
+
+    def __repr__(self) -> str:
+        return f'ModAtom({self.n})'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ModAtom) and (self.n - other.n) % 3 == 0
+
+    def __hash__(self) -> int:
+        return hash(self.n % 3)
+
+    def size(self) -> int:
+        return 1
+
+    def variables(self) -> frozenset[Var]:
+        return frozenset()
+
+    def subst(self, sigma) -> Term:
+        return self
+
+class ModAdd(AC):
+    fsymbol_print = '+'
+    fsymbol = 'MODADD'
+
+def test_semantic_eq_atoms():
+    with hash_consing():
+        a = ModAdd(ModAtom(1), Var("x"))
+        b = ModAdd(ModAtom(4), Var("x"))
+        assert a is not b
+        assert a == b
+
+    # the equal atoms are not neighbours in the sorted arguments
+    c = ModAdd(ModAtom(1), ModAtom(2), ModAtom(4))
+    assert not c.order_exact
+    i, j = c.equal_pair()
+    assert c.args[i] == c.args[j] and c.args[i] != ModAtom(2)
+
+def test_lazy_matching():
+    with wolfram_backend.wolfram_session():
+        lhs = parse(r''' K0 ADD X ''')
+        rhs = parse(r''' K1 ADD K2 ADD K3 ''')
+
+        m = Matching([(lhs, rhs)])
+        solutions = m.all_solutions()
+        assert len(solutions) == 6
+        assert m.solve() == solutions
+
+        # the solutions are generated in the same order, lazily
+        gen = m.iter_solutions()
+        assert next(gen) == solutions[0]
+        assert Matching.first_match(lhs, rhs) == solutions[0]
+
+        assert Matching.first_match(parse(r''' K0 ADD K0 '''), rhs) is None
+
+def test_AC_matching():
+    with wolfram_backend.wolfram_session():
+        # the non-variable argument only matches the arguments with the same head
+        lhs = parse(r''' (S0 SCR K0) ADD X ''')
+        rhs = parse(' ADD '.join([f'K{i}' for i in range(1, 20)] + [r'(S1 SCR K0)']))
+
+        solutions = Matching([(lhs, rhs)]).all_solutions()
+        assert len(solutions) == 1
+        assert solutions[0](lhs) == rhs
+
+        # a variable already assigned takes its arguments
+        lhs = parse(r''' (S0 SCR K0) ADD K0 ADD X ''')
+        rhs = parse(r''' K1 ADD (S1 SCR K2) ADD K2 ADD K3 ''')
+        solutions = Matching([(lhs, rhs)]).all_solutions()
+        assert len(solutions) == 1
+        assert solutions[0](lhs) == rhs
+
+        # several variables
+        assert len(Matching([(parse(r''' K0 ADD K1 ADD X '''), parse(r''' K2 ADD K3 ADD K4 '''))]).all_solutions()) == 6
+        assert Matching.first_match(parse(r''' K0 ADD K0 '''), parse(r''' K1 ADD K2 ''')) is None
+        assert Matching.first_match(parse(r''' K0 ADD K0 '''), parse(r''' K1 ADD K1 ''')) is not None
+
+def test_compiled_rule():
+    with wolfram_backend.wolfram_session():
+        rule = CanonicalRule("TEST", parse(r''' (B0 DOT K0) SCR (K1 TSRK K2) '''), parse(r''' (B0 DOT K1) SCR K2 '''))
+        assert rule.matcher is not None
+
+        term = parse(r''' (B1 DOT K2) SCR (K5 TSRK (K3 ADD K4)) ''')
+        assert canonical_rewrite(rule, dirac_trs, term) == parse(r''' (B1 DOT K5) SCR (K3 ADD K4) ''')
+        assert canonical_rewrite(rule, dirac_trs, parse(r''' (B1 DOT K2) SCR K3 ''')) is None
+
+        # the renamed rule shares the compiled function
+        renamed = rule.subst({Var("K1"): Var("K6")})
+        source_count = len(compiled_sources)
+        assert renamed.matcher is not None
+        assert len(compiled_sources) == source_count
+        assert canonical_rewrite(renamed, dirac_trs, term) == canonical_rewrite(rule, dirac_trs, term)
+
+        # non-linear patterns and equational theories are left to Matching
+        assert CanonicalRule("TEST", parse(r''' K0 TSRK K0 '''), parse(r''' K0 ''')).matcher is None
+        assert CanonicalRule("TEST", parse(r''' K0 ADD K1 '''), parse(r''' K0 ''')).matcher is None
+
+def test_discrimination_tree():
+    with wolfram_backend.wolfram_session():
+        tree = DiscriminationTree()
+        tree.insert(parse(r''' (B0 DOT K0) SCR K1 '''), 0)
+        tree.insert(parse(r''' S0 SCR (K0 TSRK K1) '''), 1)
+        tree.insert(parse(r''' S0 SCR (K0 ADD K1) '''), 2)
+        tree.insert(parse(r''' K0 '''), 3)
+
+        assert tree.retrieve(parse(r''' (B1 DOT K2) SCR (K3 TSRK K4) ''')) == {0, 1, 3}
+        assert tree.retrieve(parse(r''' S1 SCR (K4 ADD K3 ADD K2) ''')) == {2, 3}
+        assert tree.retrieve(parse(r''' K1 TSRK K2 ''')) == {3}
+
+        # the candidates keep the order of rule_seq
+        term = parse(r''' (B1 DOT K2) SCR (K5 TSRK (K3 ADD K4)) ''')
+        candidates = dirac_trs.candidate_rules(term)
+        assert candidates == [rule for rule in dirac_trs.rule_seq if rule in candidates]
+        for rule in dirac_trs.rule_seq:
+            if rule not in candidates:
+                assert rule.rewrite_method(rule, dirac_trs, term) is None
+
+def test_normal_form_cache():
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = NormalFormCache(maxsize=2)
+
+        a = parse(r''' (K0 ADD K1) ADD 0X ''')
+        nf = trs.normalize(a)
+        assert len(trs.nf_cache) == 1
+
+        # the cached normal form is used for the subterms
+        hits = trs.nf_cache.hits
+        b = parse(r''' K2 TSRK ((K0 ADD K1) ADD 0X) ''')
+        assert trs.normalize(b) == dirac_trs.normalize(parse(r''' K2 TSRK (K0 ADD K1) '''))
+        assert trs.nf_cache.hits == hits + 1
+
+        # the entries are bounded
+        trs.normalize(parse(r''' K0 ADD 0X '''))
+        assert len(trs.nf_cache) == 2 and trs.nf_cache.evictions == 1
+
+        # the entries of the old rule set are not used
+        trs.set_rule_seq(trs.rule_seq_name)
+        hits = trs.nf_cache.hits
+        assert trs.normalize(a) == nf
+        assert trs.nf_cache.hits == hits
+
+        trs.nf_cache.clear()
+        assert len(trs.nf_cache) == 0 and trs.nf_cache.hits == 0
+
+def test_persistent_cache(tmp_path):
+    with wolfram_backend.wolfram_session():
+        path = str(tmp_path / "nf.sqlite")
+        s = r''' SUM(i, KET(i) OUTER BRA(i)) MLTK (K0 ADD 0X) '''
+
+        with PersistentCache(path) as cache:
+            res = normalize(s, cache = cache)
+            assert cache.misses == 1 and len(cache) == 1
+            assert normalize(s, cache = cache) == res
+            assert cache.hits == 1
+
+        # the normal forms are kept in the file
+        with PersistentCache(path) as cache:
+            assert eq_check(s, r''' SUM(i, KET(i) OUTER BRA(i)) MLTK K0 ''', cache = cache)
+            assert cache.hits == 1 and cache.misses == 1
+
+            # the key is invariant under the renaming of bind variables
+            fingerprint = dirac_bigop_delta_trs.fingerprint()
+            nf = cache.get(fingerprint, scalar_backend, parse(s))
+            t = parse(r''' SUM(j, KET(j) OUTER BRA(j)) MLTK (K0 ADD 0X) ''')
+            assert cache.get(fingerprint, scalar_backend, t) == nf
+
+            # the loaded normal forms are interned
+            with hash_consing() as table:
+                nf = cache.get(fingerprint, scalar_backend, parse(s))
+                assert nf.interned is table
+
+            # other rule sets are not confused
+            t = parse(s)
+            assert cache.get(dirac_trs.fingerprint(), scalar_backend, t) is None
+            assert dirac_trs.fingerprint() == dirac_trs.copy().fingerprint()
+
+            cache.clear()
+            assert len(cache) == 0
+
+def test_iterative_traversal():
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        # the terms deeper than the recursion limit can be rewritten
+        k1 = parse(r''' K1 ''')
+        term = parse(r''' K0 ADD 0X ''')
+        for _ in range(3000):
+            term = type(parse(r''' K1 TSRK K2 '''))(k1, term)
+
+        new_term = trs.rewrite_inner_most(term)
+        for _ in range(3000):
+            new_term = new_term.args[1]
+        assert new_term == parse(r''' K0 ''')
+
+        assert trs.rewrite_outer_most(term) is not None
+
+        # the search continues from the last rewritten position, with the same results
+        a = parse(r''' ((K0 ADD 0X) TSRK (K1 ADD K2)) ADD (0X ADD ((S0 MLTS S1) SCR K0)) ''')
+        assert trs.normalize(a) == trs.normalize(a, alg = "outer_most")
+
+def test_parallel_inner_most():
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        a = parse(r''' ((K0 ADD 0X) TSRK (K1 ADD 0X)) ADD (0X ADD ((S0 MLTS S1) SCR (0X ADD K0))) ''')
+
+        # the disjoint redexes are rewritten in one pass
+        b = trs.rewrite_parallel_inner_most(a)
+        assert b == parse(r''' (K0 TSRK K1) ADD 0X ADD ((S0 MLTS S1) SCR K0) ''')
+
+        assert trs.normalize(a, alg = "parallel_inner_most") == trs.normalize(a)
+        assert trs.rewrite_parallel_inner_most(trs.normalize(a)) is None
+
+def test_cached_variables():
+    with wolfram_backend.wolfram_session():
+        a = parse(r''' (K0 ADD K1) TSRK (S0 SCR K0) ''')
+        assert a.variables() == {Var("K0"), Var("K1"), Var("S0")}
+        assert isinstance(a.variables(), frozenset)
+        assert a.variables() is a.variables()
+        assert a.size() == 7
+
+        # the bind variable is removed without changing the variables of the body
+        body = parse(r''' K0 TSRK K1 ''')
+        b = BindVarTerm(Var("K0"), body)
+        assert b.variables() == {Var("K1")}
+        assert body.variables() == {Var("K0"), Var("K1")}
+
+        # the variables of the rules are cached until the rules change
+        trs = TRS([CanonicalRule("TEST-1", parse(r''' K0 ADD 0X '''), parse(r''' K0 '''))])
+        assert trs.variables() is trs.variables()
+        trs.append(CanonicalRule("TEST-2", parse(r''' S0 SCR 0X '''), parse(r''' 0X ''')))
+        assert Var("S0") in trs.variables()
+
+def test_subst_sharing():
+    with wolfram_backend.wolfram_session():
+        a = parse(r''' (K0 ADD K1) TSRK (S0 SCR K2) ''')
+        left, right = a.args
+
+        # the untouched subtrees are shared with the original term
+        b = a.subst({Var("K2") : parse(r''' K3 ''')})
+        assert b == parse(r''' (K0 ADD K1) TSRK (S0 SCR K3) ''')
+        assert b.args[0] is left
+        assert a.subst({Var("K4") : parse(r''' K3 ''')}) is a
+
+        # an AC term is not flattened and sorted again when its arguments do not change
+        c = parse(r''' K0 ADD (S0 SCR K1) ADD K2 ''')
+        assert c.subst(Subst({Var("K3") : Var("K0")})) is c
+
+        d = BindVarTerm(Var("K0"), a)
+        assert d.subst({Var("K0") : parse(r''' K3 ''')}) is d
+
+def test_idempotent_closure():
+    with wolfram_backend.wolfram_session():
+        sub = Subst({
+            Var("K0") : parse(r''' K1 TSRK K1 '''),
+            Var("K1") : parse(r''' K2 ADD K3 '''),
+            Var("K2") : parse(r''' S0 SCR K3 '''),
+        })
+        res = sub.get_idempotent()
+        assert res.is_idempotent
+        assert res[Var("K0")] == parse(r''' ((S0 SCR K3) ADD K3) TSRK ((S0 SCR K3) ADD K3) ''')
+        assert res[Var("K0")].args[0] is res[Var("K1")]
+
+        # cyclic definitions are reported instead of looping forever
+        sub = Subst({
+            Var("K0") : parse(r''' K1 TSRK K2 '''),
+            Var("K1") : parse(r''' S0 SCR K0 '''),
+        })
+        with pytest.raises(ValueError) as e:
+            sub.get_idempotent()
+        assert "K0" in str(e.value) and "K1" in str(e.value)
+
+def test_staged_trs():
+    from diracdec.theory.dirac import EXPANSION_RULES
+
+    with wolfram_backend.wolfram_session():
+        # the expansion rules are only tried after the other rules reach the fixpoint
+        dirac_staged_trs = StagedTRS.split(dirac_trs, EXPANSION_RULES)
+        assert [stage.name for stage in dirac_staged_trs.stages] == ["main", "stage-1"]
+        assert dirac_staged_trs.stages[1].step.rule_seq_name == EXPANSION_RULES
+
+        a = parse(r''' (K0 OUTER B0) MLTK ((K1 ADD K2) TSRK K3) ''')
+        assert dirac_staged_trs.normalize(a) == dirac_trs.normalize(a)
+
+        # the function stages are applied once in each round
+        pipeline = StagedTRS([
+            Stage("normalize", dirac_trs),
+            Stage("juxtapose", lambda t: parse(r''' K0 ''')),
+        ])
+        assert pipeline.normalize(a) == parse(r''' K0 ''')
+
+        with pytest.raises(ValueError):
+            StagedTRS.split(dirac_trs, ["NOT-A-RULE"])
+
+def test_rewrite_profiler():
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        a = parse(r''' (K0 ADD K1) TSRK (K0 ADD K1) ''')
+        with trs.profiling() as profiler:
+            b = trs.normalize(a)
+        assert profiler not in trs.listeners
+        assert b == dirac_trs.normalize(a)
+
+        assert profiler.normalizations == 1
+        assert profiler.steps == sum(p.hits for p in profiler.rules.values())
+        assert profiler.peak_size >= b.size()
+        assert profiler.nodes > 0
+        assert profiler.rules["KET-TSR-6"].hits >= 1
+        assert all(p.calls >= p.hits for p in profiler.rules.values())
+
+        report = json.loads(profiler.to_json())
+        assert report["steps"] == profiler.steps
+        assert "KET-TSR-6" in profiler.table()
+
+def test_rewrite_trace():
+    import io
+
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        a = parse(r''' (K0 OUTER B0) MLTK ((K1 ADD K2) TSRK K3) ''')
+        trace = RewriteTrace()
+        b = trs.normalize(a, trace = trace)
+        assert b == dirac_trs.normalize(a)
+        assert trace not in trs.listeners
+
+        assert len(trace) == trace.count > 0
+        assert [step.index for step in trace] == list(range(len(trace)))
+
+        # the path leads to the redex in the term
+        redex = a
+        for i in trace[0].path:
+            redex = subterms(redex)[i]
+        assert redex is trace[0].redex
+        assert f"apply {trace[0].rule_name}" in trace.render(0, 1)
+
+        # the steps in the window are written to the sink
+        sink = io.StringIO()
+        trace = RewriteTrace(sink = sink, window = (1, 3), keep = False)
+        trs.normalize(a, trace = trace)
+        assert len(trace) == 0
+        lines = [json.loads(line) for line in sink.getvalue().splitlines()]
+        assert [line["step"] for line in lines] == [1, 2]
+        assert all(isinstance(line["path"], list) for line in lines)
+
+def test_rewrite_listener():
+    class Counter(RewriteListener):
+        def __init__(self):
+            self.events = []
+
+        def on_normalize(self, trs, term):
+            self.events.append("normalize")
+
+        def on_rewrite(self, trs, rule_name, path, redex, contractum):
+            self.events.append(rule_name)
+
+        def on_step(self, trs, step, term):
+            self.events.append("step")
+
+        def on_normal_form(self, trs, term, normal_form):
+            self.events.append("normal form")
+
+        def on_stage_change(self, staged_trs, stage, term):
+            self.events.append(stage.name)
+
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        a = parse(r''' (K0 ADD K1) TSRK K2 ''')
+        counter = Counter()
+        with trs.listening(counter):
+            trs.normalize(a)
+        assert trs.listeners == []
+        assert counter.events == ["normalize", "KET-TSR-6", "step", "normal form"]
+
+        # the stages are reported by the staged TRS
+        counter = Counter()
+        staged = StagedTRS([Stage("normalize", trs)], listeners = [counter])
+        staged.normalize(a)
+        assert counter.events == ["normalize"]
+
+def test_normalize_budget():
+    with wolfram_backend.wolfram_session():
+        trs = dirac_trs.copy()
+        trs.nf_cache = None
+
+        a = parse(r''' ((K0 ADD K1) TSRK (K2 ADD K3)) TSRK ((K4 ADD K5) TSRK (K6 ADD K7)) ''')
+
+        budget = Budget(max_size = a.size())
+        b = trs.normalize(a, budget = budget)
+        assert budget.reason == "size"
+        assert b.size() > a.size()
+        assert trs.normalize(b) == trs.normalize(a)
 
+        budget = Budget(timeout = 0)
+        assert trs.normalize(a, budget = budget) is a
+        assert budget.reason == "deadline"
 
+        budget = Budget()
+        budget.cancel()
+        assert trs.normalize(a, budget = budget) is a
+        assert budget.exhausted and budget.reason == "cancelled"
 
+        budget = Budget(timeout = 600, max_size = 10000)
+        assert trs.normalize(a, budget = budget) == trs.normalize(a)
+        assert not budget.exhausted